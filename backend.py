@@ -1,17 +1,46 @@
 # backend.py - کامل با کیف پول، آزمون، پرداخت و سیستم آموزشی جدید
-from fastapi import FastAPI, HTTPException, Depends, status
+from startup import startup, ReadinessMiddleware
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 from typing import Optional, List
 import sqlite3
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from contextlib import asynccontextmanager
 import logging
-from jose import JWTError, jwt
-from passlib.context import CryptContext
 import json
+import asyncio
+startup.mark("import: framework")
+from db_pool import pool, get_db, get_db_path, immediate_transaction, run_with_connection
+from text_normalize import register_functions
+from executors import run_db, run_cpu, in_db_executor, executor_stats, shutdown_executors, cpu_executor
+from metrics import registry as metrics_registry, MetricsMiddleware, BCRYPT_DURATION
+from pagination import KeysetPage, PaginationError
+from response_cache import response_cache, etag_matches, invalidate_catalog, CATALOG
+from search import build_match_query, search_courses, search_lessons, lookup_by_title, lookup_by_teacher
+from grading import (
+    GradingError, answer_key_rows, key_row, question_type, grade_submission, regrade_exam, load_compiled
+)
+from exam_store import insert_questions, compiled_exams
+from exam_analytics import record_submission, rebuild_exam_stats, exam_report, class_report
+from progress_summary import get_summary, percentage
+from progress_buffer import progress_buffer, progress_row, periodic_flush, PROGRESS_UPSERT_SQL, DURABILITY_SYNC
+from ledger import (
+    append_entry, take_snapshots, balance_at, check_consistency, periodic_snapshots,
+    IdempotencyConflict, InsufficientFunds
+)
+from enrollment import enroll, EnrollmentError
+from waitlist import (
+    join as join_waitlist, position as waitlist_position, leave as leave_waitlist,
+    cancel_enrollment, promote_waiting, waitlist_promoter, WaitlistError
+)
+from principal_cache import Principal, principal_cache, token_versions, token_version_changed
+from migrate import connect as connect_migrations, ensure_schema, current_version as current_schema_version
+from seed import seed as seed_sample_data
+from query_profiler import profiler as query_profiler, connection_factory, SORT_KEYS as QUERY_SORT_KEYS
+startup.mark("import: app modules")
 
 # تنظیمات logging
 logging.basicConfig(level=logging.INFO)
@@ -23,20 +52,34 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 3600
 
 # Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# jose و passlib/bcrypt هنگام اولین استفاده (یا warm-up پس‌زمینه در lifespan) بارگذاری می‌شوند تا شروع سرور سریع‌تر باشد
+_pwd_context = None
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
+def warm_up_crypto():
+    import jose.jwt
+    get_pwd_context().handler().get_backend()
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/login")
 
 # تشخیص محیط
 def get_db_connection():
-    if 'RENDER' in os.environ:
-        db_path = '/tmp/quran_db.sqlite3'
-    else:
-        db_path = 'quran_db.sqlite3'
-    
-    conn = sqlite3.connect(db_path)
+    # اتصال مستقل برای اسکریپت‌ها؛ endpointها از pool و get_db استفاده می‌کنند
+    conn = sqlite3.connect(get_db_path(), factory=connection_factory())
     conn.row_factory = sqlite3.Row
+    register_functions(conn)
     return conn
 
+pool.connect_hooks.append(register_functions)
+# QUERY_PROFILE=1: دستورهای SQL اتصال‌های pool پروفایل می‌شوند (query_profiler.py)
+pool.factory = connection_factory()
+
 def row_to_dict(row):
     if row is None:
         return None
@@ -47,12 +90,24 @@ def rows_to_dict_list(rows):
 
 # توابع Authentication
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+# نسخه‌های async که bcrypt را در cpu_executor اجرا می‌کنند تا event loop آزاد بماند
+async def verify_password_async(plain_password, hashed_password):
+    result, seconds = await cpu_executor.run_timed(verify_password, plain_password, hashed_password)
+    BCRYPT_DURATION.observe(seconds, "verify")
+    return result
+
+async def get_password_hash_async(password):
+    result, seconds = await cpu_executor.run_timed(get_password_hash, password)
+    BCRYPT_DURATION.observe(seconds, "hash")
+    return result
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -62,7 +117,37 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def create_user_token(user: dict):
+    # role و token_version داخل توکن امضا می‌شوند تا احراز هویت بدون مراجعه به DB انجام شود
+    return create_access_token(
+        data={
+            "user_id": user['id'],
+            "sub": user['username'],
+            "role": user['role'],
+            "approved": bool(user['approved']),
+            "tv": user.get('token_version') or 0
+        },
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+
+def _load_principal(conn, user_id):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT id, username, role, approved, token_version FROM users WHERE id = ?",
+        (user_id,)
+    )
+    user = cursor.fetchone()
+    if not user:
+        return None
+    return Principal(user['id'], user['username'], user['role'], bool(user['approved']), user['token_version'])
+
+def _load_token_versions(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, token_version FROM users WHERE token_version > 0")
+    return [(row['id'], row['token_version']) for row in cursor.fetchall()]
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)):
+    from jose import JWTError, jwt
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -75,47 +160,65 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         
         if user_id is None or username is None:
             raise credentials_exception
-            
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT id FROM users WHERE id = ? AND username = ?", (user_id, username))
-        user = cursor.fetchone()
-        conn.close()
         
-        if not user:
+        if token_versions.needs_refresh():
+            token_versions.load(await run_with_connection(_load_token_versions))
+        
+        # توکن‌های قدیمی بدون tv معادل نسخه صفر هستند
+        token_version = payload.get("tv", 0)
+        current_version = token_versions.current(user_id)
+        if token_version < current_version:
+            token_versions.rejected += 1
+            raise credentials_exception
+        
+        # مسیر سریع: claimهای امضا شده و به‌روز، بدون مراجعه به DB
+        role = payload.get("role")
+        if role is not None and token_version == current_version:
+            token_versions.fast_path += 1
+            return Principal(user_id, username, role, payload.get("approved", True), token_version)
+        
+        # توکن قدیمی یا نسخه جدیدتر از حافظه این worker: از کش یا DB
+        principal = principal_cache.get(user_id)
+        if principal is None or principal.token_version < token_version:
+            principal = await run_with_connection(_load_principal, user_id)
+            if principal is None:
+                raise credentials_exception
+            principal_cache.put(principal)
+            token_versions.bump(user_id, principal.token_version)
+        
+        if principal.username != username or principal.token_version != token_version:
             raise credentials_exception
             
-        return user_id
+        return principal
     except JWTError:
         raise credentials_exception
 
-async def get_current_teacher(user_id: int = Depends(get_current_user)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT role FROM users WHERE id = ?", (user_id,))
-    user = cursor.fetchone()
-    conn.close()
-    
-    if not user or user['role'] != 'teacher':
+async def get_current_user(principal: Principal = Depends(get_current_principal)):
+    return principal.user_id
+
+async def get_current_teacher(principal: Principal = Depends(get_current_principal)):
+    if principal.role != 'teacher':
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Teacher access required",
         )
-    return user_id
+    return principal.user_id
 
-async def get_current_student(user_id: int = Depends(get_current_user)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT role FROM users WHERE id = ?", (user_id,))
-    user = cursor.fetchone()
-    conn.close()
-    
-    if not user or user['role'] != 'student':
+async def get_current_admin(principal: Principal = Depends(get_current_principal)):
+    if principal.role != 'admin':
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required",
+        )
+    return principal.user_id
+
+async def get_current_student(principal: Principal = Depends(get_current_principal)):
+    if principal.role != 'student':
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Student access required",
         )
-    return user_id
+    return principal.user_id
 
 # مدل‌های داده
 class StudentRegister(BaseModel):
@@ -163,6 +266,10 @@ class ExamSubmit(BaseModel):
     exam_id: int
     answers: List[dict]
 
+class AnswerKeyUpdate(BaseModel):
+    # هر مورد: {"position": 0, "correct": [0, 2], "points": 2, "partial_credit": true}
+    keys: List[dict]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -192,6 +299,8 @@ class LessonProgressUpdate(BaseModel):
     progress_percentage: int = 0
     last_position: int = 0
 
+MAX_PROGRESS_BATCH = 500
+
 class LessonProgressResponse(BaseModel):
     lesson_id: int
     is_completed: bool
@@ -199,278 +308,113 @@ class LessonProgressResponse(BaseModel):
     last_position: int
     completed_at: Optional[str] = None
 
-# ایجاد جداول و داده‌های تست
+# صفحه‌بندی لیست‌ها: نام فیلد عمومی -> عبارت SQL
+CLASS_FIELDS = {
+    name: f"c.{name}" for name in (
+        "id", "teacher_id", "title", "description", "level", "category", "duration",
+        "price", "max_students", "schedule", "status", "created_at"
+    )
+}
+
+COURSES_PAGE = KeysetPage(dict(CLASS_FIELDS, teacher_name="u.full_name"), key=["id"])
+
+MY_COURSES_PAGE = KeysetPage(
+    dict(CLASS_FIELDS, teacher_name="u.full_name", progress="e.progress",
+         enrolled_at="e.enrolled_at", enrollment_id="e.id"),
+    key=["enrollment_id"]
+)
+
+USERS_PAGE = KeysetPage(
+    {name: name for name in ("id", "username", "full_name", "email", "role", "approved", "wallet_balance")},
+    key=["id"]
+)
+
+DEBUG_USERS_PAGE = KeysetPage(
+    {name: name for name in ("id", "username", "email", "role", "full_name", "wallet_balance")},
+    key=["id"]
+)
+
+TRANSACTIONS_PAGE = KeysetPage(
+    {name: name for name in ("id", "user_id", "amount", "type", "description", "created_at")},
+    key=["created_at", "id"],
+    descending=True
+)
+
+EXAM_RESULTS_PAGE = KeysetPage(
+    dict(
+        {name: f"er.{name}" for name in ("id", "exam_id", "student_id", "score", "answers", "completed_at")},
+        exam_name="e.title", class_name="c.title"
+    ),
+    key=["completed_at", "id"],
+    descending=True
+)
+
+# راه‌اندازی (بعد از باز شدن پورت): نسخه و checksum schema بررسی و migrationهای باقی‌مانده (مثلاً دیتابیس
+# تازه /tmp روی Render) اجرا می‌شوند؛ بعد داده نمونه فقط روی دیتابیس بدون کاربر اضافه می‌شود (SEED_ON_STARTUP=0 برای غیرفعال کردن)
+SEED_ON_STARTUP = os.environ.get("SEED_ON_STARTUP", "1") != "0"
+
 def init_db():
+    conn = connect_migrations()
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # ایجاد جداول
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL UNIQUE,
-                password TEXT NOT NULL,
-                role TEXT DEFAULT 'student',
-                full_name TEXT,
-                email TEXT UNIQUE,
-                specialty TEXT,
-                wallet_balance DECIMAL(10,2) DEFAULT 0,
-                approved BOOLEAN DEFAULT TRUE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS students (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                level TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS teachers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                experience TEXT,
-                bio TEXT,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS classes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                teacher_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                level TEXT DEFAULT 'Beginner',
-                category TEXT,
-                duration INTEGER DEFAULT 60,
-                price DECIMAL(10,2) DEFAULT 0,
-                max_students INTEGER DEFAULT 10,
-                schedule TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (teacher_id) REFERENCES users (id)
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS enrollments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id INTEGER NOT NULL,
-                class_id INTEGER NOT NULL,
-                enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                status TEXT DEFAULT 'active',
-                progress INTEGER DEFAULT 0,
-                FOREIGN KEY (student_id) REFERENCES users (id),
-                FOREIGN KEY (class_id) REFERENCES classes (id),
-                UNIQUE(student_id, class_id)
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                amount DECIMAL(10,2) NOT NULL,
-                type TEXT NOT NULL,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS exams (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                class_id INTEGER NOT NULL,
-                teacher_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT,
-                questions TEXT,
-                duration INTEGER DEFAULT 60,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (class_id) REFERENCES classes (id),
-                FOREIGN KEY (teacher_id) REFERENCES users (id)
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS exam_results (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                exam_id INTEGER NOT NULL,
-                student_id INTEGER NOT NULL,
-                score INTEGER,
-                answers TEXT,
-                completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (exam_id) REFERENCES exams (id),
-                FOREIGN KEY (student_id) REFERENCES users (id),
-                UNIQUE(exam_id, student_id)
-            )
-        """)
-        
-        # جداول جدید برای سیستم آموزشی
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS lessons (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                class_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                content_type TEXT DEFAULT 'text',
-                content_url TEXT,
-                duration INTEGER DEFAULT 0,
-                order_index INTEGER DEFAULT 0,
-                description TEXT,
-                is_published BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (class_id) REFERENCES classes (id) ON DELETE CASCADE
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS lesson_progress (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                student_id INTEGER NOT NULL,
-                lesson_id INTEGER NOT NULL,
-                class_id INTEGER NOT NULL,
-                is_completed BOOLEAN DEFAULT FALSE,
-                completed_at TIMESTAMP,
-                progress_percentage INTEGER DEFAULT 0,
-                last_position INTEGER DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (student_id) REFERENCES users (id) ON DELETE CASCADE,
-                FOREIGN KEY (lesson_id) REFERENCES lessons (id) ON DELETE CASCADE,
-                FOREIGN KEY (class_id) REFERENCES classes (id) ON DELETE CASCADE,
-                UNIQUE(student_id, lesson_id)
-            )
-        """)
-        
-        # ایجاد ایندکس برای بهبود عملکرد
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lessons_class_id ON lessons(class_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lessons_order ON lessons(class_id, order_index)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lesson_progress_student ON lesson_progress(student_id)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_lesson_progress_lesson ON lesson_progress(lesson_id)")
-        
-        # اضافه کردن داده‌های تست اگر وجود ندارند
-        cursor.execute("SELECT COUNT(*) as count FROM users")
-        result = cursor.fetchone()
-        user_count = row_to_dict(result)['count'] if result else 0
-        
-        if user_count == 0:
-            logger.info("Adding test data to database...")
-            
-            test_users = [
-                ('admin@quran.com', get_password_hash('admin123'), 'admin', 'Admin User', 'admin@quran.com', '', 100, True),
-                ('teacher1', get_password_hash('teacher123'), 'teacher', 'استاد احمد', 'teacher1@quran.com', 'Quran Recitation', 500, True),
-                ('student1@quran.com', get_password_hash('student123'), 'student', 'دانشجو محمد', 'student1@quran.com', '', 50, True),
-                ('student2@quran.com', get_password_hash('student123'), 'student', 'دانشجو فاطمه', 'student2@quran.com', '', 75, True)
-            ]
-            
-            for user in test_users:
-                try:
-                    cursor.execute(
-                        "INSERT INTO users (username, password, role, full_name, email, specialty, wallet_balance, approved) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                        user
-                    )
-                    user_id = cursor.lastrowid
-                    
-                    if user[2] == 'student':
-                        cursor.execute(
-                            "INSERT INTO students (user_id, level) VALUES (?, ?)",
-                            (user_id, 'Beginner')
-                        )
-                    elif user[2] == 'teacher':
-                        cursor.execute(
-                            "INSERT INTO teachers (user_id, experience) VALUES (?, ?)",
-                            (user_id, '5 years experience')
-                        )
-                        
-                except sqlite3.IntegrityError as e:
-                    logger.warning(f"User already exists: {user[0]}")
-                    continue
-            
-            cursor.execute("SELECT id FROM users WHERE username = 'teacher1'")
-            teacher_result = cursor.fetchone()
-            if teacher_result:
-                teacher_id = row_to_dict(teacher_result)['id']
-                
-                test_classes = [
-                    (teacher_id, 'Basic Quran Reading', 'Learn to read Quran from basics', 'Beginner', 'Recitation', 60, 0, 20, 'Mon, Wed, Fri 10:00-11:00'),
-                    (teacher_id, 'Tajweed Fundamentals', 'Learn proper pronunciation rules', 'Intermediate', 'Tajweed', 60, 25, 15, 'Tue, Thu 14:00-15:00'),
-                    (teacher_id, 'Advanced Recitation', 'Master Quran recitation', 'Advanced', 'Recitation', 90, 50, 10, 'Sat, Sun 09:00-10:30')
-                ]
-                
-                class_ids = []
-                for class_data in test_classes:
-                    cursor.execute(
-                        "INSERT INTO classes (teacher_id, title, description, level, category, duration, price, max_students, schedule) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
-                        class_data
-                    )
-                    class_ids.append(cursor.lastrowid)
-                
-                # اضافه کردن دروس نمونه
-                test_lessons = [
-                    (class_ids[0], 'Introduction to Arabic Letters', 'text', None, 15, 1, 'Learn the basics of Arabic alphabet', True),
-                    (class_ids[0], 'Basic Pronunciation', 'video', 'https://example.com/video1.mp4', 20, 2, 'Practice basic sounds', True),
-                    (class_ids[0], 'Reading Practice', 'text', None, 25, 3, 'Practice reading simple words', True),
-                    (class_ids[1], 'Tajweed Rules Overview', 'text', None, 30, 1, 'Introduction to Tajweed rules', True),
-                    (class_ids[1], 'Practice Session 1', 'audio', 'https://example.com/audio1.mp3', 25, 2, 'First practice session', True),
-                    (class_ids[2], 'Advanced Techniques', 'video', 'https://example.com/video2.mp4', 40, 1, 'Learn advanced recitation techniques', True)
-                ]
-                
-                for lesson in test_lessons:
-                    cursor.execute(
-                        "INSERT INTO lessons (class_id, title, content_type, content_url, duration, order_index, description, is_published) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                        lesson
-                    )
-                
-                cursor.execute("SELECT id FROM users WHERE email = 'student1@quran.com'")
-                student1_result = cursor.fetchone()
-                cursor.execute("SELECT id FROM users WHERE email = 'student2@quran.com'")
-                student2_result = cursor.fetchone()
-                
-                if student1_result and student2_result:
-                    student1_id = row_to_dict(student1_result)['id']
-                    student2_id = row_to_dict(student2_result)['id']
-                    
-                    test_enrollments = [
-                        (student1_id, class_ids[0], 25),
-                        (student1_id, class_ids[1], 50),
-                        (student2_id, class_ids[0], 15)
-                    ]
-                    
-                    for enrollment in test_enrollments:
-                        try:
-                            cursor.execute(
-                                "INSERT INTO enrollments (student_id, class_id, progress) VALUES (?, ?, ?)",
-                                enrollment
-                            )
-                        except sqlite3.IntegrityError:
-                            continue
-            
-            conn.commit()
-            logger.info("Test data added successfully")
-        
+        applied = ensure_schema(conn)
+        if applied:
+            logger.info(f"Applied {len(applied)} migrations: {', '.join(applied)}")
+        logger.info(f"Database schema version {current_schema_version(conn)}")
+        if SEED_ON_STARTUP and seed_sample_data(conn):
+            logger.info("Inserted sample data into an empty database")
+    finally:
         conn.close()
-        logger.info("Database initialization completed successfully")
-        
+
+async def _bootstrap(background_tasks):
+    # بعد از باز شدن پورت: schema و کارهای پس‌زمینه؛ jose/bcrypt بعد از آماده شدن بارگذاری می‌شوند
+    try:
+        with startup.phase("init_db"):
+            await run_db(init_db)
+        background_tasks.extend([
+            asyncio.create_task(periodic_flush(progress_buffer, lambda: run_with_connection(_flush_progress, reserved=True))),
+            asyncio.create_task(periodic_snapshots(lambda: run_with_connection(_take_snapshots, reserved=True))),
+            asyncio.create_task(waitlist_promoter.run(lambda: run_with_connection(_promote_waitlists, reserved=True))),
+        ])
+        startup.set_ready()
+        logger.info(f"Application ready after {startup.ready_ms} ms")
     except Exception as e:
-        logger.error(f"Database initialization error: {e}")
+        logger.error(f"Startup error: {e}")
+        startup.set_failed(e)
+        return
+    try:
+        with startup.phase("crypto warm-up"):
+            await run_cpu(warm_up_crypto)
+    except Exception as e:
+        logger.error(f"Crypto warm-up error: {e}")
+    startup.report()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()
-    logger.info("Application startup complete")
+    startup.begin()
+    background_tasks = []
+    bootstrap_task = asyncio.create_task(_bootstrap(background_tasks))
+    startup.mark("lifespan start")
+    logger.info("Application startup complete; warming up in background")
     yield
+    bootstrap_task.cancel()
+    for task in background_tasks:
+        task.cancel()
+    # به‌روزرسانی‌های پیشرفت باقی‌مانده قبل از خاموش شدن نوشته می‌شوند
+    if startup.ready:
+        try:
+            flushed = await run_with_connection(_flush_progress, reserved=True)
+            logger.info(f"Flushed {flushed} pending progress updates")
+        except Exception as e:
+            logger.error(f"Final progress flush error: {e}")
+    shutdown_executors()
+    pool.close()
     logger.info("Application shutdown")
 
 app = FastAPI(lifespan=lifespan)
 
+# تا پایان راه‌اندازی پس‌زمینه درخواست‌ها (به جز /health و /metrics) منتظر می‌مانند
+app.add_middleware(ReadinessMiddleware, state=startup, exempt_paths=("/health", "/metrics"))
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -479,48 +423,107 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# بیرونی‌ترین middleware تا زمان انتظار برای آماده شدن هم در تأخیر دیده شود
+app.add_middleware(MetricsMiddleware, routes=app.router.routes)
+
 @app.get("/")
 async def root():
     return {"message": "Quran App API", "status": "running", "timestamp": datetime.now().isoformat()}
 
+def _count_users(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) as user_count FROM users")
+    result = cursor.fetchone()
+    return row_to_dict(result)['user_count'] if result else 0
+
 @app.get("/health")
 async def health_check():
+    # در زمان warming بدون مراجعه به DB فوراً پاسخ داده می‌شود
+    if not startup.ready:
+        return {
+            "status": "warming" if startup.state != "failed" else "unhealthy",
+            "timestamp": datetime.now().isoformat(),
+            "startup": startup.stats()
+        }
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) as user_count FROM users")
-        result = cursor.fetchone()
-        user_count = row_to_dict(result)['user_count'] if result else 0
-        conn.close()
+        user_count = await run_with_connection(_count_users, reserved=True)
         
         return {
             "status": "healthy", 
             "timestamp": datetime.now().isoformat(),
             "user_count": user_count,
-            "environment": "Render" if 'RENDER' in os.environ else "Local"
+            "environment": "Render" if 'RENDER' in os.environ else "Local",
+            "db_pool": pool.snapshot(),
+            "executors": executor_stats(),
+            "principal_cache": principal_cache.stats(),
+            "token_versions": token_versions.stats(),
+            "response_cache": response_cache.stats(),
+            "progress_buffer": progress_buffer.stats(),
+            "compiled_exams": compiled_exams.stats(),
+            "waitlist": waitlist_promoter.stats(),
+            "startup": startup.stats()
         }
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}
 
+# آمار تجمعی counter و بقیه gauge هستند
+_RUNTIME_COUNTERS = {"completed", "failed", "created", "reused", "thread_hits", "discarded", "waits", "busy_retries"}
+
+def _runtime_family(prefix, key, help, samples):
+    if key in _RUNTIME_COUNTERS:
+        return (f"{prefix}_{key}_total", "counter", help, samples)
+    return (f"{prefix}_{key}", "gauge", help, samples)
+
+def _runtime_metrics():
+    # وضعیت executorها، pool و راه‌اندازی در لحظه scrape خوانده می‌شود (بدون مراجعه به DB)
+    executor_samples = {}
+    for name, stats in executor_stats().items():
+        for key, value in stats.items():
+            executor_samples.setdefault(key, []).append(({"executor": name}, value))
+    families = [
+        _runtime_family("executor", key, f"Executor {key.replace('_', ' ')}", samples)
+        for key, samples in executor_samples.items()
+    ]
+    families += [
+        _runtime_family("db_pool", key, f"Connection pool {key.replace('_', ' ')}", [({}, value)])
+        for key, value in pool.snapshot().items()
+    ]
+    families.append(("app_ready", "gauge", "1 once background startup has finished", [({}, int(startup.ready))]))
+    return families
+
+metrics_registry.collectors.append(_runtime_metrics)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/debug/users")
-async def debug_users():
+@in_db_executor
+def debug_users(
+    limit: Optional[int] = None,
+    cursor_token: Optional[str] = Query(None, alias="cursor"),
+    fields: Optional[str] = None,
+    conn: sqlite3.Connection = Depends(get_db)
+):
     try:
-        conn = get_db_connection()
+        select_list, where_sql, where_params, order_by, limit, requested = \
+            DEBUG_USERS_PAGE.query(fields, cursor_token, limit)
         cursor = conn.cursor()
-        cursor.execute("SELECT id, username, email, role, full_name, wallet_balance FROM users")
-        users = cursor.fetchall()
-        conn.close()
+        cursor.execute(
+            f"SELECT {select_list} FROM users WHERE {where_sql} ORDER BY {order_by} LIMIT ?",
+            (*where_params, limit + 1)
+        )
+        users, next_cursor = DEBUG_USERS_PAGE.finish(cursor.fetchall(), limit, requested)
         
-        return {"users": rows_to_dict_list(users)}
+        return {"users": users, "next_cursor": next_cursor}
+    except PaginationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/admin/reset-passwords")
 async def reset_passwords():
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
         default_passwords = {
             "admin@quran.com": "admin123",
             "teacher1": "teacher123", 
@@ -528,19 +531,28 @@ async def reset_passwords():
             "student2@quran.com": "student123"
         }
         
-        updated_count = 0
-        for username, password in default_passwords.items():
-            hashed_password = get_password_hash(password)
-            cursor.execute(
-                "UPDATE users SET password = ? WHERE username = ?",
-                (hashed_password, username)
-            )
-            if cursor.rowcount > 0:
-                updated_count += 1
-                logger.info(f"Reset password for {username}")
+        # هش‌ها به صورت موازی در cpu_executor ساخته می‌شوند
+        hashes = await asyncio.gather(*(get_password_hash_async(p) for p in default_passwords.values()))
+        
+        def _update(conn):
+            cursor = conn.cursor()
+            updated = []
+            for username, hashed_password in zip(default_passwords, hashes):
+                # افزایش token_version همه توکن‌های قبلی کاربر را باطل می‌کند
+                cursor.execute(
+                    "UPDATE users SET password = ?, token_version = token_version + 1 WHERE username = ?",
+                    (hashed_password, username)
+                )
+                if cursor.rowcount > 0:
+                    cursor.execute("SELECT id, token_version FROM users WHERE username = ?", (username,))
+                    updated.append(tuple(cursor.fetchone()))
+                    logger.info(f"Reset password for {username}")
+            conn.commit()
+            for user_id, version in updated:
+                token_version_changed(user_id, version)
+            return len(updated)
         
-        conn.commit()
-        conn.close()
+        updated_count = await run_with_connection(_update)
         
         return {
             "success": True, 
@@ -555,26 +567,27 @@ async def reset_passwords():
 @app.post("/register/student")
 async def register_student(student: StudentRegister):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        hashed_password = get_password_hash(student.password)
+        hashed_password = await get_password_hash_async(student.password)
         logger.info(f"Registering student: {student.email}")
         
-        cursor.execute(
-            "INSERT INTO users (username, password, full_name, email, role) VALUES (?, ?, ?, ?, ?)",
-            (student.email, hashed_password, student.name, student.email, 'student')
-        )
-        
-        user_id = cursor.lastrowid
-        
-        cursor.execute(
-            "INSERT INTO students (user_id, level) VALUES (?, ?)",
-            (user_id, student.level)
-        )
+        def _insert(conn):
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO users (username, password, full_name, email, role) VALUES (?, ?, ?, ?, ?)",
+                (student.email, hashed_password, student.name, student.email, 'student')
+            )
+            
+            user_id = cursor.lastrowid
+            
+            cursor.execute(
+                "INSERT INTO students (user_id, level) VALUES (?, ?)",
+                (user_id, student.level)
+            )
+            
+            conn.commit()
+            return user_id
         
-        conn.commit()
-        conn.close()
+        user_id = await run_with_connection(_insert)
         
         return {"message": "Student registered successfully", "user_id": user_id, "success": True}
         
@@ -587,26 +600,27 @@ async def register_student(student: StudentRegister):
 @app.post("/register/teacher")
 async def register_teacher(teacher: TeacherRegister):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        hashed_password = get_password_hash(teacher.password)
+        hashed_password = await get_password_hash_async(teacher.password)
         logger.info(f"Registering teacher: {teacher.username}")
         
-        cursor.execute(
-            "INSERT INTO users (username, password, full_name, email, specialty, role) VALUES (?, ?, ?, ?, ?, ?)",
-            (teacher.username, hashed_password, teacher.full_name, teacher.email, teacher.specialty, 'teacher')
-        )
-        
-        user_id = cursor.lastrowid
+        def _insert(conn):
+            cursor = conn.cursor()
+            cursor.execute(
+                "INSERT INTO users (username, password, full_name, email, specialty, role) VALUES (?, ?, ?, ?, ?, ?)",
+                (teacher.username, hashed_password, teacher.full_name, teacher.email, teacher.specialty, 'teacher')
+            )
+            
+            user_id = cursor.lastrowid
+            
+            cursor.execute(
+                "INSERT INTO teachers (user_id) VALUES (?)",
+                (user_id,)
+            )
+            
+            conn.commit()
+            return user_id
         
-        cursor.execute(
-            "INSERT INTO teachers (user_id) VALUES (?)",
-            (user_id,)
-        )
-        
-        conn.commit()
-        conn.close()
+        user_id = await run_with_connection(_insert)
         
         return {"message": "Teacher registered successfully", "user_id": user_id, "success": True}
         
@@ -616,30 +630,24 @@ async def register_teacher(teacher: TeacherRegister):
         logger.error(f"Teacher registration error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _find_login_user(conn, username):
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT * FROM users WHERE username = ? OR email = ?",
+        (username, username)
+    )
+    return row_to_dict(cursor.fetchone())
+
 @app.post("/api/login")
 async def login(login_data: LoginRequest):
     try:
         logger.info(f"Login attempt: username={login_data.username}")
         
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "SELECT * FROM users WHERE username = ? OR email = ?",
-            (login_data.username, login_data.username)
-        )
-        
-        user = cursor.fetchone()
-        conn.close()
+        # اتصال DB در زمان bcrypt نگه داشته نمی‌شود
+        user_dict = await run_with_connection(_find_login_user, login_data.username)
         
-        if user and verify_password(login_data.password, user['password']):
-            user_dict = row_to_dict(user)
-            
-            access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-            access_token = create_access_token(
-                data={"user_id": user_dict['id'], "sub": user_dict['username']},
-                expires_delta=access_token_expires
-            )
+        if user_dict and await verify_password_async(login_data.password, user_dict['password']):
+            access_token = create_user_token(user_dict)
             
             logger.info(f"Login successful for user: {user_dict['username']}")
             return {
@@ -657,18 +665,22 @@ async def login(login_data: LoginRequest):
                 headers={"WWW-Authenticate": "Bearer"},
             )
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Login error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/users/me")
-async def read_users_me(current_user: int = Depends(get_current_user)):
+@in_db_executor
+def read_users_me(
+    current_user: int = Depends(get_current_user),
+    conn: sqlite3.Connection = Depends(get_db)
+):
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM users WHERE id = ?", (current_user,))
         user = cursor.fetchone()
-        conn.close()
         
         if user:
             user_dict = row_to_dict(user)
@@ -686,116 +698,250 @@ async def read_users_me(current_user: int = Depends(get_current_user)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _fetch_courses(conn, fields, cursor_token, limit):
+    select_list, where_sql, where_params, order_by, limit, requested = \
+        COURSES_PAGE.query(fields, cursor_token, limit)
+    cursor = conn.cursor()
+    
+    cursor.execute(f"""
+        SELECT {select_list}
+        FROM classes c 
+        JOIN users u ON c.teacher_id = u.id 
+        WHERE c.status = 'active' AND {where_sql}
+        ORDER BY {order_by}
+        LIMIT ?
+    """, (*where_params, limit + 1))
+    
+    courses, next_cursor = COURSES_PAGE.finish(cursor.fetchall(), limit, requested)
+    return {"courses": courses, "next_cursor": next_cursor}
+
 @app.get("/courses")
-async def get_courses():
+async def get_courses(
+    limit: Optional[int] = None,
+    cursor_token: Optional[str] = Query(None, alias="cursor"),
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT c.*, u.full_name as teacher_name 
-            FROM classes c 
-            JOIN users u ON c.teacher_id = u.id 
-            WHERE c.status = 'active'
-        """)
-        
-        courses = cursor.fetchall()
-        conn.close()
-        
-        return {"courses": rows_to_dict_list(courses)}
-        
+        # کاتالوگ برای همه یکسان است: از کش حافظه با ETag سرو می‌شود
+        key = (limit, cursor_token, fields)
+        cached = response_cache.get(CATALOG, key)
+        if cached is None:
+            version = response_cache.version(CATALOG)
+            payload = await run_with_connection(_fetch_courses, fields, cursor_token, limit)
+            cached = response_cache.put(CATALOG, version, key, payload)
+        etag, body = cached
+        
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(if_none_match, etag):
+            response_cache.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+        
+    except PaginationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get courses error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _run_search(conn, match, title, teacher, search_type, limit):
+    cursor = conn.cursor()
+    results = {}
+    if match:
+        if search_type in ("all", "courses"):
+            results["courses"] = search_courses(cursor, match, limit)
+        if search_type in ("all", "lessons"):
+            results["lessons"] = search_lessons(cursor, match, limit)
+    if title:
+        results["title_matches"] = lookup_by_title(cursor, title, limit)
+    if teacher:
+        results["teacher_courses"] = lookup_by_teacher(cursor, teacher, limit)
+    return results
+
+@app.get("/search")
+async def search(
+    q: Optional[str] = None,
+    title: Optional[str] = None,
+    teacher: Optional[str] = None,
+    type: str = "all",
+    limit: int = Query(20, ge=1, le=100)
+):
+    # q: جستجوی متن کامل؛ title و teacher: جستجوی پیشوندی روی ستون‌های یکسان‌سازی شده
+    if type not in ("all", "courses", "lessons"):
+        raise HTTPException(status_code=400, detail="type must be one of: all, courses, lessons")
+    if not (q or title or teacher):
+        raise HTTPException(status_code=400, detail="One of q, title or teacher is required")
+    match = build_match_query(q)
+    try:
+        results = await run_with_connection(_run_search, match, title, teacher, type, limit)
+        return dict(results, query=q)
+    except Exception as e:
+        logger.error(f"Search error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/my-courses")
-async def get_my_courses(current_user: int = Depends(get_current_user)):
+@in_db_executor
+def get_my_courses(
+    limit: Optional[int] = None,
+    cursor_token: Optional[str] = Query(None, alias="cursor"),
+    fields: Optional[str] = None,
+    current_user: int = Depends(get_current_user),
+    conn: sqlite3.Connection = Depends(get_db)
+):
     try:
-        conn = get_db_connection()
+        select_list, where_sql, where_params, order_by, limit, requested = \
+            MY_COURSES_PAGE.query(fields, cursor_token, limit)
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT c.*, u.full_name as teacher_name, e.progress, e.enrolled_at
+        cursor.execute(f"""
+            SELECT {select_list}
             FROM classes c
             JOIN enrollments e ON c.id = e.class_id
             JOIN users u ON c.teacher_id = u.id
-            WHERE e.student_id = ? AND e.status = 'active'
-        """, (current_user,))
+            WHERE e.student_id = ? AND e.status = 'active' AND {where_sql}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, (current_user, *where_params, limit + 1))
         
-        courses = cursor.fetchall()
-        conn.close()
+        courses, next_cursor = MY_COURSES_PAGE.finish(cursor.fetchall(), limit, requested)
         
-        return {"my_courses": rows_to_dict_list(courses)}
+        return {"my_courses": courses, "next_cursor": next_cursor}
         
+    except PaginationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get my courses error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/enroll/{class_id}")
-async def enroll_student(class_id: int, current_user: int = Depends(get_current_user)):
+@in_db_executor
+def enroll_student(
+    class_id: int,
+    principal: Principal = Depends(get_current_principal),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    if principal.role != 'student':
+        raise HTTPException(status_code=403, detail="Only students can enroll in classes")
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM classes WHERE id = ? AND status = 'active'", (class_id,))
-        class_data = cursor.fetchone()
+        # ظرفیت، پرداخت و ثبت‌نام در یک تراکنش BEGIN IMMEDIATE (با تلاش مجدد در SQLITE_BUSY)
+        result = immediate_transaction(conn, lambda cursor: enroll(cursor, principal.user_id, class_id))
         
-        if not class_data:
-            raise HTTPException(status_code=404, detail="Class not found")
+        return {"success": True, "message": "Enrollment successful", **result}
         
-        cursor.execute("SELECT * FROM users WHERE id = ? AND role = 'student'", (current_user,))
-        student = cursor.fetchone()
-        
-        if not student:
-            raise HTTPException(status_code=403, detail="Only students can enroll in classes")
-        
-        cursor.execute(
-            "SELECT * FROM enrollments WHERE student_id = ? AND class_id = ?",
-            (current_user, class_id)
-        )
-        existing = cursor.fetchone()
-        
-        if existing:
-            raise HTTPException(status_code=400, detail="Already enrolled in this class")
-        
-        cursor.execute(
-            "INSERT INTO enrollments (student_id, class_id, status) VALUES (?, ?, 'active')",
-            (current_user, class_id)
-        )
-        
-        conn.commit()
-        conn.close()
+    except EnrollmentError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except InsufficientFunds as e:
+        raise HTTPException(status_code=402, detail=str(e))
+    except Exception as e:
+        logger.error(f"Enrollment error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/enroll/{class_id}")
+@in_db_executor
+def cancel_student_enrollment(
+    class_id: int,
+    current_user: int = Depends(get_current_student),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    try:
+        immediate_transaction(conn, lambda cursor: cancel_enrollment(cursor, current_user, class_id))
+        # بدون این، ردیف بافر شده بررسی ثبت‌نام heartbeatهای بعدی را دور می‌زد (pending_class_id)
+        progress_buffer.discard_class(current_user, class_id)
+        # جای خالی شده در پس‌زمینه به نفر اول صف انتظار داده می‌شود
+        waitlist_promoter.notify()
         
-        return {"success": True, "message": "Enrollment successful"}
+        return {"success": True, "message": "Enrollment cancelled"}
         
+    except WaitlistError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.error(f"Enrollment cancel error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ⏳ صف انتظار دوره‌های پر
+def _promote_waitlists(conn):
+    return promote_waiting(conn)
+
+@app.post("/waitlist/{class_id}")
+@in_db_executor
+def join_class_waitlist(
+    class_id: int,
+    current_user: int = Depends(get_current_student),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    try:
+        result = immediate_transaction(conn, lambda cursor: join_waitlist(cursor, current_user, class_id))
+        return {"success": True, **result}
+    except WaitlistError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        logger.error(f"Waitlist join error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/waitlist/{class_id}/position")
+@in_db_executor
+def get_waitlist_position(
+    class_id: int,
+    current_user: int = Depends(get_current_student),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    try:
+        return waitlist_position(conn.cursor(), current_user, class_id)
+    except WaitlistError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/waitlist/{class_id}")
+@in_db_executor
+def leave_class_waitlist(
+    class_id: int,
+    current_user: int = Depends(get_current_student),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    try:
+        immediate_transaction(conn, lambda cursor: leave_waitlist(cursor, current_user, class_id))
+        return {"success": True, "message": "Left the waitlist"}
+    except WaitlistError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     except Exception as e:
-        logger.error(f"Enrollment error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/users")
-async def get_users():
+@in_db_executor
+def get_users(
+    limit: Optional[int] = None,
+    cursor_token: Optional[str] = Query(None, alias="cursor"),
+    fields: Optional[str] = None,
+    conn: sqlite3.Connection = Depends(get_db)
+):
     try:
-        conn = get_db_connection()
+        select_list, where_sql, where_params, order_by, limit, requested = \
+            USERS_PAGE.query(fields, cursor_token, limit)
         cursor = conn.cursor()
         
-        cursor.execute("SELECT id, username, full_name, email, role, approved, wallet_balance FROM users")
-        users = cursor.fetchall()
-        
-        conn.close()
+        cursor.execute(
+            f"SELECT {select_list} FROM users WHERE {where_sql} ORDER BY {order_by} LIMIT ?",
+            (*where_params, limit + 1)
+        )
+        users, next_cursor = USERS_PAGE.finish(cursor.fetchall(), limit, requested)
         
-        return {"users": rows_to_dict_list(users)}
+        return {"users": users, "next_cursor": next_cursor}
         
+    except PaginationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Get users error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/teacher/courses")
-async def create_course(
+@in_db_executor
+def create_course(
     course_data: CourseCreate, 
-    current_user: int = Depends(get_current_teacher)
+    current_user: int = Depends(get_current_teacher),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -818,7 +964,7 @@ async def create_course(
         
         conn.commit()
         course_id = cursor.lastrowid
-        conn.close()
+        invalidate_catalog()
         
         return {
             "success": True, 
@@ -831,9 +977,12 @@ async def create_course(
         raise HTTPException(status_code=500, detail=f"Error creating course: {str(e)}")
 
 @app.get("/teacher/courses")
-async def get_teacher_courses(current_user: int = Depends(get_current_teacher)):
+@in_db_executor
+def get_teacher_courses(
+    current_user: int = Depends(get_current_teacher),
+    conn: sqlite3.Connection = Depends(get_db)
+):
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -845,7 +994,6 @@ async def get_teacher_courses(current_user: int = Depends(get_current_teacher)):
         """, (current_user,))
         
         courses = cursor.fetchall()
-        conn.close()
         
         return {"courses": rows_to_dict_list(courses)}
         
@@ -855,13 +1003,15 @@ async def get_teacher_courses(current_user: int = Depends(get_current_teacher)):
 
 # Wallet endpoints
 @app.get("/wallet/balance")
-async def get_wallet_balance(current_user: int = Depends(get_current_user)):
+@in_db_executor
+def get_wallet_balance(
+    current_user: int = Depends(get_current_user),
+    conn: sqlite3.Connection = Depends(get_db)
+):
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         cursor.execute("SELECT wallet_balance FROM users WHERE id = ?", (current_user,))
         result = cursor.fetchone()
-        conn.close()
         
         if result:
             return {"balance": result['wallet_balance']}
@@ -870,162 +1020,450 @@ async def get_wallet_balance(current_user: int = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/wallet/deposit")
-async def deposit_to_wallet(
+@in_db_executor
+def deposit_to_wallet(
     payment_data: PaymentCreate, 
-    current_user: int = Depends(get_current_user)
+    idempotency_key: Optional[str] = Header(None),
+    current_user: int = Depends(get_current_user),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
+    # دفتر کل فقط اضافه می‌شود: اول گرد می‌شود تا مبلغی مثل 0.001 ردیف واریز 0.00 پاک‌نشدنی نسازد
+    amount = round(payment_data.amount, 2)
+    if not 0 < amount < float("inf"):
+        raise HTTPException(status_code=400, detail="Amount must be positive")
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= 128:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute(
-            "UPDATE users SET wallet_balance = wallet_balance + ? WHERE id = ?",
-            (payment_data.amount, current_user)
-        )
-        
-        cursor.execute(
-            "INSERT INTO transactions (user_id, amount, type, description) VALUES (?, ?, ?, ?)",
-            (current_user, payment_data.amount, 'deposit', payment_data.description)
+        # درخواست تکراری با همان Idempotency-Key دوباره واریز نمی‌شود
+        transaction_id, created = append_entry(
+            cursor,
+            current_user,
+            amount,
+            'deposit',
+            payment_data.description,
+            idempotency_key
         )
         
         cursor.execute("SELECT wallet_balance FROM users WHERE id = ?", (current_user,))
         new_balance = cursor.fetchone()['wallet_balance']
         
         conn.commit()
-        conn.close()
         
-        return {"success": True, "new_balance": new_balance}
+        return {"success": True, "new_balance": new_balance, "transaction_id": transaction_id, "replayed": not created}
         
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/wallet/balance-at")
+@in_db_executor
+def get_wallet_balance_at(
+    at: datetime,
+    current_user: int = Depends(get_current_user),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    try:
+        # زمان‌ها در دیتابیس به صورت UTC و با قالب CURRENT_TIMESTAMP ذخیره می‌شوند
+        if at.tzinfo is not None:
+            at = at.astimezone(timezone.utc).replace(tzinfo=None)
+        at_text = at.strftime("%Y-%m-%d %H:%M:%S")
+        return {"at": at_text, "balance": balance_at(conn.cursor(), current_user, at_text)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/wallet/transactions")
-async def get_wallet_transactions(current_user: int = Depends(get_current_user)):
+@in_db_executor
+def get_wallet_transactions(
+    limit: Optional[int] = None,
+    cursor_token: Optional[str] = Query(None, alias="cursor"),
+    fields: Optional[str] = None,
+    current_user: int = Depends(get_current_user),
+    conn: sqlite3.Connection = Depends(get_db)
+):
     try:
-        conn = get_db_connection()
+        select_list, where_sql, where_params, order_by, limit, requested = \
+            TRANSACTIONS_PAGE.query(fields, cursor_token, limit)
         cursor = conn.cursor()
-        cursor.execute("""
-            SELECT * FROM transactions 
-            WHERE user_id = ? 
-            ORDER BY created_at DESC
-        """, (current_user,))
-        
-        transactions = cursor.fetchall()
-        conn.close()
-        
-        return {"transactions": rows_to_dict_list(transactions)}
+        cursor.execute(f"""
+            SELECT {select_list} FROM transactions 
+            WHERE user_id = ? AND {where_sql}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, (current_user, *where_params, limit + 1))
+        
+        transactions, next_cursor = TRANSACTIONS_PAGE.finish(cursor.fetchall(), limit, requested)
+        
+        return {"transactions": transactions, "next_cursor": next_cursor}
+    except PaginationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _take_snapshots(conn):
+    created = take_snapshots(conn.cursor())
+    conn.commit()
+    return created
+
+@app.get("/admin/ledger/check")
+@in_db_executor
+def check_ledger(
+    current_user: int = Depends(get_current_admin),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    try:
+        return check_consistency(conn.cursor())
+    except Exception as e:
+        logger.error(f"Ledger check error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/query-stats")
+async def query_stats(
+    limit: int = Query(20, ge=1, le=500),
+    sort: str = "total_ms",
+    current_user: int = Depends(get_current_admin)
+):
+    # پرهزینه‌ترین دستورهای SQL (فقط با QUERY_PROFILE=1 داده دارد)
+    if sort not in QUERY_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(QUERY_SORT_KEYS)}")
+    return query_profiler.report(limit, sort)
+
+@app.delete("/admin/query-stats")
+async def reset_query_stats(current_user: int = Depends(get_current_admin)):
+    query_profiler.reset()
+    return {"success": True}
+
 # Exam endpoints
 @app.post("/teacher/exams")
-async def create_exam(
+@in_db_executor
+def create_exam(
     exam_data: ExamCreate, 
-    current_user: int = Depends(get_current_teacher)
+    current_user: int = Depends(get_current_teacher),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
+        # کلید پاسخ قبل از ذخیره آزمون بررسی می‌شود
+        key_rows = answer_key_rows(None, exam_data.questions)
+        
+        # سؤال‌ها در exam_questions و کلید پاسخ در exam_answer_keys ذخیره می‌شوند
         cursor.execute(
-            "INSERT INTO exams (class_id, teacher_id, title, description, questions, duration) VALUES (?, ?, ?, ?, ?, ?)",
+            "INSERT INTO exams (class_id, teacher_id, title, description, duration) VALUES (?, ?, ?, ?, ?)",
             (
                 exam_data.class_id,
                 current_user,
                 exam_data.title,
                 exam_data.description,
-                json.dumps(exam_data.questions),
                 exam_data.duration
             )
         )
         
         exam_id = cursor.lastrowid
+        insert_questions(cursor, exam_id, exam_data.questions)
+        cursor.executemany(
+            "INSERT INTO exam_answer_keys (exam_id, position, correct_mask, points, partial_credit) VALUES (?, ?, ?, ?, ?)",
+            [(exam_id, *row[1:]) for row in key_rows]
+        )
         conn.commit()
-        conn.close()
         
         return {"success": True, "exam_id": exam_id}
         
+    except GradingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/exams/{class_id}")
-async def get_class_exams(class_id: int, current_user: int = Depends(get_current_user)):
+@in_db_executor
+def get_class_exams(
+    class_id: int,
+    current_user: int = Depends(get_current_user),
+    conn: sqlite3.Connection = Depends(get_db)
+):
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
+        # فقط اطلاعات کلی؛ سؤال‌ها از /exams/{exam_id}/questions گرفته می‌شوند
         cursor.execute("""
-            SELECT e.*, u.full_name as teacher_name 
+            SELECT e.id, e.class_id, e.teacher_id, e.title, e.description, e.duration,
+                   e.version, e.created_at, u.full_name as teacher_name,
+                   (SELECT COUNT(*) FROM exam_questions q WHERE q.exam_id = e.id) as question_count
             FROM exams e 
             JOIN users u ON e.teacher_id = u.id 
             WHERE e.class_id = ?
         """, (class_id,))
         
         exams = cursor.fetchall()
-        conn.close()
         
         return {"exams": rows_to_dict_list(exams)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/exams/{exam_id}/submit")
-async def submit_exam(
+@app.get("/exams/{exam_id}/questions")
+@in_db_executor
+def get_exam_questions(
     exam_id: int,
-    exam_data: ExamSubmit,
-    current_user: int = Depends(get_current_student)
+    if_none_match: Optional[str] = Header(None),
+    principal: Principal = Depends(get_current_principal),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Calculate score (simple implementation)
-        score = len([a for a in exam_data.answers if a.get('correct', False)])
+        cursor.execute("""
+            SELECT e.version, c.teacher_id, en.student_id
+            FROM exams e
+            JOIN classes c ON e.class_id = c.id
+            LEFT JOIN enrollments en ON en.class_id = e.class_id AND en.student_id = ?
+            WHERE e.id = ?
+        """, (principal.user_id, exam_id))
+        exam = cursor.fetchone()
+        if not exam:
+            raise HTTPException(status_code=404, detail="Exam not found")
+        
+        # فقط دانش‌آموزان ثبت‌نام شده، معلم دوره و مدیر
+        if principal.role != 'admin' and exam['teacher_id'] != principal.user_id and not exam['student_id']:
+            raise HTTPException(status_code=403, detail="Not enrolled in this course")
+        
+        # بدنه از قبل سریال شده و بدون کلید پاسخ است
+        entry = compiled_exams.get(cursor, exam_id, exam['version'])
+        headers = {"ETag": entry.questions_etag, "Cache-Control": "private, no-cache"}
+        if etag_matches(if_none_match, entry.questions_etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=entry.questions_body, media_type="application/json", headers=headers)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting exam questions: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/exams/{exam_id}/submit")
+@in_db_executor
+def submit_exam(
+    exam_id: int,
+    exam_data: ExamSubmit,
+    current_user: int = Depends(get_current_student),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    def _submit(cursor):
+        cursor.execute("SELECT version FROM exams WHERE id = ?", (exam_id,))
+        exam = cursor.fetchone()
+        if not exam:
+            raise HTTPException(status_code=404, detail="Exam not found")
+        
+        # نمره با کلید پاسخ سرور محاسبه می‌شود، نه با فیلد correct ارسالی کلاینت
+        entry = compiled_exams.get(cursor, exam_id, exam['version'])
+        score, max_score, answer_masks = grade_submission(entry.compiled, exam_data.answers)
         
         cursor.execute(
-            "INSERT INTO exam_results (exam_id, student_id, score, answers) VALUES (?, ?, ?, ?)",
-            (exam_id, current_user, score, json.dumps(exam_data.answers))
+            """
+            INSERT INTO exam_results (exam_id, student_id, score, answers, answer_masks, max_score, graded_version)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (exam_id, current_user, score, json.dumps(exam_data.answers), answer_masks, max_score, exam['version'])
         )
+        # آمار آزمون به صورت افزایشی در همان تراکنش به‌روز می‌شود
+        record_submission(cursor, entry.compiled, answer_masks)
+        return score, max_score
+    
+    try:
+        # نسخه آزمون، کلید پاسخ، ثبت نتیجه و آمار در یک تراکنش BEGIN IMMEDIATE: تغییر کلید پاسخ
+        # (که نسخه را بالا می‌برد) نمی‌تواند بین خواندن نسخه و ثبت نتیجه جا بگیرد
+        score, max_score = immediate_transaction(conn, _submit)
+        
+        return {"success": True, "score": score, "max_score": max_score}
         
+    except HTTPException:
+        raise
+    except GradingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=409, detail="Exam already submitted")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _owned_exam(cursor, exam_id, teacher_id):
+    cursor.execute("SELECT id, version FROM exams WHERE id = ? AND teacher_id = ?", (exam_id, teacher_id))
+    exam = cursor.fetchone()
+    if not exam:
+        raise HTTPException(status_code=404, detail="Exam not found or access denied")
+    return exam
+
+@app.put("/teacher/exams/{exam_id}/answer-key")
+@in_db_executor
+def update_answer_key(
+    exam_id: int,
+    key_data: AnswerKeyUpdate,
+    current_user: int = Depends(get_current_teacher),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    def _update_key(cursor):
+        exam = _owned_exam(cursor, exam_id, current_user)
+        
+        # کلید فقط برای سؤال‌های موجود؛ ردیف کلید بدون سؤال max_score همه را بالا می‌برد
+        cursor.execute("SELECT position FROM exam_questions WHERE exam_id = ?", (exam_id,))
+        known = {row['position'] for row in cursor.fetchall()}
+        keys = []
+        for item in key_data.keys:
+            position = item.get("position")
+            if isinstance(position, bool) or not isinstance(position, int) or position < 0:
+                raise GradingError("Each key needs a non-negative integer position")
+            if position not in known:
+                raise GradingError(f"No question at position {position}")
+            keys.append(key_row(exam_id, position, item))
+        
+        cursor.executemany("""
+            INSERT INTO exam_answer_keys (exam_id, position, correct_mask, points, partial_credit)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(exam_id, position) DO UPDATE SET
+                correct_mask = excluded.correct_mask,
+                points = excluded.points,
+                partial_credit = excluded.partial_credit
+        """, keys)
+        
+        cursor.executemany("""
+            UPDATE exam_questions
+            SET points = ?, question_type = CASE WHEN question_type = 'text' THEN question_type ELSE ? END
+            WHERE exam_id = ? AND position = ?
+        """, [(row[3], question_type(row[2]), exam_id, row[1]) for row in keys])
+        
+        # نسخه جدید کلید: ورودی کش نسخه قبلی دیگر استفاده نمی‌شود و همه پاسخ‌ها دوباره تصحیح می‌شوند
+        # (کامپایل مستقیم و نه از کش، چون تراکنش هنوز commit نشده است)
+        version = exam['version'] + 1
+        cursor.execute("UPDATE exams SET version = ? WHERE id = ?", (version, exam_id))
+        compiled = load_compiled(cursor, exam_id, version)
+        regraded = regrade_exam(cursor, compiled)
+        rebuild_exam_stats(cursor, compiled)
+        return version, regraded
+    
+    try:
+        # خواندن نسخه تا commit در یک تراکنش BEGIN IMMEDIATE: دو ذخیره همزمان کلید نمی‌توانند یک
+        # شماره نسخه با دو کلید متفاوت بسازند (کش کامپایل شده بر اساس (exam_id, version) است)
+        version, regraded = immediate_transaction(conn, _update_key)
+        
+        return {"success": True, "version": version, "regraded": regraded}
+        
+    except HTTPException:
+        raise
+    except GradingError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error updating answer key: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/teacher/exams/{exam_id}/regrade")
+@in_db_executor
+def regrade_exam_results(
+    exam_id: int,
+    current_user: int = Depends(get_current_teacher),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    try:
+        cursor = conn.cursor()
+        exam = _owned_exam(cursor, exam_id, current_user)
+        
+        compiled = compiled_exams.get(cursor, exam_id, exam['version']).compiled
+        regraded = regrade_exam(cursor, compiled)
+        rebuild_exam_stats(cursor, compiled)
         conn.commit()
-        conn.close()
         
-        return {"success": True, "score": score}
+        return {"success": True, "version": exam['version'], "regraded": regraded}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error regrading exam: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# 📈 آمار آزمون‌ها برای معلم
+@app.get("/teacher/exams/{exam_id}/analytics")
+@in_db_executor
+def get_exam_analytics(
+    exam_id: int,
+    current_user: int = Depends(get_current_teacher),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    try:
+        cursor = conn.cursor()
+        _owned_exam(cursor, exam_id, current_user)
+        
+        return {"exam_id": exam_id, **exam_report(cursor, exam_id)}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting exam analytics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/teacher/courses/{course_id}/exam-analytics")
+@in_db_executor
+def get_course_exam_analytics(
+    course_id: int,
+    current_user: int = Depends(get_current_teacher),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    try:
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT id FROM classes WHERE id = ? AND teacher_id = ?", (course_id, current_user))
+        if not cursor.fetchone():
+            raise HTTPException(status_code=404, detail="Course not found or access denied")
+        
+        return {"course_id": course_id, **class_report(cursor, course_id)}
         
+    except HTTPException:
+        raise
     except Exception as e:
+        logger.error(f"Error getting course exam analytics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/exam-results")
-async def get_exam_results(current_user: int = Depends(get_current_user)):
+@in_db_executor
+def get_exam_results(
+    limit: Optional[int] = None,
+    cursor_token: Optional[str] = Query(None, alias="cursor"),
+    fields: Optional[str] = None,
+    current_user: int = Depends(get_current_user),
+    conn: sqlite3.Connection = Depends(get_db)
+):
     try:
-        conn = get_db_connection()
+        select_list, where_sql, where_params, order_by, limit, requested = \
+            EXAM_RESULTS_PAGE.query(fields, cursor_token, limit)
         cursor = conn.cursor()
         
-        cursor.execute("""
-            SELECT er.*, e.title as exam_name, c.title as class_name
+        cursor.execute(f"""
+            SELECT {select_list}
             FROM exam_results er
             JOIN exams e ON er.exam_id = e.id
             JOIN classes c ON e.class_id = c.id
-            WHERE er.student_id = ?
-            ORDER BY er.completed_at DESC
-        """, (current_user,))
+            WHERE er.student_id = ? AND {where_sql}
+            ORDER BY {order_by}
+            LIMIT ?
+        """, (current_user, *where_params, limit + 1))
         
-        results = cursor.fetchall()
-        conn.close()
+        results, next_cursor = EXAM_RESULTS_PAGE.finish(cursor.fetchall(), limit, requested)
         
-        return {"results": rows_to_dict_list(results)}
+        return {"results": results, "next_cursor": next_cursor}
+    except PaginationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # 📚 سیستم آموزشی جدید - APIهای مدیریت دروس
 @app.post("/teacher/courses/{course_id}/lessons")
-async def create_lesson(
+@in_db_executor
+def create_lesson(
     course_id: int, 
     lesson_data: LessonCreate, 
-    current_user: int = Depends(get_current_teacher)
+    current_user: int = Depends(get_current_teacher),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
     try:
         # بررسی اینکه معلم صاحب دوره است
-        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute(
@@ -1056,7 +1494,6 @@ async def create_lesson(
         
         lesson_id = cursor.lastrowid
         conn.commit()
-        conn.close()
         
         return {
             "success": True, 
@@ -1069,12 +1506,14 @@ async def create_lesson(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/courses/{course_id}/lessons")
-async def get_course_lessons(
+@in_db_executor
+def get_course_lessons(
     course_id: int,
-    current_user: int = Depends(get_current_user)
+    principal: Principal = Depends(get_current_principal),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
+    current_user = principal.user_id
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
         # بررسی اینکه کاربر در دوره ثبت‌نام کرده یا معلم دوره است
@@ -1090,10 +1529,7 @@ async def get_course_lessons(
             raise HTTPException(status_code=404, detail="Course not found")
         
         # اگر دانش‌آموز است و ثبت‌نام نکرده است
-        cursor.execute("SELECT role FROM users WHERE id = ?", (current_user,))
-        user_role = cursor.fetchone()['role']
-        
-        if user_role == 'student' and not course_info['student_id'] and course_info['teacher_id'] != current_user:
+        if principal.role == 'student' and not course_info['student_id'] and course_info['teacher_id'] != current_user:
             raise HTTPException(status_code=403, detail="Not enrolled in this course")
         
         # دریافت دروس
@@ -1104,7 +1540,6 @@ async def get_course_lessons(
         """, (course_id,))
         
         lessons = rows_to_dict_list(cursor.fetchall())
-        conn.close()
         
         return {"lessons": lessons}
         
@@ -1113,13 +1548,14 @@ async def get_course_lessons(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/lessons/{lesson_id}")
-async def update_lesson(
+@in_db_executor
+def update_lesson(
     lesson_id: int,
     lesson_data: LessonUpdate,
-    current_user: int = Depends(get_current_teacher)
+    current_user: int = Depends(get_current_teacher),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
         # بررسی مالکیت درس
@@ -1168,7 +1604,6 @@ async def update_lesson(
             )
         
         conn.commit()
-        conn.close()
         
         return {"success": True, "message": "Lesson updated successfully"}
         
@@ -1177,12 +1612,13 @@ async def update_lesson(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/lessons/{lesson_id}")
-async def delete_lesson(
+@in_db_executor
+def delete_lesson(
     lesson_id: int,
-    current_user: int = Depends(get_current_teacher)
+    current_user: int = Depends(get_current_teacher),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
         # بررسی مالکیت درس
@@ -1199,7 +1635,6 @@ async def delete_lesson(
         
         cursor.execute("DELETE FROM lessons WHERE id = ?", (lesson_id,))
         conn.commit()
-        conn.close()
         
         return {"success": True, "message": "Lesson deleted successfully"}
         
@@ -1208,12 +1643,14 @@ async def delete_lesson(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/lessons/{lesson_id}")
-async def get_lesson(
+@in_db_executor
+def get_lesson(
     lesson_id: int,
-    current_user: int = Depends(get_current_user)
+    principal: Principal = Depends(get_current_principal),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
+    current_user = principal.user_id
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -1228,12 +1665,7 @@ async def get_lesson(
             raise HTTPException(status_code=404, detail="Lesson not found")
         
         # بررسی دسترسی
-        cursor.execute("""
-            SELECT role FROM users WHERE id = ?
-        """, (current_user,))
-        user_role = cursor.fetchone()['role']
-        
-        if user_role == 'student':
+        if principal.role == 'student':
             cursor.execute("""
                 SELECT student_id FROM enrollments 
                 WHERE class_id = ? AND student_id = ?
@@ -1241,7 +1673,6 @@ async def get_lesson(
             if not cursor.fetchone():
                 raise HTTPException(status_code=403, detail="Not enrolled in this course")
         
-        conn.close()
         return {"lesson": row_to_dict(lesson)}
         
     except Exception as e:
@@ -1249,66 +1680,126 @@ async def get_lesson(
         raise HTTPException(status_code=500, detail=str(e))
 
 # 📊 سیستم ردیابی پیشرفت
+def _flush_progress(conn):
+    return progress_buffer.flush(conn)
+
 @app.post("/progress/lesson")
-async def update_lesson_progress(
+@in_db_executor
+def update_lesson_progress(
     progress_data: LessonProgressUpdate,
-    current_user: int = Depends(get_current_student)
+    current_user: int = Depends(get_current_student),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
-        # بررسی اینکه درس وجود دارد و دانش‌آموز در دوره ثبت‌نام کرده
-        cursor.execute("""
-            SELECT l.id, l.class_id, e.student_id 
-            FROM lessons l 
-            JOIN classes c ON l.class_id = c.id 
-            LEFT JOIN enrollments e ON c.id = e.class_id AND e.student_id = ?
-            WHERE l.id = ?
-        """, (current_user, progress_data.lesson_id))
-        
-        lesson_info = cursor.fetchone()
-        if not lesson_info or not lesson_info['student_id']:
-            raise HTTPException(status_code=404, detail="Lesson not found or not enrolled")
+        # heartbeatهای پشت سر هم برای یک درس: ثبت‌نام قبلاً بررسی شده و در بافر است
+        class_id = progress_buffer.pending_class_id(current_user, progress_data.lesson_id)
+        if class_id is None:
+            # بررسی اینکه درس وجود دارد و دانش‌آموز در دوره ثبت‌نام کرده
+            cursor.execute("""
+                SELECT l.id, l.class_id, e.student_id 
+                FROM lessons l 
+                JOIN classes c ON l.class_id = c.id 
+                LEFT JOIN enrollments e ON c.id = e.class_id AND e.student_id = ?
+                WHERE l.id = ?
+            """, (current_user, progress_data.lesson_id))
+            
+            lesson_info = cursor.fetchone()
+            if not lesson_info or not lesson_info['student_id']:
+                raise HTTPException(status_code=404, detail="Lesson not found or not enrolled")
+            class_id = lesson_info['class_id']
         
-        # بروزرسانی یا ایجاد رکورد پیشرفت
-        cursor.execute("""
-            INSERT OR REPLACE INTO lesson_progress 
-            (student_id, lesson_id, class_id, is_completed, progress_percentage, last_position, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
-        """, (
+        # بروزرسانی در بافر ادغام می‌شود و به صورت دسته‌ای در یک تراکنش نوشته می‌شود
+        row = progress_row(
             current_user,
             progress_data.lesson_id,
-            lesson_info['class_id'],
+            class_id,
             progress_data.is_completed,
             progress_data.progress_percentage,
             progress_data.last_position
-        ))
-        
-        # اگر درس کامل شده است، تاریخ تکمیل را تنظیم کن
-        if progress_data.is_completed:
-            cursor.execute("""
-                UPDATE lesson_progress 
-                SET completed_at = CURRENT_TIMESTAMP 
-                WHERE student_id = ? AND lesson_id = ?
-            """, (current_user, progress_data.lesson_id))
-        
-        conn.commit()
-        conn.close()
+        )
+        buffer_full = progress_buffer.add(row)
+        if buffer_full or progress_buffer.durability == DURABILITY_SYNC:
+            progress_buffer.flush(conn)
         
         return {"success": True, "message": "Progress updated successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating progress: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/progress/lessons/batch")
+@in_db_executor
+def update_lesson_progress_batch(
+    updates: List[LessonProgressUpdate],
+    current_user: int = Depends(get_current_student),
+    conn: sqlite3.Connection = Depends(get_db)
+):
+    if len(updates) > MAX_PROGRESS_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_PROGRESS_BATCH} updates per batch")
+    try:
+        cursor = conn.cursor()
+        
+        # اگر یک درس چند بار آمده باشد، آخرین مورد اعمال می‌شود
+        latest = {}
+        for index, item in enumerate(updates):
+            latest[item.lesson_id] = index
+        
+        # بررسی ثبت‌نام برای همه دروس با یک کوئری
+        lesson_ids = list(latest)
+        allowed = {}
+        if lesson_ids:
+            cursor.execute(f"""
+                SELECT l.id, l.class_id
+                FROM lessons l
+                JOIN enrollments e ON e.class_id = l.class_id AND e.student_id = ?
+                WHERE l.id IN ({', '.join('?' * len(lesson_ids))})
+            """, (current_user, *lesson_ids))
+            allowed = {row['id']: row['class_id'] for row in cursor.fetchall()}
+        
+        rows = []
+        results = []
+        for index, item in enumerate(updates):
+            if latest[item.lesson_id] != index:
+                results.append({"lesson_id": item.lesson_id, "status": "superseded"})
+            elif item.lesson_id not in allowed:
+                results.append({"lesson_id": item.lesson_id, "status": "not_found_or_not_enrolled"})
+            else:
+                rows.append(progress_row(
+                    current_user,
+                    item.lesson_id,
+                    allowed[item.lesson_id],
+                    item.is_completed,
+                    item.progress_percentage,
+                    item.last_position
+                ))
+                results.append({"lesson_id": item.lesson_id, "status": "updated"})
+        
+        if rows:
+            # داده‌های قدیمی‌تر بافر اول نوشته می‌شوند تا روی این دسته ننشینند
+            progress_buffer.flush(conn)
+            cursor.executemany(PROGRESS_UPSERT_SQL, rows)
+            conn.commit()
+        
+        return {"success": True, "updated": len(rows), "results": results}
+        
+    except Exception as e:
+        logger.error(f"Error updating progress batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/progress/course/{course_id}")
-async def get_course_progress(
+@in_db_executor
+def get_course_progress(
     course_id: int,
-    current_user: int = Depends(get_current_user)
+    current_user: int = Depends(get_current_user),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
     try:
-        conn = get_db_connection()
+        # به‌روزرسانی‌های بافر شده قبل از خواندن نوشته می‌شوند
+        progress_buffer.flush(conn)
         cursor = conn.cursor()
         
         # دریافت اطلاعات پیشرفت برای دوره
@@ -1323,16 +1814,18 @@ async def get_course_progress(
         
         progress_data = rows_to_dict_list(cursor.fetchall())
         
-        # محاسبه پیشرفت کلی دوره
-        total_lessons = len(progress_data)
-        completed_lessons = sum(1 for lesson in progress_data if lesson['is_completed'])
-        overall_progress = (completed_lessons / total_lessons * 100) if total_lessons > 0 else 0
-        
-        conn.close()
+        # مجموع‌ها از جدول خلاصه خوانده می‌شوند؛ برای کاربر ثبت‌نام نشده از همین فهرست حساب می‌شوند
+        summary = get_summary(cursor, current_user, course_id)
+        if summary:
+            completed_lessons = summary['completed_lessons']
+            total_lessons = summary['total_published_lessons']
+        else:
+            total_lessons = len(progress_data)
+            completed_lessons = sum(1 for lesson in progress_data if lesson['is_completed'])
         
         return {
             "progress": progress_data,
-            "overall_progress": round(overall_progress, 2),
+            "overall_progress": percentage(completed_lessons, total_lessons),
             "completed_lessons": completed_lessons,
             "total_lessons": total_lessons
         }
@@ -1342,12 +1835,13 @@ async def get_course_progress(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/teacher/courses/{course_id}/progress")
-async def get_course_progress_for_teacher(
+@in_db_executor
+def get_course_progress_for_teacher(
     course_id: int,
-    current_user: int = Depends(get_current_teacher)
+    current_user: int = Depends(get_current_teacher),
+    conn: sqlite3.Connection = Depends(get_db)
 ):
     try:
-        conn = get_db_connection()
         cursor = conn.cursor()
         
         # بررسی مالکیت دوره
@@ -1355,30 +1849,32 @@ async def get_course_progress_for_teacher(
         if not cursor.fetchone():
             raise HTTPException(status_code=404, detail="Course not found or access denied")
         
-        # دریافت پیشرفت همه دانش‌آموزان
+        progress_buffer.flush(conn)
+        
+        # دریافت پیشرفت همه دانش‌آموزان از جدول خلاصه (دوره‌های بدون درس منتشر شده مثل قبل حذف می‌شوند)
         cursor.execute("""
-            SELECT u.id as student_id, u.full_name, 
-                   COUNT(l.id) as total_lessons,
-                   COUNT(CASE WHEN lp.is_completed THEN 1 END) as completed_lessons,
-                   ROUND(COUNT(CASE WHEN lp.is_completed THEN 1 END) * 100.0 / COUNT(l.id), 2) as progress_percentage
-            FROM users u
-            JOIN enrollments e ON u.id = e.student_id
-            JOIN lessons l ON e.class_id = l.class_id AND l.is_published = TRUE
-            LEFT JOIN lesson_progress lp ON l.id = lp.lesson_id AND lp.student_id = u.id
-            WHERE e.class_id = ?
-            GROUP BY u.id, u.full_name
+            SELECT u.id as student_id, u.full_name,
+                   s.total_published_lessons as total_lessons,
+                   s.completed_lessons,
+                   ROUND(s.completed_lessons * 100.0 / s.total_published_lessons, 2) as progress_percentage
+            FROM course_progress_summary s
+            JOIN users u ON u.id = s.student_id
+            WHERE s.class_id = ? AND s.total_published_lessons > 0
             ORDER BY u.full_name
         """, (course_id,))
         
         student_progress = rows_to_dict_list(cursor.fetchall())
-        conn.close()
         
         return {"student_progress": student_progress}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting teacher course progress: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+startup.mark("module body: models and routes")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
@@ -0,0 +1,243 @@
+# db_pool.py - مدیریت اتصال‌های SQLite با pool محدود و استفاده مجدد برای هر thread
+import asyncio
+import sqlite3
+import os
+import random
+import threading
+import time
+import logging
+
+from executors import db_executor
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAهای پیش‌فرض؛ با متغیرهای محیطی قابل تغییر هستند
+DEFAULT_PRAGMAS = {
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", 64 * 1024 * 1024)),
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", -16000)),
+    "temp_store": "MEMORY",
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+}
+
+
+def get_db_path():
+    if 'QURAN_DB_PATH' in os.environ:
+        return os.environ['QURAN_DB_PATH']
+    if 'RENDER' in os.environ:
+        return '/tmp/quran_db.sqlite3'
+    return 'quran_db.sqlite3'
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, db_path, max_size=8, timeout=10.0, pragmas=None, health_check_interval=30.0,
+                 factory=sqlite3.Connection):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.health_check_interval = health_check_interval
+        self.connect_hooks = []   # مثلاً ثبت توابع SQL روی هر اتصال جدید
+        self.factory = factory    # کلاس اتصال sqlite3 (مثلاً ProfilingConnection)
+
+        self._lock = threading.Condition()
+        self._idle = []          # اتصال‌های آزاد
+        self._owner = {}         # id(conn) -> آخرین thread استفاده‌کننده
+        self._last_used = {}     # id(conn) -> زمان آخرین بازگشت به pool
+        self._size = 0
+        self._closed = False
+        self.stats = {"created": 0, "reused": 0, "thread_hits": 0, "discarded": 0, "waits": 0, "busy_retries": 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, factory=self.factory)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        for hook in self.connect_hooks:
+            hook(conn)
+        self.stats["created"] += 1
+        return conn
+
+    def _is_healthy(self, conn):
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self.health_check_interval:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _take_idle(self):
+        # اولویت با اتصالی است که قبلاً توسط همین thread استفاده شده
+        me = threading.get_ident()
+        for i in range(len(self._idle) - 1, -1, -1):
+            if self._owner.get(id(self._idle[i])) == me:
+                self.stats["thread_hits"] += 1
+                return self._idle.pop(i)
+        return self._idle.pop()
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolTimeout("Connection pool is closed")
+                if self._idle:
+                    conn = self._take_idle()
+                    if self._is_healthy(conn):
+                        self.stats["reused"] += 1
+                        break
+                    self._discard(conn)
+                    continue
+                if self._size < self.max_size:
+                    self._size += 1
+                    try:
+                        conn = self._connect()
+                    except Exception:
+                        self._size -= 1
+                        raise
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self.stats["waits"] += 1
+                self._lock.wait(remaining)
+            self._owner[id(conn)] = threading.get_ident()
+            return conn
+
+    def release(self, conn):
+        # تراکنش نیمه‌کاره به pool برنمی‌گردد
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            if self._closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._idle.append(conn)
+            self._lock.notify()
+
+    def _discard(self, conn):
+        self._owner.pop(id(conn), None)
+        self._last_used.pop(id(conn), None)
+        self._size -= 1
+        self.stats["discarded"] += 1
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def connection(self):
+        return _PooledConnection(self)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                self._discard(self._idle.pop())
+            self._lock.notify_all()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, size=self._size, idle=len(self._idle), max_size=self.max_size)
+
+
+class _PooledConnection:
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    def __enter__(self):
+        self.conn = self.pool.acquire()
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.pool.release(self.conn)
+        self.conn = None
+        return False
+
+
+pool = ConnectionPool(
+    get_db_path(),
+    max_size=int(os.environ.get("DB_POOL_SIZE", 8)),
+    timeout=float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+)
+
+
+IMMEDIATE_RETRIES = int(os.environ.get("SQLITE_IMMEDIATE_RETRIES", 5))
+IMMEDIATE_RETRY_DELAY = float(os.environ.get("SQLITE_IMMEDIATE_RETRY_DELAY", 0.02))
+
+# نویسنده‌های همین process پشت یک قفل صف می‌شوند تا به جای polling در busy handler
+# به ترتیب اجرا شوند؛ رقابت با workerهای دیگر با busy_timeout و retry مدیریت می‌شود
+_write_lock = threading.Lock()
+
+
+def _is_busy(error):
+    code = getattr(error, "sqlite_errorcode", None)
+    if code is not None:
+        return code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error)
+    return "locked" in message or "busy" in message
+
+
+def immediate_transaction(conn, work, retries=IMMEDIATE_RETRIES, delay=IMMEDIATE_RETRY_DELAY):
+    # work(cursor) داخل BEGIN IMMEDIATE اجرا و commit می‌شود؛ قفل نوشتن از ابتدا گرفته می‌شود تا
+    # خواندن و نوشتن بعدی بین دو تراکنش جا به جا نشوند. در SQLITE_BUSY کل work دوباره اجرا می‌شود.
+    # تراکنش باز فراخوان commit نمی‌شود: نوشتن‌های قبلی باید جزو work باشند یا قبل از آن commit شوند
+    if conn.in_transaction:
+        raise sqlite3.ProgrammingError("immediate_transaction called inside an open transaction")
+    attempt = 0
+    while True:
+        try:
+            with _write_lock:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    result = work(conn.cursor())
+                    conn.commit()
+                    return result
+                except BaseException:
+                    conn.rollback()
+                    raise
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e) or attempt >= retries:
+                raise
+            attempt += 1
+            pool.stats["busy_retries"] += 1
+            time.sleep(delay * (2 ** attempt) * (0.5 + random.random()))
+
+
+# هر گرفتن اتصال از مسیر async از یکی از دو دروازه می‌گذرد: درخواست‌ها (pool منهای RESERVED_CONNECTIONS) و
+# health/کارهای پس‌زمینه (RESERVED_CONNECTIONS). مجموع دو دروازه اندازه pool است، پس pool.acquire که در
+# db_executor اجرا می‌شود منتظر نمی‌ماند و انتظار برای اتصال فقط await روی semaphore است، نه block شدن event loop
+RESERVED_CONNECTIONS = 2
+_request_slots = asyncio.Semaphore(max(1, pool.max_size - RESERVED_CONNECTIONS))
+_reserved_slots = asyncio.Semaphore(RESERVED_CONNECTIONS)
+
+
+async def get_db():
+    # FastAPI dependency: یک اتصال برای کل درخواست (auth و endpoint مشترک)
+    async with _request_slots:
+        conn = await db_executor.run(pool.acquire)
+        try:
+            yield conn
+        finally:
+            pool.release(conn)
+
+
+def _with_connection(func, args):
+    with pool.connection() as conn:
+        return func(conn, *args)
+
+
+async def run_with_connection(func, *args, reserved=False):
+    # func(conn, *args) با یک اتصال pool در db_executor اجرا می‌شود؛ reserved برای health و کارهای پس‌زمینه
+    async with (_reserved_slots if reserved else _request_slots):
+        return await db_executor.run(_with_connection, func, args)
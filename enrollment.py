@@ -0,0 +1,67 @@
+# enrollment.py - ثبت‌نام پولی در یک تراکنش: بررسی ظرفیت با enrolled_count، پرداخت از کیف پول
+# دانش‌آموز و واریز به معلم از طریق دفتر کل، و ثبت enrollment
+from ledger import append_entry
+
+
+class EnrollmentError(Exception):
+    status_code = 400
+
+
+class ClassNotFound(EnrollmentError):
+    status_code = 404
+
+
+class AlreadyEnrolled(EnrollmentError):
+    status_code = 400
+
+
+class ClassFull(EnrollmentError):
+    status_code = 409
+
+
+def recount_enrollments(cursor):
+    # شمارش کامل (ستون تازه یا بعد از بارگذاری انبوه بدون trigger)
+    cursor.execute("""
+        UPDATE classes SET enrolled_count = (
+            SELECT COUNT(*) FROM enrollments e WHERE e.class_id = classes.id AND e.status = 'active'
+        )
+    """)
+
+
+def enroll(cursor, student_id, class_id, from_waitlist=False):
+    # باید داخل immediate_transaction صدا زده شود؛ هر خطا کل تراکنش را برمی‌گرداند.
+    # تا وقتی صف انتظار خالی نشده، جای خالی فقط از طریق صف (from_waitlist) پر می‌شود
+    cursor.execute("""
+        SELECT c.teacher_id, c.title, c.price, c.max_students, c.enrolled_count,
+               EXISTS (SELECT 1 FROM enrollments e WHERE e.class_id = c.id AND e.student_id = ?) AS enrolled,
+               EXISTS (SELECT 1 FROM class_waitlist w WHERE w.class_id = c.id AND w.status = 'waiting') AS queued
+        FROM classes c
+        WHERE c.id = ? AND c.status = 'active'
+    """, (student_id, class_id))
+    course = cursor.fetchone()
+    if not course:
+        raise ClassNotFound("Class not found")
+    teacher_id, title, price, max_students, enrolled_count, enrolled, queued = course
+    if enrolled:
+        raise AlreadyEnrolled("Already enrolled in this class")
+    if max_students is not None and (enrolled_count >= max_students or (queued and not from_waitlist)):
+        raise ClassFull("Class is full; join the waitlist")
+
+    cursor.execute(
+        "INSERT INTO enrollments (student_id, class_id, status) VALUES (?, ?, 'active')",
+        (student_id, class_id)
+    )
+    enrollment_id = cursor.lastrowid
+
+    # پرداخت با کلید idempotency وابسته به همین ثبت‌نام؛ موجودی منفی نمی‌شود (InsufficientFunds)
+    price = round(price or 0, 2)
+    if price > 0:
+        append_entry(
+            cursor, student_id, -price, 'enrollment_payment', f"Enrollment: {title}",
+            idempotency_key=f"enrollment:{enrollment_id}", require_funds=True
+        )
+        append_entry(
+            cursor, teacher_id, price, 'enrollment_income', f"Enrollment: {title}",
+            idempotency_key=f"enrollment:{enrollment_id}"
+        )
+    return {"enrollment_id": enrollment_id, "price": price}
@@ -0,0 +1,227 @@
+# exam_analytics.py - آمار افزایشی آزمون‌ها: میانگین/واریانس جاری (Welford)، هیستوگرام قابل ادغام و آمار هر سؤال
+# نمره‌ها به درصد از حداکثر نمره تبدیل می‌شوند تا آمار آزمون‌های یک دوره قابل ادغام باشد
+import math
+
+from grading import load_masks
+
+BUCKETS = 101          # سطل‌های یک درصدی 0..100
+PERCENTILES = (10, 25, 50, 75, 90)
+HISTOGRAM_BINS = 10    # سطل‌های نمایش داده شده (هر کدام 10 درصد)
+
+# الگوریتم Welford در یک upsert: همه عبارت‌های SET مقدار قبلی ستون‌ها را می‌بینند
+STATS_UPSERT_SQL = """
+    INSERT INTO exam_stats (exam_id, n, mean, m2, min_score, max_score)
+    VALUES (?, 1, ?, 0, ?, ?)
+    ON CONFLICT(exam_id) DO UPDATE SET
+        n = n + 1,
+        mean = mean + (excluded.mean - mean) / (n + 1),
+        m2 = m2 + (excluded.mean - mean) * (excluded.mean - mean) * n / (n + 1.0),
+        min_score = min(coalesce(min_score, excluded.min_score), excluded.min_score),
+        max_score = max(coalesce(max_score, excluded.max_score), excluded.max_score)
+"""
+
+BUCKET_UPSERT_SQL = """
+    INSERT INTO exam_score_buckets (exam_id, bucket, count) VALUES (?, ?, ?)
+    ON CONFLICT(exam_id, bucket) DO UPDATE SET count = count + excluded.count
+"""
+
+ITEM_UPSERT_SQL = """
+    INSERT INTO exam_item_stats (exam_id, position, credit_sum, correct_count, correct_score_sum)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(exam_id, position) DO UPDATE SET
+        credit_sum = credit_sum + excluded.credit_sum,
+        correct_count = correct_count + excluded.correct_count,
+        correct_score_sum = correct_score_sum + excluded.correct_score_sum
+"""
+
+
+def percent_score(score, max_score):
+    return score * 100.0 / max_score if max_score else None
+
+
+def bucket_of(percent):
+    return min(BUCKETS - 1, max(0, int(percent)))
+
+
+def _item_rows(exam_id, compiled, item_scores, percent):
+    rows = []
+    for position, points, earned in zip(compiled.positions, compiled.points, item_scores):
+        full = 1 if points and earned >= points else 0
+        rows.append((exam_id, position, earned / points if points else 0.0, full, percent if full else 0.0))
+    return rows
+
+
+def record_submission(cursor, compiled, answer_masks):
+    # در همان تراکنش ثبت پاسخ صدا زده می‌شود؛ هزینه: O(تعداد سؤال‌ها)
+    item_scores = compiled.item_scores(compiled.align(load_masks(answer_masks)))
+    percent = percent_score(round(sum(item_scores), 2), compiled.max_score)
+    if percent is None:
+        return
+    exam_id = compiled.exam_id
+    cursor.execute(STATS_UPSERT_SQL, (exam_id, percent, percent, percent))
+    cursor.execute(BUCKET_UPSERT_SQL, (exam_id, bucket_of(percent), 1))
+    cursor.executemany(ITEM_UPSERT_SQL, _item_rows(exam_id, compiled, item_scores, percent))
+
+
+def rebuild_exam_stats(cursor, compiled):
+    # بعد از تصحیح مجدد: آمار آزمون در یک گذر روی answer_masks از نو ساخته می‌شود
+    exam_id = compiled.exam_id
+    for table in ("exam_stats", "exam_score_buckets", "exam_item_stats"):
+        cursor.execute(f"DELETE FROM {table} WHERE exam_id = ?", (exam_id,))
+    if not compiled.max_score:
+        return
+    cursor.execute("SELECT answer_masks FROM exam_results WHERE exam_id = ? AND answer_masks IS NOT NULL", (exam_id,))
+    n = 0
+    mean = m2 = 0.0
+    low = high = None
+    buckets = {}
+    items = [[0.0, 0, 0.0] for _ in compiled.positions]
+    for (answer_masks,) in cursor.fetchall():
+        aligned = compiled.align(load_masks(answer_masks))
+        item_scores = compiled.item_scores(aligned)
+        percent = percent_score(round(sum(item_scores), 2), compiled.max_score)
+        n += 1
+        delta = percent - mean
+        mean += delta / n
+        m2 += delta * (percent - mean)
+        low = percent if low is None else min(low, percent)
+        high = percent if high is None else max(high, percent)
+        bucket = bucket_of(percent)
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+        for acc, row in zip(items, _item_rows(exam_id, compiled, item_scores, percent)):
+            acc[0] += row[2]
+            acc[1] += row[3]
+            acc[2] += row[4]
+    if not n:
+        return
+    cursor.execute(
+        "INSERT INTO exam_stats (exam_id, n, mean, m2, min_score, max_score) VALUES (?, ?, ?, ?, ?, ?)",
+        (exam_id, n, mean, m2, low, high)
+    )
+    cursor.executemany(BUCKET_UPSERT_SQL, [(exam_id, bucket, count) for bucket, count in buckets.items()])
+    cursor.executemany(ITEM_UPSERT_SQL, [
+        (exam_id, position, *acc) for position, acc in zip(compiled.positions, items)
+    ])
+
+
+def merge_stats(parts):
+    # ادغام (n, mean, m2) چند آزمون با فرمول Chan
+    n, mean, m2 = 0, 0.0, 0.0
+    for part_n, part_mean, part_m2 in parts:
+        if not part_n:
+            continue
+        total = n + part_n
+        delta = part_mean - mean
+        mean += delta * part_n / total
+        m2 += part_m2 + delta * delta * n * part_n / total
+        n = total
+    return n, mean, m2
+
+
+def percentiles(buckets, n):
+    # buckets: {سطل: تعداد}؛ مقدار هر صدک = سطلی که شمارش تجمعی به آن رتبه می‌رسد
+    result = {}
+    if not n:
+        return {f"p{p}": None for p in PERCENTILES}
+    cumulative = 0
+    targets = [(p, math.ceil(p / 100 * n)) for p in PERCENTILES]
+    index = 0
+    for bucket in range(BUCKETS):
+        cumulative += buckets.get(bucket, 0)
+        while index < len(targets) and cumulative >= targets[index][1]:
+            result[f"p{targets[index][0]}"] = bucket
+            index += 1
+    return result
+
+
+def histogram(buckets):
+    width = (BUCKETS - 1) // HISTOGRAM_BINS
+    bins = [0] * HISTOGRAM_BINS
+    for bucket, count in buckets.items():
+        bins[min(HISTOGRAM_BINS - 1, bucket // width)] += count
+    return [
+        {"from": i * width, "to": (i + 1) * width, "count": count}
+        for i, count in enumerate(bins)
+    ]
+
+
+def _summary(n, mean, m2, low, high, buckets):
+    return {
+        "submissions": n,
+        "mean_percent": round(mean, 2) if n else None,
+        "stddev_percent": round(math.sqrt(m2 / n), 2) if n else None,
+        "min_percent": round(low, 2) if low is not None else None,
+        "max_percent": round(high, 2) if high is not None else None,
+        "percentiles": percentiles(buckets, n),
+        "histogram": histogram(buckets),
+    }
+
+
+def exam_report(cursor, exam_id):
+    cursor.execute("SELECT n, mean, m2, min_score, max_score FROM exam_stats WHERE exam_id = ?", (exam_id,))
+    row = cursor.fetchone()
+    n, mean, m2, low, high = tuple(row) if row else (0, 0.0, 0.0, None, None)
+    cursor.execute("SELECT bucket, count FROM exam_score_buckets WHERE exam_id = ?", (exam_id,))
+    buckets = dict(cursor.fetchall())
+    report = _summary(n, mean, m2, low, high, buckets)
+
+    # difficulty: میانگین سهم نمره سؤال؛ discrimination: همبستگی point-biserial نمره کامل سؤال با درصد کل
+    stddev = math.sqrt(m2 / n) if n else 0.0
+    cursor.execute("""
+        SELECT s.position, q.prompt, s.credit_sum, s.correct_count, s.correct_score_sum
+        FROM exam_item_stats s
+        LEFT JOIN exam_questions q ON q.exam_id = s.exam_id AND q.position = s.position
+        WHERE s.exam_id = ?
+        ORDER BY s.position
+    """, (exam_id,))
+    questions = []
+    for position, prompt, credit_sum, correct_count, correct_score_sum in cursor.fetchall():
+        discrimination = None
+        if n and stddev and 0 < correct_count < n:
+            p = correct_count / n
+            mean_correct = correct_score_sum / correct_count
+            mean_other = (mean * n - correct_score_sum) / (n - correct_count)
+            discrimination = round((mean_correct - mean_other) / stddev * math.sqrt(p * (1 - p)), 3)
+        questions.append({
+            "position": position,
+            "prompt": prompt,
+            "difficulty": round(credit_sum / n, 3) if n else None,
+            "full_credit_rate": round(correct_count / n, 3) if n else None,
+            "discrimination": discrimination,
+        })
+    report["questions"] = questions
+    return report
+
+
+def class_report(cursor, class_id):
+    cursor.execute("""
+        SELECT e.id, e.title, s.n, s.mean, s.m2, s.min_score, s.max_score
+        FROM exams e
+        LEFT JOIN exam_stats s ON s.exam_id = e.id
+        WHERE e.class_id = ?
+        ORDER BY e.id
+    """, (class_id,))
+    exams = cursor.fetchall()
+    n, mean, m2 = merge_stats((row[2] or 0, row[3] or 0.0, row[4] or 0.0) for row in exams)
+    lows = [row[5] for row in exams if row[5] is not None]
+    highs = [row[6] for row in exams if row[6] is not None]
+    cursor.execute("""
+        SELECT b.bucket, SUM(b.count)
+        FROM exams e
+        JOIN exam_score_buckets b ON b.exam_id = e.id
+        WHERE e.class_id = ?
+        GROUP BY b.bucket
+    """, (class_id,))
+    buckets = dict(cursor.fetchall())
+    report = _summary(n, mean, m2, min(lows, default=None), max(highs, default=None), buckets)
+    report["exams"] = [
+        {
+            "exam_id": row[0],
+            "title": row[1],
+            "submissions": row[2] or 0,
+            "mean_percent": round(row[3], 2) if row[2] else None,
+            "stddev_percent": round(math.sqrt(row[4] / row[2]), 2) if row[2] else None,
+        }
+        for row in exams
+    ]
+    return report
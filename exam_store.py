@@ -0,0 +1,105 @@
+# exam_store.py - ذخیره سؤال‌های آزمون در جدول مستقل و کش LRU آزمون‌های کامپایل شده
+# هر ورودی کش (exam_id, version) شامل آرایه‌های تصحیح و بدنه JSON آماده سؤال‌ها (بدون کلید پاسخ) است
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from grading import load_compiled, question_type, to_mask, GradingError
+from response_cache import dumps, make_etag
+
+
+def question_rows(exam_id, questions):
+    # فقط بخش عمومی سؤال ذخیره می‌شود؛ correct در exam_answer_keys است
+    rows = []
+    for position, question in enumerate(questions):
+        correct = question.get("correct")
+        kind = question.get("type") or ("text" if correct is None else question_type(to_mask(correct)))
+        options = question.get("options")
+        rows.append((
+            exam_id,
+            position,
+            str(question.get("question") or question.get("prompt") or question.get("text") or ""),
+            kind,
+            json.dumps(options, ensure_ascii=False) if options is not None else None,
+            float(question.get("points", 1)),
+        ))
+    return rows
+
+
+def insert_questions(cursor, exam_id, questions):
+    cursor.executemany("""
+        INSERT INTO exam_questions (exam_id, position, prompt, question_type, options, points)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, question_rows(exam_id, questions))
+
+
+class ExamEntry:
+    __slots__ = ("compiled", "questions_body", "questions_etag")
+
+    def __init__(self, compiled, questions_body):
+        self.compiled = compiled
+        self.questions_body = questions_body
+        self.questions_etag = make_etag(questions_body)
+
+
+class CompiledExamCache:
+    # کلید (exam_id, version): تغییر کلید پاسخ نسخه را بالا می‌برد و ورودی قدیمی با LRU بیرون می‌رود
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, cursor, exam_id, version):
+        key = (exam_id, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        entry = self._load(cursor, exam_id, version)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def _load(self, cursor, exam_id, version):
+        cursor.execute("""
+            SELECT position, prompt, question_type, options, points
+            FROM exam_questions
+            WHERE exam_id = ?
+            ORDER BY position
+        """, (exam_id,))
+        questions = [
+            {
+                "position": row[0],
+                "prompt": row[1],
+                "type": row[2],
+                "options": json.loads(row[3]) if row[3] is not None else None,
+                "points": row[4],
+            }
+            for row in cursor.fetchall()
+        ]
+        body = dumps({"exam_id": exam_id, "version": version, "questions": questions})
+        return ExamEntry(load_compiled(cursor, exam_id, version), body)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+compiled_exams = CompiledExamCache(max_entries=int(os.environ.get("EXAM_CACHE_SIZE", 128)))
@@ -0,0 +1,124 @@
+# executors.py - اجرای کارهای blocking (sqlite3 و bcrypt) خارج از event loop
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# زمان اجرای کارهای هر درخواست در executorها به تفکیک نام executor ({"db": ثانیه})؛ middleware متریک‌ها آن را می‌سازد
+request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class ManagedExecutor:
+    def __init__(self, name, max_workers):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-worker")
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+        self.run_time_total = 0.0
+
+    def _call(self, submitted_at, timing, func, args, kwargs):
+        started_at = time.perf_counter()
+        waited = started_at - submitted_at
+        with self._lock:
+            self.queued -= 1
+            self.running += 1
+            self.wait_time_total += waited
+            if waited > self.wait_time_max:
+                self.wait_time_max = waited
+        ok = False
+        try:
+            result = func(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            elapsed = time.perf_counter() - started_at
+            timing[0] = elapsed
+            with self._lock:
+                self.running -= 1
+                self.run_time_total += elapsed
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+
+    async def run_timed(self, func, *args, **kwargs):
+        # خروجی: (نتیجه، زمان اجرا در worker بدون انتظار در صف)
+        with self._lock:
+            self.queued += 1
+        loop = asyncio.get_running_loop()
+        timing = [0.0]
+        try:
+            result = await loop.run_in_executor(
+                self._executor,
+                functools.partial(self._call, time.perf_counter(), timing, func, args, kwargs)
+            )
+        finally:
+            # روی thread event loop و در context همان درخواست ثبت می‌شود
+            timings = request_timings.get()
+            if timings is not None:
+                timings[self.name] = timings.get(self.name, 0.0) + timing[0]
+        return result, timing[0]
+
+    async def run(self, func, *args, **kwargs):
+        result, _ = await self.run_timed(func, *args, **kwargs)
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queued,
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+                "wait_time_avg_ms": round(self.wait_time_total / finished * 1000, 3) if finished else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+                "run_time_avg_ms": round(self.run_time_total / finished * 1000, 3) if finished else 0.0,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+# DB: هر worker حداکثر یک اتصال از pool نگه می‌دارد؛ دو worker اضافه برای کارهای پس‌زمینه
+db_executor = ManagedExecutor(
+    "db", int(os.environ.get("DB_EXECUTOR_WORKERS", int(os.environ.get("DB_POOL_SIZE", 8)) + 2))
+)
+# bcrypt قفل GIL را آزاد می‌کند، پس thread pool برای موازی‌سازی کافی است
+cpu_executor = ManagedExecutor("cpu", int(os.environ.get("CPU_EXECUTOR_WORKERS", os.cpu_count() or 2)))
+
+
+async def run_db(func, *args, **kwargs):
+    return await db_executor.run(func, *args, **kwargs)
+
+
+async def run_cpu(func, *args, **kwargs):
+    return await cpu_executor.run(func, *args, **kwargs)
+
+
+def in_db_executor(func):
+    # handler همگام را به یک coroutine تبدیل می‌کند که در db_executor اجرا می‌شود؛
+    # امضای تابع برای FastAPI از طریق __wrapped__ حفظ می‌شود
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await db_executor.run(func, *args, **kwargs)
+    return wrapper
+
+
+def executor_stats():
+    return {"db": db_executor.snapshot(), "cpu": cpu_executor.snapshot()}
+
+
+def shutdown_executors():
+    db_executor.shutdown()
+    cpu_executor.shutdown()
@@ -6,6 +6,7 @@ import requests
 import json
 import os
 import sys
+import uuid
 from datetime import datetime, timedelta
 
 class QuranApp(toga.App):
@@ -525,6 +526,8 @@ class QuranApp(toga.App):
         response = self.make_authenticated_request("GET", "/wallet/balance")
         if response and response.status_code == 200:
             balance = response.json().get('balance', 0)
+            # کلید یکتا برای این واریز؛ تلاش دوباره بعد از timeout دو بار واریز نمی‌کند
+            self.deposit_key = str(uuid.uuid4())
         
             # ایجاد صفحه کیف پول
             main_box = toga.Box(style=Pack(direction=COLUMN, padding=20))
@@ -649,7 +652,8 @@ class QuranApp(toga.App):
                 return
         
             response = self.make_authenticated_request("POST", "/wallet/deposit", 
-                                                 json={"amount": amount, "description": "Deposit from app"})
+                                                 json={"amount": amount, "description": "Deposit from app"},
+                                                 headers={"Idempotency-Key": self.deposit_key})
         
             if response and response.status_code == 200:
                 new_balance = response.json().get('new_balance', 0)
@@ -0,0 +1,164 @@
+# grading.py - تصحیح آزمون در سمت سرور با کلید پاسخ ذخیره شده در دیتابیس
+# هر سؤال به یک bitmask از گزینه‌های درست تبدیل می‌شود (بیت i = گزینه i)؛ پاسخ دانش‌آموز هم
+# همین شکل را دارد. تصحیح یک حلقه پایتون روی سؤال‌هاست که هر پاسخ را با عملگرهای بیتی با mask کلید
+# مقایسه می‌کند؛ array فقط کلید کامپایل شده را فشرده نگه می‌دارد و محاسبه برداری (SIMD/numpy) در کار نیست
+import json
+from array import array
+
+MAX_OPTIONS = 63   # هر mask در یک عدد صحیح 64 بیتی علامت‌دار جا می‌شود
+
+
+class GradingError(ValueError):
+    pass
+
+
+def _popcount(mask):
+    return bin(mask).count("1")
+
+
+def to_mask(value):
+    # شماره گزینه (از صفر) یا فهرست شماره‌ها -> bitmask
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        raise GradingError("Option index must be an integer")
+    values = value if isinstance(value, (list, tuple)) else [value]
+    mask = 0
+    for option in values:
+        if isinstance(option, bool) or not isinstance(option, int):
+            raise GradingError("Option index must be an integer")
+        if not 0 <= option < MAX_OPTIONS:
+            raise GradingError(f"Option index must be between 0 and {MAX_OPTIONS - 1}")
+        mask |= 1 << option
+    return mask
+
+
+def question_type(mask):
+    return "multiple" if _popcount(mask) > 1 else "single"
+
+
+def key_row(exam_id, position, question):
+    mask = to_mask(question.get("correct"))
+    if not mask:
+        raise GradingError(f"Question {position} has no correct option")
+    points = float(question.get("points", 1))
+    if points < 0:
+        raise GradingError(f"Question {position} has negative points")
+    return (exam_id, position, mask, points, bool(question.get("partial_credit", False)))
+
+
+def answer_key_rows(exam_id, questions):
+    # سؤال: {"question": ..., "options": [...], "correct": 1 یا [0, 2], "points": 2, "partial_credit": true}
+    # سؤال بدون correct (مثلاً تشریحی) کلید ندارد و تصحیح خودکار نمی‌شود
+    return [
+        key_row(exam_id, position, question)
+        for position, question in enumerate(questions)
+        if question.get("correct") is not None
+    ]
+
+
+def encode_answers(answers):
+    # پاسخ: {"question": 0, "selected": 2} یا بدون question (به ترتیب سؤال‌ها)
+    # فیلد correct ارسالی کلاینت نادیده گرفته می‌شود
+    masks = {}
+    for index, answer in enumerate(answers):
+        position = answer.get("question", index)
+        if isinstance(position, bool) or not isinstance(position, int) or position < 0:
+            raise GradingError("Invalid question position")
+        masks[position] = to_mask(answer.get("selected", answer.get("answer")))
+    return masks
+
+
+class CompiledExam:
+    __slots__ = ("exam_id", "version", "positions", "masks", "points", "partial", "key_bits", "max_score")
+
+    def __init__(self, exam_id, version, key_rows):
+        # key_rows: (position, correct_mask, points, partial_credit) به ترتیب position
+        self.exam_id = exam_id
+        self.version = version
+        self.positions = array("q", (row[0] for row in key_rows))
+        self.masks = array("q", (row[1] for row in key_rows))
+        self.points = array("d", (row[2] for row in key_rows))
+        self.partial = bytes(bool(row[3]) for row in key_rows)
+        self.key_bits = array("b", (_popcount(mask) for mask in self.masks))
+        self.max_score = round(sum(self.points), 2)
+
+    def align(self, answer_masks):
+        # dict موقعیت -> mask به آرایه هم‌ردیف کلید تبدیل می‌شود (سؤال بی‌پاسخ = 0)
+        get = answer_masks.get
+        return array("q", (get(position, 0) for position in self.positions))
+
+    def item_scores(self, aligned):
+        # یک دور حلقه برای هر سؤال: O(تعداد سؤال‌ها) عملیات بیتی روی اعداد صحیح پایتون
+        scores = []
+        for answer, key, points, partial, bits in zip(aligned, self.masks, self.points, self.partial, self.key_bits):
+            if answer == key:
+                scores.append(points)
+            elif partial and answer:
+                # نمره جزئی: (گزینه‌های درست انتخاب شده - گزینه‌های غلط انتخاب شده) / تعداد گزینه‌های درست
+                earned = _popcount(answer & key) - _popcount(answer & ~key)
+                scores.append(points * earned / bits if earned > 0 else 0.0)
+            else:
+                scores.append(0.0)
+        return scores
+
+    def score(self, aligned):
+        return round(sum(self.item_scores(aligned)), 2)
+
+    def score_many(self, aligned_rows):
+        # پاسخ‌ها یکی‌یکی با score نمره می‌گیرند (فقط صرفه‌جویی در lookup متد، نه پردازش دسته‌ای)
+        score = self.score
+        return [score(aligned) for aligned in aligned_rows]
+
+
+def load_compiled(cursor, exam_id, version):
+    cursor.execute("""
+        SELECT position, correct_mask, points, partial_credit
+        FROM exam_answer_keys
+        WHERE exam_id = ?
+        ORDER BY position
+    """, (exam_id,))
+    return CompiledExam(exam_id, version, [tuple(row) for row in cursor.fetchall()])
+
+
+def dump_masks(masks):
+    return json.dumps(sorted(masks.items()), separators=(",", ":"))
+
+
+def load_masks(text):
+    return dict(json.loads(text))
+
+
+def grade_submission(compiled, answers):
+    # خروجی: (نمره، حداکثر نمره، masks برای ذخیره)
+    masks = encode_answers(answers)
+    return compiled.score(compiled.align(masks)), compiled.max_score, dump_masks(masks)
+
+
+def regrade_exam(cursor, compiled):
+    # همه پاسخ‌های یک آزمون در یک گذر با کلید فعلی دوباره نمره می‌گیرند
+    cursor.execute("SELECT id, answers, answer_masks FROM exam_results WHERE exam_id = ?", (compiled.exam_id,))
+    ids = []
+    aligned_rows = []
+    stored_masks = []
+    for result_id, answers, answer_masks in cursor.fetchall():
+        if answer_masks is not None:
+            masks = load_masks(answer_masks)
+        else:
+            try:
+                masks = encode_answers(json.loads(answers or "[]"))
+            except (GradingError, ValueError, TypeError, AttributeError):
+                masks = {}
+        ids.append(result_id)
+        aligned_rows.append(compiled.align(masks))
+        stored_masks.append(dump_masks(masks))
+    scores = compiled.score_many(aligned_rows)
+    cursor.executemany("""
+        UPDATE exam_results
+        SET score = ?, max_score = ?, graded_version = ?, answer_masks = ?
+        WHERE id = ?
+    """, [
+        (score, compiled.max_score, compiled.version, masks, result_id)
+        for score, masks, result_id in zip(scores, stored_masks, ids)
+    ])
+    return len(ids)
@@ -0,0 +1,186 @@
+# ledger.py - دفتر کل کیف پول: ردیف‌های فقط-افزودنی در transactions، کلید idempotency،
+# snapshot دوره‌ای موجودی و بررسی سازگاری users.wallet_balance با دفتر کل
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+
+from db_pool import get_db_path
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_INTERVAL = float(os.environ.get("LEDGER_SNAPSHOT_INTERVAL", 300))
+SNAPSHOT_MIN_ENTRIES = int(os.environ.get("LEDGER_SNAPSHOT_MIN_ENTRIES", 50))
+MAX_REPORTED_MISMATCHES = 100
+TOLERANCE = 0.005   # مبالغ با دو رقم اعشار ذخیره می‌شوند
+
+
+class LedgerError(Exception):
+    pass
+
+
+class IdempotencyConflict(LedgerError):
+    pass
+
+
+class InsufficientFunds(LedgerError):
+    pass
+
+
+def record_opening_balances(cursor):
+    # موجودی‌هایی که بدون ردیف دفتر کل ساخته شده‌اند (داده قدیمی، داده تست) یک ردیف افتتاحیه می‌گیرند
+    cursor.execute("""
+        INSERT INTO transactions (user_id, amount, type, description, created_at)
+        SELECT u.id, ROUND(u.wallet_balance - COALESCE(t.total, 0), 2), 'opening_balance', 'Opening balance',
+               COALESCE(u.created_at, CURRENT_TIMESTAMP)
+        FROM users u
+        LEFT JOIN (SELECT user_id, SUM(amount) AS total FROM transactions GROUP BY user_id) t ON t.user_id = u.id
+        WHERE ROUND(COALESCE(u.wallet_balance, 0) - COALESCE(t.total, 0), 2) <> 0
+    """)
+    return cursor.rowcount
+
+
+def append_entry(cursor, user_id, amount, entry_type, description=None, idempotency_key=None, require_funds=False):
+    # خروجی: (id ردیف، آیا ردیف تازه ثبت شد)؛ تکرار با همان کلید موجودی را دوباره تغییر نمی‌دهد
+    cursor.execute("""
+        INSERT INTO transactions (user_id, amount, type, description, idempotency_key)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+    """, (user_id, amount, entry_type, description, idempotency_key))
+    if cursor.rowcount == 0:
+        cursor.execute(
+            "SELECT id, amount, type FROM transactions WHERE user_id = ? AND idempotency_key = ?",
+            (user_id, idempotency_key)
+        )
+        existing = cursor.fetchone()
+        if round(existing[1] - amount, 2) != 0 or existing[2] != entry_type:
+            raise IdempotencyConflict("Idempotency key was already used for a different request")
+        return existing[0], False
+    entry_id = cursor.lastrowid
+
+    if require_funds:
+        cursor.execute(
+            "UPDATE users SET wallet_balance = wallet_balance + ? WHERE id = ? AND wallet_balance + ? >= 0",
+            (amount, user_id, amount)
+        )
+        if cursor.rowcount == 0:
+            raise InsufficientFunds("Insufficient wallet balance")
+    else:
+        cursor.execute("UPDATE users SET wallet_balance = wallet_balance + ? WHERE id = ?", (amount, user_id))
+    return entry_id, True
+
+
+def take_snapshots(cursor, min_entries=SNAPSHOT_MIN_ENTRIES):
+    # برای هر کاربری که از آخرین snapshot حداقل min_entries ردیف جدید دارد یک snapshot ساخته می‌شود.
+    # as_of = بیشترین created_at همه ردیف‌های تا last_transaction_id (نه فقط همین دسته)، تا snapshotی که
+    # balance_at با as_of <= at انتخاب می‌کند فقط ردیف‌های تا at را پوشش دهد
+    cursor.execute("""
+        INSERT INTO wallet_snapshots (user_id, last_transaction_id, balance, as_of)
+        WITH latest AS (
+            SELECT s.user_id, s.last_transaction_id, s.balance, s.as_of
+            FROM wallet_snapshots s
+            WHERE s.last_transaction_id = (
+                SELECT MAX(last_transaction_id) FROM wallet_snapshots WHERE user_id = s.user_id
+            )
+        )
+        SELECT t.user_id, MAX(t.id), ROUND(COALESCE(l.balance, 0) + SUM(t.amount), 2),
+               MAX(COALESCE(l.as_of, ''), MAX(t.created_at))
+        FROM transactions t
+        LEFT JOIN latest l ON l.user_id = t.user_id
+        WHERE t.id > COALESCE(l.last_transaction_id, 0)
+        GROUP BY t.user_id
+        HAVING COUNT(*) >= ?
+    """, (min_entries,))
+    return cursor.rowcount
+
+
+def balance_at(cursor, user_id, at):
+    # آخرین snapshot تا زمان at + ردیف‌های بعد از آن (id > last_transaction_id) که تا at ثبت شده‌اند؛
+    # روی created_at حد پایین گذاشته نمی‌شود چون ردیف با تاریخ عقب‌تر (مثلاً opening_balance) ممکن است
+    # بعد از snapshot ثبت شود
+    cursor.execute("""
+        SELECT last_transaction_id, balance
+        FROM wallet_snapshots
+        WHERE user_id = ? AND as_of <= ?
+        ORDER BY as_of DESC, last_transaction_id DESC
+        LIMIT 1
+    """, (user_id, at))
+    snapshot = cursor.fetchone()
+    last_id, balance = tuple(snapshot) if snapshot else (0, 0.0)
+    cursor.execute("""
+        SELECT COALESCE(SUM(amount), 0)
+        FROM transactions
+        WHERE user_id = ? AND id > ? AND created_at <= ?
+    """, (user_id, last_id, at))
+    return round(balance + cursor.fetchone()[0], 2)
+
+
+def check_consistency(cursor):
+    # یک گذر روی کاربران به ترتیب id؛ ردیف‌ها بدون fetchall پیمایش می‌شوند
+    report = {"users_checked": 0, "mismatches": [], "mismatch_count": 0, "snapshot_mismatches": []}
+    rows = cursor.execute("""
+        SELECT u.id, COALESCE(u.wallet_balance, 0), COALESCE(SUM(t.amount), 0)
+        FROM users u
+        LEFT JOIN transactions t ON t.user_id = u.id
+        GROUP BY u.id
+        ORDER BY u.id
+    """)
+    for user_id, balance, ledger_total in rows:
+        report["users_checked"] += 1
+        if abs(balance - ledger_total) > TOLERANCE:
+            report["mismatch_count"] += 1
+            if len(report["mismatches"]) < MAX_REPORTED_MISMATCHES:
+                report["mismatches"].append({
+                    "user_id": user_id,
+                    "wallet_balance": balance,
+                    "ledger_balance": round(ledger_total, 2),
+                })
+    # snapshot آخر هر کاربر باید با مجموع ردیف‌های تا همان id برابر باشد
+    rows = cursor.execute("""
+        SELECT s.user_id, s.last_transaction_id, s.balance,
+               (SELECT COALESCE(SUM(amount), 0) FROM transactions t
+                WHERE t.user_id = s.user_id AND t.id <= s.last_transaction_id)
+        FROM wallet_snapshots s
+        WHERE s.last_transaction_id = (
+            SELECT MAX(last_transaction_id) FROM wallet_snapshots WHERE user_id = s.user_id
+        )
+    """)
+    for user_id, last_id, balance, ledger_total in rows:
+        if abs(balance - ledger_total) > TOLERANCE and len(report["snapshot_mismatches"]) < MAX_REPORTED_MISMATCHES:
+            report["snapshot_mismatches"].append({
+                "user_id": user_id,
+                "last_transaction_id": last_id,
+                "snapshot_balance": balance,
+                "ledger_balance": round(ledger_total, 2),
+            })
+    report["consistent"] = not report["mismatch_count"] and not report["snapshot_mismatches"]
+    return report
+
+
+async def periodic_snapshots(snapshot, interval=SNAPSHOT_INTERVAL):
+    # snapshot: coroutine function که take_snapshots را روی یک اتصال pool اجرا می‌کند
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            created = await snapshot()
+            if created:
+                logger.info(f"Created {created} wallet snapshots")
+        except Exception as e:
+            logger.error(f"Wallet snapshot error: {e}")
+
+
+if __name__ == "__main__":
+    # python ledger.py check | snapshot
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    conn = sqlite3.connect(get_db_path())
+    try:
+        if command == "snapshot":
+            print(f"Created {take_snapshots(conn.cursor(), min_entries=1)} snapshots")
+            conn.commit()
+        else:
+            result = check_consistency(conn.cursor())
+            print(result)
+            sys.exit(0 if result["consistent"] else 1)
+    finally:
+        conn.close()
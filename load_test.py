@@ -0,0 +1,392 @@
+# load_test.py - تولید بار همزمان با asyncio بر اساس فایل‌های سناریو (scenarios/*.json)
+# هر کاربر مجازی یک profile از mix می‌گیرد، مراحل setup را یک بار و مراحل loop را تا پایان duration اجرا می‌کند.
+# شروع کاربران در طول ramp_up پخش می‌شود و بین مراحل think (ثانیه، [حداقل، حداکثر]) صبر می‌کند.
+# انتخاب‌ها و زمان‌های انتظار از seed سناریو می‌آیند، پس اجرای دوباره همان سناریو با تنظیمات دیگر قابل مقایسه است.
+#
+#   python load_test.py run scenarios/class_start.json --db /tmp/large.sqlite3 --output a.json
+#   python load_test.py run scenarios/class_start.json --db /tmp/large.sqlite3 --env DB_POOL_SIZE=16 --output b.json
+#   python load_test.py run scenarios/browse.json --url http://127.0.0.1:8000    (سرور در حال اجرا)
+#   python load_test.py compare a.json b.json
+#
+# با --db یک uvicorn محلی از backend:app روی همان دیتابیس بالا می‌آید (دیتابیس ساخته شده با synthetic_data.py؛
+# کاربران student{n}@example.com / student123 و teacher{n} / teacher123). سناریو روی دیتابیس داده می‌نویسد.
+# کلاینت بار httpx.AsyncClient است (httpx در requirements.txt).
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# مرز bucketهای هیستوگرام تأخیر (میلی‌ثانیه)
+BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+REQUEST_TIMEOUT = 30.0
+SERVER_START_TIMEOUT = 60.0
+
+DEFAULT_ACCOUNTS = {
+    "student": {"username": "student{n}@example.com", "password": "student123"},
+    "teacher": {"username": "teacher{n}", "password": "teacher123"},
+}
+
+SEARCH_TERMS = ["tajweed", "تجوید", "قرائت", "recitation", "tafsir", "حفظ", "arabic"]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    # نتایج بر اساس (بازه زمانی، action) جمع می‌شوند؛ تأخیرها برای percentile نگه داشته می‌شوند
+    def __init__(self, interval):
+        self.interval = interval
+        self.start = time.perf_counter()
+        self.samples = {}    # (interval index, action) -> [latencies]
+        self.errors = {}     # (interval index, action) -> {status: count}
+        self.active_users = 0
+        self.users_timeline = {}
+
+    def record(self, action, latency, status):
+        index = int((time.perf_counter() - self.start) // self.interval)
+        self.users_timeline[index] = max(self.users_timeline.get(index, 0), self.active_users)
+        if status is None or isinstance(status, str) or status >= 400:
+            errors = self.errors.setdefault((index, action), {})
+            errors[str(status)] = errors.get(str(status), 0) + 1
+        else:
+            self.samples.setdefault((index, action), []).append(latency)
+
+    def _summary(self, latencies, errors, seconds):
+        values = sorted(latencies)
+        error_count = sum(errors.values())
+        total = len(values) + error_count
+        histogram = [0] * (len(BUCKETS_MS) + 1)
+        for value in values:
+            ms = value * 1000
+            position = next((i for i, bound in enumerate(BUCKETS_MS) if ms <= bound), len(BUCKETS_MS))
+            histogram[position] += 1
+        ms = lambda value: round(value * 1000, 2) if value is not None else None
+        return {
+            "requests": total,
+            "errors": error_count,
+            "error_rate": round(error_count / total, 4) if total else 0,
+            "error_status": errors,
+            "throughput_rps": round(total / seconds, 2) if seconds else None,
+            "p50_ms": ms(percentile(values, 0.50)),
+            "p95_ms": ms(percentile(values, 0.95)),
+            "p99_ms": ms(percentile(values, 0.99)),
+            "max_ms": ms(values[-1] if values else None),
+            "histogram": histogram,
+        }
+
+    def interval_report(self, index):
+        actions = sorted({action for i, action in list(self.samples) + list(self.errors) if i == index})
+        return {
+            action: self._summary(self.samples.get((index, action), []), self.errors.get((index, action), {}),
+                                  self.interval)
+            for action in actions
+        }
+
+    def results(self):
+        elapsed = time.perf_counter() - self.start
+        last = int(elapsed // self.interval)
+        timeline = []
+        for index in range(last + 1):
+            timeline.append({
+                "t": index * self.interval,
+                "users": self.users_timeline.get(index, 0),
+                "actions": self.interval_report(index),
+            })
+        actions = sorted({action for _, action in list(self.samples) + list(self.errors)})
+        totals = {}
+        for action in actions:
+            latencies, errors = [], {}
+            for (index, name), values in self.samples.items():
+                if name == action:
+                    latencies.extend(values)
+            for (index, name), statuses in self.errors.items():
+                if name == action:
+                    for status, count in statuses.items():
+                        errors[status] = errors.get(status, 0) + count
+            totals[action] = self._summary(latencies, errors, elapsed)
+        return {"elapsed_s": round(elapsed, 2), "buckets_ms": BUCKETS_MS, "actions": totals, "timeline": timeline}
+
+
+class VirtualUser:
+    def __init__(self, client, recorder, account, rng):
+        self.client = client
+        self.recorder = recorder
+        self.account = account
+        self.rng = rng
+        self.headers = {}
+        self.course_ids = []
+        self.lesson_ids = []
+        self.lesson_position = 0
+
+    async def request(self, action, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=self.headers, **kwargs)
+            status = response.status_code
+        except Exception as e:
+            response, status = None, type(e).__name__
+        self.recorder.record(action, time.perf_counter() - start, status)
+        if response is not None and status < 400:
+            return response.json()
+        return None
+
+    async def login(self):
+        data = await self.request("login", "POST", "/api/login", json=self.account)
+        if data:
+            self.headers = {"Authorization": f"Bearer {data['access_token']}"}
+
+    async def courses(self):
+        await self.request("courses", "GET", "/courses")
+
+    async def search(self):
+        await self.request("search", "GET", "/search", params={"q": self.rng.choice(SEARCH_TERMS)})
+
+    async def my_courses(self):
+        data = await self.request("my_courses", "GET", "/my-courses")
+        if data:
+            self.course_ids = [course["id"] for course in data["my_courses"]]
+
+    async def course_lessons(self):
+        if not self.course_ids:
+            return
+        data = await self.request("course_lessons", "GET", f"/courses/{self.rng.choice(self.course_ids)}/lessons")
+        if data:
+            self.lesson_ids = [lesson["id"] for lesson in data["lessons"]]
+            self.lesson_position = 0
+
+    async def progress(self):
+        # درس جاری جلو می‌رود و با رسیدن به 100 درس بعدی شروع می‌شود
+        if not self.lesson_ids:
+            return
+        lesson_id = self.lesson_ids[min(self.lesson_position // 4, len(self.lesson_ids) - 1)]
+        percentage = min(100, (self.lesson_position % 4 + 1) * 25)
+        self.lesson_position += 1
+        await self.request("progress", "POST", "/progress/lesson", json={
+            "lesson_id": lesson_id, "is_completed": percentage == 100,
+            "progress_percentage": percentage, "last_position": self.rng.randint(0, 3600),
+        })
+
+    async def course_progress(self):
+        if self.course_ids:
+            await self.request("course_progress", "GET", f"/progress/course/{self.rng.choice(self.course_ids)}")
+
+    async def teacher_courses(self):
+        data = await self.request("teacher_courses", "GET", "/teacher/courses")
+        if data:
+            self.course_ids = [course["id"] for course in data["courses"]]
+
+    async def teacher_progress(self):
+        if self.course_ids:
+            await self.request("teacher_progress", "GET", f"/teacher/courses/{self.rng.choice(self.course_ids)}/progress")
+
+    async def wallet_balance(self):
+        await self.request("wallet_balance", "GET", "/wallet/balance")
+
+    async def deposit(self):
+        await self.request("deposit", "POST", "/wallet/deposit", json={"amount": self.rng.choice((10, 20, 50))})
+
+    async def step(self, step):
+        if self.rng.random() < step.get("probability", 1):
+            await getattr(self, step["action"])()
+        think = step.get("think")
+        if think:
+            await asyncio.sleep(self.rng.uniform(*think))
+
+    async def run(self, profile, deadline):
+        self.recorder.active_users += 1
+        try:
+            for step in profile.get("setup", []):
+                if time.perf_counter() >= deadline:
+                    return
+                await self.step(step)
+            while profile.get("loop") and time.perf_counter() < deadline:
+                for step in profile["loop"]:
+                    if time.perf_counter() >= deadline:
+                        return
+                    await self.step(step)
+        finally:
+            self.recorder.active_users -= 1
+
+
+def load_scenario(path):
+    with open(path, encoding="utf-8") as f:
+        scenario = json.load(f)
+    actions = {name for name in dir(VirtualUser) if not name.startswith("_")} - {"request", "step", "run"}
+    for profile in scenario["mix"]:
+        for step in profile.get("setup", []) + profile.get("loop", []):
+            if step["action"] not in actions:
+                raise ValueError(f"Unknown action {step['action']!r} in {path}; available: {', '.join(sorted(actions))}")
+    return scenario
+
+
+def print_interval(t, users, report):
+    for action, r in report.items():
+        print(f"{t:>6.0f}s {users:>5} {action:<18} {r['throughput_rps']:>8} rps  err {r['error_rate']:>6.1%}"
+              f"  p50 {r['p50_ms']}  p95 {r['p95_ms']}  p99 {r['p99_ms']} ms")
+
+
+async def run_scenario(scenario, base_url, users=None, duration=None):
+    import httpx
+
+    users = users or scenario["users"]
+    duration = duration or scenario["duration"]
+    ramp_up = scenario.get("ramp_up", 0)
+    recorder = Recorder(scenario.get("report_interval", 5))
+    rng = random.Random(scenario.get("seed", 0))
+    accounts = dict(DEFAULT_ACCOUNTS, **scenario.get("accounts", {}))
+    profiles = scenario["mix"]
+    weights = [profile.get("weight", 1) for profile in profiles]
+    next_account = {name: 0 for name in accounts}
+
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, timeout=REQUEST_TIMEOUT, limits=limits) as client:
+        deadline = time.perf_counter() + duration
+        tasks = []
+        for i in range(users):
+            profile = rng.choices(profiles, weights)[0]
+            account = None
+            if profile["profile"] in accounts:
+                template = accounts[profile["profile"]]
+                n = next_account[profile["profile"]]
+                next_account[profile["profile"]] += 1
+                account = {"username": template["username"].format(n=n), "password": template["password"]}
+            user = VirtualUser(client, recorder, account, random.Random(rng.random()))
+            delay = ramp_up * i / users
+
+            async def start(user=user, profile=profile, delay=delay):
+                await asyncio.sleep(delay)
+                await user.run(profile, deadline)
+
+            tasks.append(asyncio.create_task(start()))
+
+        async def report():
+            index = 0
+            while True:
+                await asyncio.sleep(max(0, recorder.start + (index + 1) * recorder.interval - time.perf_counter()))
+                print_interval(index * recorder.interval, recorder.users_timeline.get(index, 0),
+                               recorder.interval_report(index))
+                index += 1
+
+        reporter = asyncio.create_task(report())
+        await asyncio.gather(*tasks)
+        reporter.cancel()
+    return recorder.results()
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path, env_overrides, workers=1):
+    # uvicorn محلی روی دیتابیس داده شده؛ تا آماده شدن /health صبر می‌شود
+    import httpx
+
+    port = _free_port()
+    env = dict(os.environ, QURAN_DB_PATH=os.path.abspath(db_path), **env_overrides)
+    # log سرور (هر ورود کاربر یک خط INFO است) به فایل می‌رود تا گزارش زنده خوانا بماند
+    log = tempfile.NamedTemporaryFile("w", prefix="load_test_server_", suffix=".log", delete=False)
+    print(f"Server log: {log.name}")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    log.close()
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with code {process.returncode}; see {log.name}")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).json().get("status") == "healthy":
+                return process, base_url
+        except Exception:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("uvicorn did not become ready in time")
+
+
+def compare(a, b):
+    # مقایسه دو خروجی run: تغییر نسبی هر معیار (منفی یعنی b سریع‌تر/کم‌خطاتر)
+    print(f"A: {a['scenario']} {a.get('config')}\nB: {b['scenario']} {b.get('config')}")
+    print(f"{'action':<18} {'metric':<15} {'A':>10} {'B':>10} {'change':>9}")
+    for action in sorted(set(a["results"]["actions"]) | set(b["results"]["actions"])):
+        ra = a["results"]["actions"].get(action, {})
+        rb = b["results"]["actions"].get(action, {})
+        for metric in ("throughput_rps", "error_rate", "p50_ms", "p95_ms", "p99_ms"):
+            va, vb = ra.get(metric), rb.get(metric)
+            change = f"{(vb - va) / va:+.1%}" if va and vb is not None else ""
+            print(f"{action:<18} {metric:<15} {str(va):>10} {str(vb):>10} {change:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scenario based load generator for backend:app")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run")
+    run.add_argument("scenario")
+    target = run.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="running server, e.g. http://127.0.0.1:8000")
+    target.add_argument("--db", help="start a local uvicorn on this database")
+    run.add_argument("--env", action="append", default=[], help="KEY=VALUE for the started server (repeatable)")
+    run.add_argument("--workers", type=int, default=1)
+    run.add_argument("--users", type=int, help="override the scenario's user count")
+    run.add_argument("--duration", type=float, help="override the scenario's duration (seconds)")
+    run.add_argument("--output", help="write results as JSON (input for compare)")
+    comparison = commands.add_parser("compare")
+    comparison.add_argument("a")
+    comparison.add_argument("b")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.a, encoding="utf-8") as fa, open(args.b, encoding="utf-8") as fb:
+            compare(json.load(fa), json.load(fb))
+        return
+
+    scenario = load_scenario(args.scenario)
+    env_overrides = dict(item.split("=", 1) for item in args.env)
+    process = None
+    base_url = args.url
+    if args.db:
+        process, base_url = start_server(args.db, env_overrides, args.workers)
+    try:
+        results = asyncio.run(run_scenario(scenario, base_url, args.users, args.duration))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print(f"\n{'action':<18} {'reqs':>7} {'err%':>6} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for action, r in results["actions"].items():
+        print(f"{action:<18} {r['requests']:>7} {r['error_rate']:>6.1%} {r['throughput_rps']:>8} "
+              f"{r['p50_ms']!s:>8} {r['p95_ms']!s:>8} {r['p99_ms']!s:>8} {r['max_ms']!s:>8}")
+    if args.output:
+        output = {
+            "scenario": scenario["name"],
+            "scenario_file": args.scenario,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "config": {"target": args.url or args.db, "workers": args.workers, "env": env_overrides,
+                       "users": args.users or scenario["users"], "duration": args.duration or scenario["duration"]},
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# metrics.py - متریک‌های درخواست‌ها (تأخیر هر route و status، درخواست‌های در جریان، زمان DB و bcrypt)
+# با فرمت متنی Prometheus در /metrics
+# همه observeها روی thread event loop انجام می‌شوند (middleware و پایان کارهای executor در run_timed)،
+# پس شمارنده‌ها و bucketها قفل ندارند؛ هر observe یک جستجوی dict و یک bisect است.
+import time
+from bisect import bisect_left
+
+from starlette.routing import Match
+
+from executors import request_timings
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BCRYPT_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 2.0, 5.0)
+ROUTE_CACHE_SIZE = 10000
+UNMATCHED = "<unmatched>"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}    # label values -> [count هر bucket ... , count +Inf, sum]
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, label_values)} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labels, label_values)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *label_values):
+        self._values[label_values] = self._values.get(label_values, 0) + 1
+
+    def dec(self, *label_values):
+        self._values[label_values] -= 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for label_values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labels, label_values)} {value}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []    # تابع بدون ورودی -> [(name, type, help, [(labels dict, value)])]
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for name, kind, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(labels.keys(), labels.values())} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.add(Histogram(
+    "http_request_duration_seconds", "Request latency by route template and status",
+    ("method", "route", "status")
+))
+REQUEST_DB_TIME = registry.add(Histogram(
+    "http_request_db_seconds", "Time spent running in the DB executor per request",
+    ("method", "route")
+))
+REQUESTS_IN_FLIGHT = registry.add(Gauge(
+    "http_requests_in_flight", "Requests currently being served", ("method", "route")
+))
+BCRYPT_DURATION = registry.add(Histogram(
+    "bcrypt_seconds", "bcrypt hash/verify time in the CPU executor", ("operation",), BCRYPT_BUCKETS
+))
+
+
+class MetricsMiddleware:
+    # middleware ASGI خام؛ route با route.matches روی همان routeهای برنامه پیدا و برای هر (method، path) cache می‌شود
+    def __init__(self, app, routes, exclude_paths=("/metrics",)):
+        self.app = app
+        self.routes = routes
+        self.exclude_paths = set(exclude_paths)
+        self._route_cache = {}
+
+    def route_template(self, scope):
+        key = (scope["method"], scope["path"])
+        template = self._route_cache.get(key)
+        if template is None:
+            template = UNMATCHED
+            for route in self.routes:
+                match, _ = route.matches(scope)
+                if match == Match.FULL:
+                    template = route.path
+                    break
+                if match == Match.PARTIAL and template == UNMATCHED:
+                    # مسیر درست ولی method دیگر (405)
+                    template = route.path
+            # مسیرهای دارای شناسه کلیدهای زیادی می‌سازند؛ cache با پر شدن خالی می‌شود
+            if len(self._route_cache) >= ROUTE_CACHE_SIZE:
+                self._route_cache.clear()
+            self._route_cache[key] = template
+        return template
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        route = self.route_template(scope)
+        status_holder = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        timings = {}
+        token = request_timings.set(timings)
+        REQUESTS_IN_FLIGHT.inc(method, route)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_DURATION.observe(time.perf_counter() - start, method, route, str(status_holder[0]))
+            if "db" in timings:
+                REQUEST_DB_TIME.observe(timings["db"], method, route)
+            REQUESTS_IN_FLIGHT.dec(method, route)
+            request_timings.reset(token)
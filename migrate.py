@@ -0,0 +1,225 @@
+# migrate.py - اجرای migrationهای شماره‌دار پوشه migrations/ و نگهداری نسخه schema
+# فایل‌ها: NNNN_name.sql (دستورهای SQL) یا NNNN_name.py (تابع upgrade(cursor)) به ترتیب شماره اجرا می‌شوند.
+# هر migration در یک تراکنش BEGIN IMMEDIATE اجرا و با checksum در جدول schema_version ثبت می‌شود.
+#
+#   python migrate.py            اجرای migrationهای باقی‌مانده
+#   python migrate.py status     نمایش نسخه فعلی و migrationهای اجرا نشده
+#   python migrate.py verify     بررسی checksum migrationهای اجرا شده
+import hashlib
+import importlib.util
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from db_pool import get_db_path
+from text_normalize import register_functions
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATE_ON_STARTUP = os.environ.get("MIGRATE_ON_STARTUP", "1") != "0"
+BUSY_TIMEOUT_MS = 30000
+
+_FILENAME_RE = re.compile(r"^(\d{4})_(\w+)\.(sql|py)$")
+
+SCHEMA_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        checksum TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        duration_ms REAL
+    )
+"""
+
+
+class MigrationError(Exception):
+    pass
+
+
+class Migration:
+    __slots__ = ("version", "name", "path", "kind")
+
+    def __init__(self, version, name, path, kind):
+        self.version = version
+        self.name = name
+        self.path = path
+        self.kind = kind
+
+    @property
+    def checksum(self):
+        with open(self.path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+
+def discover(directory=MIGRATIONS_DIR):
+    migrations = {}
+    for filename in os.listdir(directory):
+        match = _FILENAME_RE.match(filename)
+        if not match:
+            continue
+        version = int(match.group(1))
+        if version in migrations:
+            raise MigrationError(f"Duplicate migration version {version}: {filename}")
+        migrations[version] = Migration(version, filename, os.path.join(directory, filename), match.group(3))
+    return [migrations[version] for version in sorted(migrations)]
+
+
+def connect(db_path=None):
+    # اتصال autocommit؛ تراکنش هر migration صریحاً باز و بسته می‌شود
+    conn = sqlite3.connect(db_path or get_db_path(), isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    # triggerهای جستجو به تابع normalize_text نیاز دارند
+    register_functions(conn)
+    return conn
+
+
+def current_version(conn):
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if row is None:
+        return 0
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+
+def applied_migrations(conn):
+    if not current_version(conn):
+        return {}
+    rows = conn.execute("SELECT version, name, checksum FROM schema_version ORDER BY version")
+    return {row[0]: (row[1], row[2]) for row in rows}
+
+
+def verify(conn, migrations=None):
+    # migration اجرا شده نباید بعداً تغییر کند یا حذف شود
+    migrations = {m.version: m for m in (migrations if migrations is not None else discover())}
+    problems = []
+    for version, (name, checksum) in applied_migrations(conn).items():
+        migration = migrations.get(version)
+        if migration is None:
+            problems.append(f"{name}: applied but missing from {MIGRATIONS_DIR}")
+        elif migration.checksum != checksum:
+            problems.append(f"{name}: checksum mismatch (file changed after it was applied)")
+    if problems:
+        raise MigrationError("; ".join(problems))
+
+
+def split_statements(script):
+    # sqlite3.complete_statement بدنه BEGIN ... END triggerها را یک دستور در نظر می‌گیرد
+    statements, buffer = [], ""
+    for line in script.splitlines(keepends=True):
+        buffer += line
+        if sqlite3.complete_statement(buffer):
+            statements.append(buffer.strip())
+            buffer = ""
+    leftover = [line for line in buffer.splitlines() if line.strip() and not line.strip().startswith("--")]
+    if leftover:
+        raise MigrationError(f"Incomplete SQL statement: {leftover[0][:80]}")
+    return statements
+
+
+def _run_sql(cursor, migration):
+    with open(migration.path, encoding="utf-8") as f:
+        statements = split_statements(f.read())
+    for statement in statements:
+        try:
+            cursor.execute(statement)
+        except sqlite3.OperationalError as e:
+            # دیتابیس‌های قدیمی ستون را قبل از migrationها اضافه کرده‌اند
+            if "duplicate column name" in str(e):
+                continue
+            raise
+
+
+def _run_py(cursor, migration):
+    spec = importlib.util.spec_from_file_location(f"migration_{migration.version:04d}", migration.path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.upgrade(cursor)
+
+
+def apply(conn, migration):
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        # پروسه دیگری ممکن است همزمان همین migration را اجرا کرده باشد
+        cursor.execute("SELECT 1 FROM schema_version WHERE version = ?", (migration.version,))
+        if cursor.fetchone():
+            cursor.execute("ROLLBACK")
+            return False
+        if migration.kind == "sql":
+            _run_sql(cursor, migration)
+        else:
+            _run_py(cursor, migration)
+        cursor.execute(
+            "INSERT INTO schema_version (version, name, checksum, duration_ms) VALUES (?, ?, ?, ?)",
+            (migration.version, migration.name, migration.checksum, round((time.perf_counter() - start) * 1000, 1))
+        )
+        cursor.execute("COMMIT")
+    except Exception as e:
+        cursor.execute("ROLLBACK")
+        raise MigrationError(f"{migration.name} failed: {e}") from e
+    return True
+
+
+def upgrade(conn, migrations=None):
+    migrations = migrations if migrations is not None else discover()
+    conn.execute(SCHEMA_VERSION_DDL)
+    verify(conn, migrations)
+    version = current_version(conn)
+    applied = []
+    for migration in migrations:
+        if migration.version <= version:
+            continue
+        if apply(conn, migration):
+            logger.info(f"Applied migration {migration.name}")
+            applied.append(migration.name)
+    return applied
+
+
+def ensure_schema(conn):
+    # مسیر راه‌اندازی: checksum migrationهای اجرا شده (چند فایل کوچک) و MAX(version) با آخرین فایل
+    migrations = discover()
+    latest = migrations[-1].version if migrations else 0
+    version = current_version(conn)
+    if version > latest:
+        raise MigrationError(f"Database schema version {version} is newer than the code ({latest})")
+    verify(conn, migrations)
+    if version == latest:
+        return []
+    if not MIGRATE_ON_STARTUP:
+        raise MigrationError(f"Database schema version {version} is behind {latest}; run python migrate.py")
+    return upgrade(conn, migrations)
+
+
+def status(conn):
+    version = current_version(conn)
+    return {
+        "version": version,
+        "pending": [m.name for m in discover() if m.version > version],
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    command = sys.argv[1] if len(sys.argv) > 1 else "upgrade"
+    conn = connect()
+    try:
+        if command == "status":
+            print(status(conn))
+        elif command == "verify":
+            verify(conn)
+            print("All applied migrations match their files")
+        else:
+            applied = upgrade(conn)
+            print(f"Applied {len(applied)} migrations; schema version {current_version(conn)}")
+    except MigrationError as e:
+        print(f"Migration error: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
@@ -0,0 +1,129 @@
+-- جداول پایه برنامه (قبلاً در init_db و creat_tables.py تکرار شده بودند)
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE,
+    password TEXT NOT NULL,
+    role TEXT DEFAULT 'student',
+    full_name TEXT,
+    email TEXT UNIQUE,
+    specialty TEXT,
+    wallet_balance DECIMAL(10,2) DEFAULT 0,
+    approved BOOLEAN DEFAULT TRUE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS students (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    level TEXT,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+CREATE TABLE IF NOT EXISTS teachers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    experience TEXT,
+    bio TEXT,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+CREATE TABLE IF NOT EXISTS classes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    teacher_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT,
+    level TEXT DEFAULT 'Beginner',
+    category TEXT,
+    duration INTEGER DEFAULT 60,
+    price DECIMAL(10,2) DEFAULT 0,
+    max_students INTEGER DEFAULT 10,
+    schedule TEXT,
+    status TEXT DEFAULT 'active',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (teacher_id) REFERENCES users (id)
+);
+
+CREATE TABLE IF NOT EXISTS enrollments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id INTEGER NOT NULL,
+    class_id INTEGER NOT NULL,
+    enrolled_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    status TEXT DEFAULT 'active',
+    progress INTEGER DEFAULT 0,
+    FOREIGN KEY (student_id) REFERENCES users (id),
+    FOREIGN KEY (class_id) REFERENCES classes (id),
+    UNIQUE(student_id, class_id)
+);
+
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    amount DECIMAL(10,2) NOT NULL,
+    type TEXT NOT NULL,
+    description TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id)
+);
+
+CREATE TABLE IF NOT EXISTS exams (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    class_id INTEGER NOT NULL,
+    teacher_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT,
+    questions TEXT,
+    duration INTEGER DEFAULT 60,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (class_id) REFERENCES classes (id),
+    FOREIGN KEY (teacher_id) REFERENCES users (id)
+);
+
+CREATE TABLE IF NOT EXISTS exam_results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    exam_id INTEGER NOT NULL,
+    student_id INTEGER NOT NULL,
+    score INTEGER,
+    answers TEXT,
+    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (exam_id) REFERENCES exams (id),
+    FOREIGN KEY (student_id) REFERENCES users (id),
+    UNIQUE(exam_id, student_id)
+);
+
+-- سیستم آموزشی: دروس و پیشرفت
+CREATE TABLE IF NOT EXISTS lessons (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    class_id INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    content_type TEXT DEFAULT 'text',
+    content_url TEXT,
+    duration INTEGER DEFAULT 0,
+    order_index INTEGER DEFAULT 0,
+    description TEXT,
+    is_published BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (class_id) REFERENCES classes (id) ON DELETE CASCADE
+);
+
+CREATE TABLE IF NOT EXISTS lesson_progress (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    student_id INTEGER NOT NULL,
+    lesson_id INTEGER NOT NULL,
+    class_id INTEGER NOT NULL,
+    is_completed BOOLEAN DEFAULT FALSE,
+    completed_at TIMESTAMP,
+    progress_percentage INTEGER DEFAULT 0,
+    last_position INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (student_id) REFERENCES users (id) ON DELETE CASCADE,
+    FOREIGN KEY (lesson_id) REFERENCES lessons (id) ON DELETE CASCADE,
+    FOREIGN KEY (class_id) REFERENCES classes (id) ON DELETE CASCADE,
+    UNIQUE(student_id, lesson_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_lessons_class_id ON lessons(class_id);
+CREATE INDEX IF NOT EXISTS idx_lessons_order ON lessons(class_id, order_index);
+CREATE INDEX IF NOT EXISTS idx_lesson_progress_student ON lesson_progress(student_id);
+CREATE INDEX IF NOT EXISTS idx_lesson_progress_lesson ON lesson_progress(lesson_id);
@@ -0,0 +1,3 @@
+-- نسخه توکن برای باطل کردن توکن‌های قبلی کاربر (خروج از همه دستگاه‌ها، تغییر نقش)
+ALTER TABLE users ADD COLUMN token_version INTEGER DEFAULT 0;
+CREATE INDEX IF NOT EXISTS idx_users_token_version ON users(id, token_version) WHERE token_version > 0;
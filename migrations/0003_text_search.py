@@ -0,0 +1,132 @@
+# ستون‌های یکسان‌سازی شده (*_norm) و ایندکس جستجوی متن کامل (FTS5) با triggerهای همگام‌سازی
+# migration منجمد است: SQL همین‌جا نوشته شده و به کد برنامه وابسته نیست (فقط تابع normalize_text که
+# migrate.connect روی اتصال ثبت می‌کند)
+
+# (جدول، ستون منبع، ستون یکسان‌سازی شده)
+NORMALIZED_COLUMNS = [
+    ("users", "full_name", "full_name_norm"),
+    ("classes", "title", "title_norm"),
+    ("lessons", "title", "title_norm"),
+]
+
+SEARCH_TRIGGERS = [
+    "classes_fts_ai", "classes_fts_ad", "classes_fts_au",
+    "lessons_fts_ai", "lessons_fts_ad", "lessons_fts_au",
+]
+
+# متن قبل از ایندکس با normalize_text یکسان‌سازی می‌شود؛ حروف ترکیبی باقی‌مانده (M*)
+# جزو توکن می‌مانند تا کلمات عربی و فارسی شکسته نشوند
+SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS classes_fts USING fts5(
+        title, description, category,
+        tokenize="unicode61 remove_diacritics 2 categories 'L* N* Co M*'", prefix='2 3'
+    )
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS lessons_fts USING fts5(
+        title, description,
+        tokenize="unicode61 remove_diacritics 2 categories 'L* N* Co M*'", prefix='2 3'
+    )
+    """,
+    # همگام‌سازی افزایشی ایندکس با تغییرات جداول اصلی
+    """
+    CREATE TRIGGER IF NOT EXISTS classes_fts_ai AFTER INSERT ON classes BEGIN
+        INSERT INTO classes_fts(rowid, title, description, category)
+        VALUES (new.id, normalize_text(new.title), normalize_text(new.description), normalize_text(new.category));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS classes_fts_ad AFTER DELETE ON classes BEGIN
+        DELETE FROM classes_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS classes_fts_au AFTER UPDATE OF title, description, category ON classes BEGIN
+        UPDATE classes_fts
+        SET title = normalize_text(new.title),
+            description = normalize_text(new.description),
+            category = normalize_text(new.category)
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lessons_fts_ai AFTER INSERT ON lessons BEGIN
+        INSERT INTO lessons_fts(rowid, title, description)
+        VALUES (new.id, normalize_text(new.title), normalize_text(new.description));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lessons_fts_ad AFTER DELETE ON lessons BEGIN
+        DELETE FROM lessons_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lessons_fts_au AFTER UPDATE OF title, description ON lessons BEGIN
+        UPDATE lessons_fts
+        SET title = normalize_text(new.title),
+            description = normalize_text(new.description)
+        WHERE rowid = new.id;
+    END
+    """,
+]
+
+SEARCH_BACKFILL = {
+    "classes_fts": """
+        INSERT INTO classes_fts(rowid, title, description, category)
+        SELECT id, normalize_text(title), normalize_text(description), normalize_text(category) FROM classes
+    """,
+    "lessons_fts": """
+        INSERT INTO lessons_fts(rowid, title, description)
+        SELECT id, normalize_text(title), normalize_text(description) FROM lessons
+    """,
+}
+
+
+def _has_column(cursor, table, column):
+    cursor.execute(f"PRAGMA table_info({table})")
+    return column in [row[1] for row in cursor.fetchall()]
+
+
+def create_normalized_columns(cursor):
+    # ستون *_norm با trigger نگهداری می‌شود، پس همه مسیرهای نوشتن را پوشش می‌دهد
+    for table, source, column in NORMALIZED_COLUMNS:
+        if not _has_column(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} TEXT")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table}({column})")
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_{column}_ai AFTER INSERT ON {table} BEGIN
+                UPDATE {table} SET {column} = normalize_text(new.{source}) WHERE id = new.id;
+            END
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_{column}_au AFTER UPDATE OF {source} ON {table} BEGIN
+                UPDATE {table} SET {column} = normalize_text(new.{source}) WHERE id = new.id;
+            END
+        """)
+        cursor.execute(
+            f"UPDATE {table} SET {column} = normalize_text({source}) WHERE {column} IS NULL AND {source} IS NOT NULL"
+        )
+
+
+def create_search_index(cursor):
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE name IN ('classes_fts', 'lessons_fts')")
+    existing = dict(cursor.fetchall())
+    if any("content=" in (sql or "") for sql in existing.values()):
+        # نسخه قبلی ایندکس (external content بدون یکسان‌سازی) کنار گذاشته می‌شود
+        for trigger in SEARCH_TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        for table in existing:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        existing = {}
+    for statement in SEARCH_DDL:
+        cursor.execute(statement)
+    # ایندکس تازه ساخته شده با داده‌های موجود پر می‌شود
+    for table, statement in SEARCH_BACKFILL.items():
+        if table not in existing:
+            cursor.execute(statement)
+
+
+def upgrade(cursor):
+    create_normalized_columns(cursor)
+    create_search_index(cursor)
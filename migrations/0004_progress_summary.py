@@ -0,0 +1,157 @@
+# خلاصه پیشرفت هر دانش‌آموز در هر دوره (با trigger نگهداری می‌شود)
+# migration منجمد است: جدول، triggerها و پر کردن اولیه همین‌جا نوشته شده‌اند و به progress_summary.py وابسته نیستند
+
+SUMMARY_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS course_progress_summary (
+        class_id INTEGER NOT NULL,
+        student_id INTEGER NOT NULL,
+        completed_lessons INTEGER NOT NULL DEFAULT 0,
+        total_published_lessons INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (class_id, student_id)
+    ) WITHOUT ROWID
+"""
+
+# تعداد دروس منتشر شده کامل شده توسط s.student_id در s.class_id (برای بازسازی کامل)
+_COMPLETED_SQL = """
+    (SELECT COUNT(*) FROM lesson_progress lp
+     JOIN lessons l ON l.id = lp.lesson_id
+     WHERE lp.student_id = {student} AND l.class_id = {klass} AND l.is_published AND lp.is_completed)
+"""
+_TOTAL_SQL = """
+    (SELECT COUNT(*) FROM lessons l WHERE l.class_id = {klass} AND l.is_published)
+"""
+
+SUMMARY_DDL = [
+    # تغییرات پیشرفت درس: فقط دروس منتشر شده در شمارش اثر دارند
+    """
+    CREATE TRIGGER IF NOT EXISTS lesson_progress_summary_ai AFTER INSERT ON lesson_progress
+    WHEN new.is_completed
+    BEGIN
+        UPDATE course_progress_summary
+        SET completed_lessons = completed_lessons + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE class_id = new.class_id AND student_id = new.student_id
+          AND EXISTS (SELECT 1 FROM lessons WHERE id = new.lesson_id AND class_id = new.class_id AND is_published);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lesson_progress_summary_au AFTER UPDATE OF is_completed ON lesson_progress
+    WHEN coalesce(old.is_completed, 0) <> coalesce(new.is_completed, 0)
+    BEGIN
+        UPDATE course_progress_summary
+        SET completed_lessons = completed_lessons + CASE WHEN new.is_completed THEN 1 ELSE -1 END,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE class_id = new.class_id AND student_id = new.student_id
+          AND EXISTS (SELECT 1 FROM lessons WHERE id = new.lesson_id AND class_id = new.class_id AND is_published);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS lesson_progress_summary_ad AFTER DELETE ON lesson_progress
+    WHEN old.is_completed
+    BEGIN
+        UPDATE course_progress_summary
+        SET completed_lessons = completed_lessons - 1, updated_at = CURRENT_TIMESTAMP
+        WHERE class_id = old.class_id AND student_id = old.student_id
+          AND EXISTS (SELECT 1 FROM lessons WHERE id = old.lesson_id AND class_id = old.class_id AND is_published);
+    END
+    """,
+    # انتشار درس جدید
+    """
+    CREATE TRIGGER IF NOT EXISTS lessons_summary_ai AFTER INSERT ON lessons
+    WHEN new.is_published
+    BEGIN
+        UPDATE course_progress_summary
+        SET total_published_lessons = total_published_lessons + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE class_id = new.class_id;
+    END
+    """,
+    # انتشار / لغو انتشار: پیشرفت قبلی دانش‌آموزان روی همین درس هم اضافه یا کم می‌شود
+    """
+    CREATE TRIGGER IF NOT EXISTS lessons_summary_au AFTER UPDATE OF is_published ON lessons
+    WHEN coalesce(old.is_published, 0) <> coalesce(new.is_published, 0)
+    BEGIN
+        UPDATE course_progress_summary
+        SET total_published_lessons = total_published_lessons + CASE WHEN new.is_published THEN 1 ELSE -1 END,
+            completed_lessons = completed_lessons + CASE WHEN new.is_published THEN 1 ELSE -1 END * EXISTS (
+                SELECT 1 FROM lesson_progress lp
+                WHERE lp.student_id = course_progress_summary.student_id
+                  AND lp.lesson_id = new.id AND lp.is_completed
+            ),
+            updated_at = CURRENT_TIMESTAMP
+        WHERE class_id = new.class_id;
+    END
+    """,
+    # حذف درس نادر است؛ شمارش کل دوره دوباره محاسبه می‌شود تا به ترتیب حذف ردیف‌های پیشرفت وابسته نباشد
+    f"""
+    CREATE TRIGGER IF NOT EXISTS lessons_summary_ad AFTER DELETE ON lessons
+    WHEN old.is_published
+    BEGIN
+        UPDATE course_progress_summary
+        SET completed_lessons = {_COMPLETED_SQL.format(student="course_progress_summary.student_id", klass="old.class_id")},
+            total_published_lessons = {_TOTAL_SQL.format(klass="old.class_id")},
+            updated_at = CURRENT_TIMESTAMP
+        WHERE class_id = old.class_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS enrollments_summary_ai AFTER INSERT ON enrollments
+    BEGIN
+        INSERT INTO course_progress_summary (class_id, student_id, completed_lessons, total_published_lessons)
+        VALUES (
+            new.class_id, new.student_id,
+            {_COMPLETED_SQL.format(student="new.student_id", klass="new.class_id")},
+            {_TOTAL_SQL.format(klass="new.class_id")}
+        )
+        ON CONFLICT(class_id, student_id) DO UPDATE SET
+            completed_lessons = excluded.completed_lessons,
+            total_published_lessons = excluded.total_published_lessons,
+            updated_at = CURRENT_TIMESTAMP;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS enrollments_summary_ad AFTER DELETE ON enrollments
+    BEGIN
+        DELETE FROM course_progress_summary WHERE class_id = old.class_id AND student_id = old.student_id;
+    END
+    """,
+    # enrollments.progress (درصد گزارش شده در /my-courses) همیشه از خلاصه گرفته می‌شود
+    """
+    CREATE TRIGGER IF NOT EXISTS course_progress_summary_ai AFTER INSERT ON course_progress_summary
+    BEGIN
+        UPDATE enrollments
+        SET progress = CASE WHEN new.total_published_lessons > 0
+                            THEN CAST(ROUND(new.completed_lessons * 100.0 / new.total_published_lessons) AS INTEGER)
+                            ELSE 0 END
+        WHERE student_id = new.student_id AND class_id = new.class_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS course_progress_summary_au
+    AFTER UPDATE OF completed_lessons, total_published_lessons ON course_progress_summary
+    BEGIN
+        UPDATE enrollments
+        SET progress = CASE WHEN new.total_published_lessons > 0
+                            THEN CAST(ROUND(new.completed_lessons * 100.0 / new.total_published_lessons) AS INTEGER)
+                            ELSE 0 END
+        WHERE student_id = new.student_id AND class_id = new.class_id;
+    END
+    """,
+]
+
+SUMMARY_BACKFILL = f"""
+    INSERT INTO course_progress_summary (class_id, student_id, completed_lessons, total_published_lessons)
+    SELECT e.class_id, e.student_id,
+           {_COMPLETED_SQL.format(student="e.student_id", klass="e.class_id")},
+           {_TOTAL_SQL.format(klass="e.class_id")}
+    FROM enrollments e
+"""
+
+
+def upgrade(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'course_progress_summary'")
+    exists = cursor.fetchone() is not None
+    cursor.execute(SUMMARY_TABLE_DDL)
+    for statement in SUMMARY_DDL:
+        cursor.execute(statement)
+    if not exists:
+        cursor.execute(SUMMARY_BACKFILL)
@@ -0,0 +1,68 @@
+# کلید پاسخ آزمون‌ها در سمت سرور و ستون‌های تصحیح exam_results
+# migration منجمد است: تبدیل correct به bitmask همین‌جا نوشته شده و به grading.py وابسته نیست
+import json
+
+MAX_OPTIONS = 63
+
+ANSWER_KEY_DDL = """
+    CREATE TABLE IF NOT EXISTS exam_answer_keys (
+        exam_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        correct_mask INTEGER NOT NULL,
+        points REAL NOT NULL DEFAULT 1,
+        partial_credit BOOLEAN NOT NULL DEFAULT FALSE,
+        PRIMARY KEY (exam_id, position),
+        FOREIGN KEY (exam_id) REFERENCES exams (id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+"""
+
+# answer_masks: پاسخ‌های کدگذاری شده هم‌ردیف کلید تا تصحیح مجدد JSON را دوباره parse نکند
+COLUMNS = [
+    ("exams", "version", "INTEGER DEFAULT 1"),
+    ("exam_results", "answer_masks", "TEXT"),
+    ("exam_results", "max_score", "REAL"),
+    ("exam_results", "graded_version", "INTEGER"),
+]
+
+
+def _mask(value):
+    values = value if isinstance(value, (list, tuple)) else [value]
+    mask = 0
+    for option in values:
+        if isinstance(option, bool) or not isinstance(option, int) or not 0 <= option < MAX_OPTIONS:
+            raise ValueError("Invalid option index")
+        mask |= 1 << option
+    return mask
+
+
+def _key_rows(exam_id, questions):
+    # سؤال بدون correct (مثلاً تشریحی) کلید ندارد
+    rows = []
+    for position, question in enumerate(questions):
+        if question.get("correct") is None:
+            continue
+        mask = _mask(question["correct"])
+        points = float(question.get("points", 1))
+        if not mask or points < 0:
+            raise ValueError(f"Invalid answer key for question {position}")
+        rows.append((exam_id, position, mask, points, bool(question.get("partial_credit", False))))
+    return rows
+
+
+def upgrade(cursor):
+    cursor.execute(ANSWER_KEY_DDL)
+    for table, column, definition in COLUMNS:
+        cursor.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in cursor.fetchall()]:
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    # آزمون‌های قدیمی: کلید از JSON سؤال‌ها استخراج می‌شود
+    cursor.execute("""
+        SELECT id, questions FROM exams e
+        WHERE NOT EXISTS (SELECT 1 FROM exam_answer_keys k WHERE k.exam_id = e.id)
+    """)
+    for exam_id, questions in cursor.fetchall():
+        try:
+            rows = _key_rows(exam_id, json.loads(questions or "[]"))
+        except (ValueError, TypeError, AttributeError):
+            continue
+        cursor.executemany("INSERT INTO exam_answer_keys VALUES (?, ?, ?, ?, ?)", rows)
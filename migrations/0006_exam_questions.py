@@ -0,0 +1,61 @@
+# سؤال‌های آزمون در جدول exam_questions (انتقال از ستون JSON قدیمی)
+# migration منجمد است: به exam_store.py و grading.py وابسته نیست
+import json
+
+EXAM_QUESTIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS exam_questions (
+        exam_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        prompt TEXT NOT NULL,
+        question_type TEXT NOT NULL DEFAULT 'single',
+        options TEXT,
+        points REAL NOT NULL DEFAULT 1,
+        PRIMARY KEY (exam_id, position),
+        FOREIGN KEY (exam_id) REFERENCES exams (id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+"""
+
+
+def _question_type(correct):
+    # تک‌گزینه‌ای یا چندگزینه‌ای بر اساس تعداد گزینه‌های درست (مثل bitmask در 0005)
+    values = correct if isinstance(correct, (list, tuple)) else [correct]
+    for option in values:
+        if isinstance(option, bool) or not isinstance(option, int) or not 0 <= option < 63:
+            raise ValueError("Invalid option index")
+    return "multiple" if len(set(values)) > 1 else "single"
+
+
+def _question_rows(exam_id, questions):
+    # فقط بخش عمومی سؤال منتقل می‌شود؛ correct در exam_answer_keys است
+    rows = []
+    for position, question in enumerate(questions):
+        correct = question.get("correct")
+        kind = question.get("type") or ("text" if correct is None else _question_type(correct))
+        options = question.get("options")
+        rows.append((
+            exam_id,
+            position,
+            str(question.get("question") or question.get("prompt") or question.get("text") or ""),
+            kind,
+            json.dumps(options, ensure_ascii=False) if options is not None else None,
+            float(question.get("points", 1)),
+        ))
+    return rows
+
+
+def upgrade(cursor):
+    cursor.execute(EXAM_QUESTIONS_DDL)
+    cursor.execute("""
+        SELECT id, questions FROM exams e
+        WHERE questions IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM exam_questions q WHERE q.exam_id = e.id)
+    """)
+    for exam_id, questions in cursor.fetchall():
+        try:
+            rows = _question_rows(exam_id, json.loads(questions))
+        except (ValueError, TypeError, AttributeError):
+            continue
+        cursor.executemany("""
+            INSERT INTO exam_questions (exam_id, position, prompt, question_type, options, points)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, rows)
@@ -0,0 +1,114 @@
+# آمار افزایشی آزمون‌ها؛ برای نتایج موجود یک بار از نو ساخته می‌شود
+# migration منجمد است: نمره‌دهی هر سؤال (همان قاعده grading.py در زمان نوشتن این migration) همین‌جا
+# نوشته شده و به exam_analytics.py و grading.py وابسته نیست
+import json
+
+BUCKETS = 101
+
+ANALYTICS_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS exam_stats (
+        exam_id INTEGER PRIMARY KEY,
+        n INTEGER NOT NULL DEFAULT 0,
+        mean REAL NOT NULL DEFAULT 0,
+        m2 REAL NOT NULL DEFAULT 0,
+        min_score REAL,
+        max_score REAL,
+        FOREIGN KEY (exam_id) REFERENCES exams (id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS exam_score_buckets (
+        exam_id INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (exam_id, bucket)
+    ) WITHOUT ROWID
+    """,
+    # credit_sum: مجموع سهم نمره گرفته شده (0..1)؛ correct_count: تعداد نمره کامل؛
+    # correct_score_sum: مجموع درصد کل آزمون کسانی که نمره کامل گرفته‌اند (برای point-biserial)
+    """
+    CREATE TABLE IF NOT EXISTS exam_item_stats (
+        exam_id INTEGER NOT NULL,
+        position INTEGER NOT NULL,
+        credit_sum REAL NOT NULL DEFAULT 0,
+        correct_count INTEGER NOT NULL DEFAULT 0,
+        correct_score_sum REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (exam_id, position)
+    ) WITHOUT ROWID
+    """,
+]
+
+
+def _popcount(mask):
+    return bin(mask).count("1")
+
+
+def _item_score(answer, key, points, partial):
+    if answer == key:
+        return points
+    if partial and answer:
+        earned = _popcount(answer & key) - _popcount(answer & ~key)
+        return points * earned / _popcount(key) if earned > 0 else 0.0
+    return 0.0
+
+
+def _backfill(cursor, exam_id):
+    cursor.execute("""
+        SELECT position, correct_mask, points, partial_credit
+        FROM exam_answer_keys WHERE exam_id = ? ORDER BY position
+    """, (exam_id,))
+    keys = cursor.fetchall()
+    max_score = round(sum(row[2] for row in keys), 2)
+    if not max_score:
+        return
+    cursor.execute("SELECT answer_masks FROM exam_results WHERE exam_id = ? AND answer_masks IS NOT NULL", (exam_id,))
+    n = 0
+    mean = m2 = 0.0
+    low = high = None
+    buckets = {}
+    items = [[0.0, 0, 0.0] for _ in keys]
+    for (answer_masks,) in cursor.fetchall():
+        masks = dict(json.loads(answer_masks))
+        scores = [_item_score(masks.get(position, 0), mask, points, partial) for position, mask, points, partial in keys]
+        percent = round(sum(scores), 2) * 100.0 / max_score
+        n += 1
+        delta = percent - mean
+        mean += delta / n
+        m2 += delta * (percent - mean)
+        low = percent if low is None else min(low, percent)
+        high = percent if high is None else max(high, percent)
+        bucket = min(BUCKETS - 1, max(0, int(percent)))
+        buckets[bucket] = buckets.get(bucket, 0) + 1
+        for acc, key, earned in zip(items, keys, scores):
+            points = key[2]
+            full = 1 if points and earned >= points else 0
+            acc[0] += earned / points if points else 0.0
+            acc[1] += full
+            acc[2] += percent if full else 0.0
+    if not n:
+        return
+    cursor.execute(
+        "INSERT INTO exam_stats (exam_id, n, mean, m2, min_score, max_score) VALUES (?, ?, ?, ?, ?, ?)",
+        (exam_id, n, mean, m2, low, high)
+    )
+    cursor.executemany(
+        "INSERT INTO exam_score_buckets (exam_id, bucket, count) VALUES (?, ?, ?)",
+        [(exam_id, bucket, count) for bucket, count in buckets.items()]
+    )
+    cursor.executemany(
+        "INSERT INTO exam_item_stats (exam_id, position, credit_sum, correct_count, correct_score_sum) "
+        "VALUES (?, ?, ?, ?, ?)",
+        [(exam_id, key[0], *acc) for key, acc in zip(keys, items)]
+    )
+
+
+def upgrade(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'exam_stats'")
+    exists = cursor.fetchone() is not None
+    for statement in ANALYTICS_DDL:
+        cursor.execute(statement)
+    if not exists:
+        cursor.execute("SELECT DISTINCT exam_id FROM exam_results")
+        for (exam_id,) in cursor.fetchall():
+            _backfill(cursor, exam_id)
@@ -0,0 +1,37 @@
+-- دفتر کل کیف پول (فقط-افزودنی)، کلید idempotency و snapshotهای موجودی
+ALTER TABLE transactions ADD COLUMN idempotency_key TEXT;
+
+-- هر کلید idempotency برای هر کاربر فقط یک بار ثبت می‌شود
+CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_idempotency
+    ON transactions(user_id, idempotency_key) WHERE idempotency_key IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions(user_id, created_at, id);
+
+CREATE TABLE IF NOT EXISTS wallet_snapshots (
+    user_id INTEGER NOT NULL,
+    last_transaction_id INTEGER NOT NULL,
+    balance REAL NOT NULL,
+    as_of TIMESTAMP NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, last_transaction_id),
+    FOREIGN KEY (user_id) REFERENCES users (id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_wallet_snapshots_as_of ON wallet_snapshots(user_id, as_of);
+
+-- دفتر کل فقط-افزودنی است؛ اصلاح با ردیف جبرانی انجام می‌شود
+CREATE TRIGGER IF NOT EXISTS transactions_no_update BEFORE UPDATE ON transactions BEGIN
+    SELECT RAISE(ABORT, 'ledger entries are append-only');
+END;
+
+CREATE TRIGGER IF NOT EXISTS transactions_no_delete BEFORE DELETE ON transactions BEGIN
+    SELECT RAISE(ABORT, 'ledger entries are append-only');
+END;
+
+-- موجودی‌هایی که بدون ردیف دفتر کل ساخته شده‌اند (داده قدیمی) یک ردیف افتتاحیه می‌گیرند
+INSERT INTO transactions (user_id, amount, type, description, created_at)
+SELECT u.id, ROUND(u.wallet_balance - COALESCE(t.total, 0), 2), 'opening_balance', 'Opening balance',
+       COALESCE(u.created_at, CURRENT_TIMESTAMP)
+FROM users u
+LEFT JOIN (SELECT user_id, SUM(amount) AS total FROM transactions GROUP BY user_id) t ON t.user_id = u.id
+WHERE ROUND(COALESCE(u.wallet_balance, 0) - COALESCE(t.total, 0), 2) <> 0;
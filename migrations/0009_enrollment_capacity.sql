@@ -0,0 +1,27 @@
+-- شمارنده ثبت‌نام فعال هر دوره برای بررسی ظرفیت
+ALTER TABLE classes ADD COLUMN enrolled_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE classes SET enrolled_count = (
+    SELECT COUNT(*) FROM enrollments e WHERE e.class_id = classes.id AND e.status = 'active'
+);
+
+-- enrolled_count = تعداد ثبت‌نام‌های فعال؛ همه مسیرهای نوشتن (ثبت‌نام، لغو، انتقال از صف انتظار) را پوشش می‌دهد
+CREATE TRIGGER IF NOT EXISTS enrollments_count_ai AFTER INSERT ON enrollments
+WHEN new.status = 'active'
+BEGIN
+    UPDATE classes SET enrolled_count = enrolled_count + 1 WHERE id = new.class_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS enrollments_count_ad AFTER DELETE ON enrollments
+WHEN old.status = 'active'
+BEGIN
+    UPDATE classes SET enrolled_count = enrolled_count - 1 WHERE id = old.class_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS enrollments_count_au AFTER UPDATE OF status ON enrollments
+WHEN (old.status = 'active') <> (new.status = 'active')
+BEGIN
+    UPDATE classes
+    SET enrolled_count = enrolled_count + CASE WHEN new.status = 'active' THEN 1 ELSE -1 END
+    WHERE id = new.class_id;
+END;
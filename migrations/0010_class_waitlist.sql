@@ -0,0 +1,18 @@
+-- صف انتظار دوره‌های پر
+CREATE TABLE IF NOT EXISTS class_waitlist (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    class_id INTEGER NOT NULL,
+    student_id INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'waiting',
+    reason TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (class_id) REFERENCES classes (id),
+    FOREIGN KEY (student_id) REFERENCES users (id)
+);
+
+-- ترتیب صف = id؛ جایگاه با شمارش بازه‌ای روی همین ایندکس (فقط ورودی‌های جلوتر) به دست می‌آید
+CREATE INDEX IF NOT EXISTS idx_class_waitlist_queue ON class_waitlist(class_id, status, id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_class_waitlist_waiting
+    ON class_waitlist(class_id, student_id) WHERE status = 'waiting';
@@ -0,0 +1,19 @@
+-- ایندکس‌های پرس‌وجوهای پرتکرار؛ test_query_plans.py پیمایش کامل جدول‌های بزرگ را بررسی می‌کند
+
+-- دوره‌های معلم (/teacher/courses، بررسی مالکیت) و جستجو بر اساس نام معلم
+CREATE INDEX IF NOT EXISTS idx_classes_teacher ON classes(teacher_id, id);
+
+-- شمارش و فهرست ثبت‌نام‌های هر دوره (تعداد دانش‌آموز دوره‌های معلم، triggerهای خلاصه پیشرفت)
+CREATE INDEX IF NOT EXISTS idx_enrollments_class ON enrollments(class_id, status, student_id);
+
+-- دوره‌های من به ترتیب ثبت‌نام (صفحه‌بندی keyset روی enrollment_id)
+CREATE INDEX IF NOT EXISTS idx_enrollments_student ON enrollments(student_id, id);
+
+-- آزمون‌های یک دوره و گزارش تحلیلی دوره
+CREATE INDEX IF NOT EXISTS idx_exams_class ON exams(class_id, id);
+
+-- نتایج آزمون‌های دانش‌آموز به ترتیب زمان (صفحه‌بندی keyset روی completed_at, id)
+CREATE INDEX IF NOT EXISTS idx_exam_results_student ON exam_results(student_id, completed_at, id);
+
+-- پیشوند (student_id) ایندکس یکتای (student_id, lesson_id) است
+DROP INDEX IF EXISTS idx_lesson_progress_student;
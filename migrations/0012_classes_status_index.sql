@@ -0,0 +1,2 @@
+-- کاتالوگ /courses: دوره‌های فعال به ترتیب id (صفحه اول keyset بدون پیمایش همه دوره‌ها و فیلتر status)
+CREATE INDEX IF NOT EXISTS idx_classes_status ON classes(status, id);
@@ -0,0 +1,93 @@
+# pagination.py - صفحه‌بندی keyset با cursor مات (opaque) و انتخاب فیلدها (fields=)
+import base64
+import json
+import os
+
+DEFAULT_PAGE_SIZE = int(os.environ.get("DEFAULT_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 200))
+
+
+class PaginationError(ValueError):
+    pass
+
+
+def clamp_limit(limit):
+    if limit is None:
+        return DEFAULT_PAGE_SIZE
+    if limit < 1:
+        raise PaginationError("limit must be at least 1")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, UnicodeError):
+        raise PaginationError("Invalid cursor")
+    if not isinstance(values, list):
+        raise PaginationError("Invalid cursor")
+    return values
+
+
+class KeysetPage:
+    # fields: نام عمومی -> عبارت SQL؛ key: فیلدهایی که ترتیب یکتا می‌سازند (مثلاً created_at, id)
+    def __init__(self, fields, key, descending=False):
+        self.fields = fields
+        self.key = key
+        self.descending = descending
+        missing = [name for name in key if name not in fields]
+        if missing:
+            raise ValueError(f"Key fields not selectable: {missing}")
+
+    def requested_fields(self, fields_param):
+        if not fields_param:
+            return list(self.fields)
+        requested = [name.strip() for name in fields_param.split(",") if name.strip()]
+        unknown = [name for name in requested if name not in self.fields]
+        if unknown:
+            raise PaginationError(f"Unknown fields: {', '.join(unknown)}")
+        return requested
+
+    def select_list(self, requested):
+        # فیلدهای key همیشه انتخاب می‌شوند تا cursor بعدی ساخته شود
+        names = list(requested) + [name for name in self.key if name not in requested]
+        return ", ".join(f"{self.fields[name]} AS {name}" for name in names)
+
+    def where(self, cursor_token):
+        if not cursor_token:
+            return "1 = 1", []
+        values = decode_cursor(cursor_token)
+        if len(values) != len(self.key):
+            raise PaginationError("Invalid cursor")
+        columns = ", ".join(self.fields[name] for name in self.key)
+        placeholders = ", ".join("?" for _ in self.key)
+        op = "<" if self.descending else ">"
+        return f"({columns}) {op} ({placeholders})", values
+
+    def order_by(self):
+        direction = "DESC" if self.descending else "ASC"
+        return ", ".join(f"{self.fields[name]} {direction}" for name in self.key)
+
+    def query(self, fields_param, cursor_token, limit):
+        # خروجی: (select_list, where_sql, where_params, order_by, limit، فیلدهای درخواستی)
+        requested = self.requested_fields(fields_param)
+        limit = clamp_limit(limit)
+        where_sql, where_params = self.where(cursor_token)
+        return self.select_list(requested), where_sql, where_params, self.order_by(), limit, requested
+
+    def finish(self, rows, limit, requested):
+        # یک ردیف اضافه خوانده می‌شود تا وجود صفحه بعد بدون COUNT مشخص شود
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = None
+        if has_more and rows:
+            last = rows[-1]
+            next_cursor = encode_cursor([last[name] for name in self.key])
+        items = [{name: row[name] for name in requested} for row in rows]
+        return items, next_cursor
@@ -0,0 +1,127 @@
+# principal_cache.py - کش درون‌پردازه‌ای هویت کاربران احراز هویت شده (id، username، role)
+# و نسخه توکن (token_version) کاربران برای اعتبارسنجی سریع claimهای JWT
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+Principal = namedtuple("Principal", ["user_id", "username", "role", "approved", "token_version"])
+
+
+class PrincipalCache:
+    def __init__(self, max_size=10000, ttl=300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()   # user_id -> (expires_at, Principal)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return principal
+
+    def put(self, principal):
+        with self._lock:
+            self._entries[principal.user_id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, user_id):
+        # باید بعد از هر تغییر role، approved یا username کاربر صدا زده شود
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class TokenVersions:
+    # فقط کاربرانی که token_version آن‌ها از صفر بیشتر است نگه داشته می‌شوند؛ توکنی که
+    # نسخه آن از مقدار ثبت شده کمتر باشد باطل است. برای دیدن تغییرات workerهای دیگر،
+    # جدول به صورت دوره‌ای دوباره بارگذاری می‌شود.
+    def __init__(self, refresh_interval=30.0):
+        self.refresh_interval = refresh_interval
+        self._versions = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+        self.fast_path = 0
+        self.rejected = 0
+        self.refreshes = 0
+
+    def needs_refresh(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_interval
+
+    def load(self, rows):
+        with self._lock:
+            self._versions = {user_id: version for user_id, version in rows}
+            self._loaded_at = time.monotonic()
+            self.refreshes += 1
+
+    def current(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id, version):
+        with self._lock:
+            if version > self._versions.get(user_id, 0):
+                self._versions[user_id] = version
+
+    def stats(self):
+        with self._lock:
+            return {
+                "tracked_users": len(self._versions),
+                "fast_path": self.fast_path,
+                "rejected": self.rejected,
+                "refreshes": self.refreshes,
+            }
+
+
+principal_cache = PrincipalCache(
+    max_size=int(os.environ.get("PRINCIPAL_CACHE_SIZE", 10000)),
+    ttl=float(os.environ.get("PRINCIPAL_CACHE_TTL", 300)),
+)
+
+
+token_versions = TokenVersions(refresh_interval=float(os.environ.get("TOKEN_VERSION_REFRESH", 30)))
+
+
+def invalidate_principal(user_id):
+    principal_cache.invalidate(user_id)
+
+
+def token_version_changed(user_id, version):
+    # بعد از تغییر رمز، role یا approved (همراه با افزایش users.token_version) صدا زده می‌شود
+    token_versions.bump(user_id, version)
+    principal_cache.invalidate(user_id)
@@ -0,0 +1,137 @@
+# progress_buffer.py - بافر write-behind برای به‌روزرسانی‌های پیشرفت درس (heartbeat پخش‌کننده)
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# upsert به جای INSERT OR REPLACE: ردیف حذف و دوباره ساخته نمی‌شود (id و created_at حفظ می‌شوند).
+# ثبت‌نام هنگام نوشتن دوباره بررسی می‌شود: ردیف بافر شده دانش‌آموزی که ثبت‌نامش لغو شده نوشته نمی‌شود
+PROGRESS_UPSERT_SQL = """
+    INSERT INTO lesson_progress
+    (student_id, lesson_id, class_id, is_completed, progress_percentage, last_position, completed_at, updated_at)
+    SELECT ?1, ?2, ?3, ?4, ?5, ?6, CASE WHEN ?7 THEN ?8 END, ?9
+    WHERE EXISTS (SELECT 1 FROM enrollments WHERE student_id = ?1 AND class_id = ?3)
+    ON CONFLICT(student_id, lesson_id) DO UPDATE SET
+        class_id = excluded.class_id,
+        is_completed = excluded.is_completed,
+        progress_percentage = excluded.progress_percentage,
+        last_position = excluded.last_position,
+        completed_at = CASE WHEN excluded.is_completed
+                            THEN COALESCE(lesson_progress.completed_at, excluded.completed_at)
+                            END,
+        updated_at = excluded.updated_at
+"""
+
+DURABILITY_SYNC = "sync"          # هر درخواست بلافاصله commit می‌شود
+DURABILITY_BUFFERED = "buffered"  # تا flush بعدی (حداکثر flush_interval ثانیه) فقط در حافظه است
+
+
+def progress_row(student_id, lesson_id, class_id, is_completed, progress_percentage, last_position, received_at=None):
+    received_at = received_at or datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    return (
+        student_id, lesson_id, class_id, is_completed, progress_percentage, last_position,
+        is_completed, received_at, received_at
+    )
+
+
+class ProgressBuffer:
+    def __init__(self, max_pending=500, flush_interval=2.0, durability=DURABILITY_BUFFERED):
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self._pending = {}                    # (student_id, lesson_id) -> row
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()   # ترتیب flushها حفظ می‌شود
+        self.received = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+        self.last_flush_ms = 0.0
+
+    def pending_class_id(self, student_id, lesson_id):
+        # اگر همین درس اخیراً معتبر شناخته شده و هنوز در بافر است، بررسی ثبت‌نام لازم نیست
+        with self._lock:
+            row = self._pending.get((student_id, lesson_id))
+            return row[2] if row else None
+
+    def discard_class(self, student_id, class_id):
+        # بعد از لغو ثبت‌نام، heartbeatهای بافر شده آن دوره دور ریخته می‌شوند
+        with self._lock:
+            keys = [key for key, row in self._pending.items() if row[0] == student_id and row[2] == class_id]
+            for key in keys:
+                del self._pending[key]
+            return len(keys)
+
+    def add(self, row):
+        # True یعنی بافر پر شده و باید flush شود
+        with self._lock:
+            key = (row[0], row[1])
+            if key in self._pending:
+                self.coalesced += 1
+            self._pending[key] = row
+            self.received += 1
+            return len(self._pending) >= self.max_pending
+
+    def __len__(self):
+        return len(self._pending)
+
+    def flush(self, conn):
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = {}
+            started = time.perf_counter()
+            try:
+                conn.executemany(PROGRESS_UPSERT_SQL, list(batch.values()))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                # ردیف‌ها به بافر برمی‌گردند مگر اینکه نسخه جدیدتری رسیده باشد
+                with self._lock:
+                    for key, row in batch.items():
+                        self._pending.setdefault(key, row)
+                self.failed_flushes += 1
+                raise
+            self.flushes += 1
+            self.flushed_rows += len(batch)
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 3)
+            return len(batch)
+
+    def stats(self):
+        return {
+            "durability": self.durability,
+            "pending": len(self._pending),
+            "max_pending": self.max_pending,
+            "flush_interval_seconds": self.flush_interval,
+            "received": self.received,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "flushed_rows": self.flushed_rows,
+            "failed_flushes": self.failed_flushes,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+progress_buffer = ProgressBuffer(
+    max_pending=int(os.environ.get("PROGRESS_MAX_PENDING", 500)),
+    flush_interval=float(os.environ.get("PROGRESS_FLUSH_INTERVAL", 2.0)),
+    durability=os.environ.get("PROGRESS_DURABILITY", DURABILITY_BUFFERED),
+)
+
+
+async def periodic_flush(buffer, flush):
+    # flush: coroutine function که بافر را روی یک اتصال pool خالی می‌کند
+    while True:
+        await asyncio.sleep(buffer.flush_interval)
+        if len(buffer):
+            try:
+                await flush()
+            except Exception as e:
+                logger.error(f"Progress flush error: {e}")
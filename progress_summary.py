@@ -0,0 +1,40 @@
+# progress_summary.py - خلاصه پیشرفت هر دانش‌آموز در هر دوره که با trigger به‌صورت افزایشی نگهداری می‌شود
+# completed_lessons فقط دروس منتشر شده را می‌شمارد؛ enrollments.progress هم از همین جدول پر می‌شود
+# جدول و triggerها در migrations/0004_progress_summary.py ساخته می‌شوند
+
+# تعداد دروس منتشر شده کامل شده توسط s.student_id در s.class_id (برای بازسازی کامل)
+_COMPLETED_SQL = """
+    (SELECT COUNT(*) FROM lesson_progress lp
+     JOIN lessons l ON l.id = lp.lesson_id
+     WHERE lp.student_id = {student} AND l.class_id = {klass} AND l.is_published AND lp.is_completed)
+"""
+_TOTAL_SQL = """
+    (SELECT COUNT(*) FROM lessons l WHERE l.class_id = {klass} AND l.is_published)
+"""
+
+SUMMARY_REBUILD = f"""
+    INSERT INTO course_progress_summary (class_id, student_id, completed_lessons, total_published_lessons)
+    SELECT e.class_id, e.student_id,
+           {_COMPLETED_SQL.format(student="e.student_id", klass="e.class_id")},
+           {_TOTAL_SQL.format(klass="e.class_id")}
+    FROM enrollments e
+"""
+
+
+def rebuild_progress_summary(cursor):
+    # بازسازی کامل از روی جداول اصلی (بعد از بارگذاری انبوه داده)
+    cursor.execute("DELETE FROM course_progress_summary")
+    cursor.execute(SUMMARY_REBUILD)
+
+
+def get_summary(cursor, student_id, class_id):
+    cursor.execute("""
+        SELECT completed_lessons, total_published_lessons
+        FROM course_progress_summary
+        WHERE class_id = ? AND student_id = ?
+    """, (class_id, student_id))
+    return cursor.fetchone()
+
+
+def percentage(completed, total):
+    return round(completed * 100.0 / total, 2) if total > 0 else 0
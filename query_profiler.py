@@ -0,0 +1,226 @@
+# query_profiler.py - پروفایل دستورهای SQL روی اتصال‌های sqlite3 (اختیاری و نمونه‌برداری شده)
+# با QUERY_PROFILE=1 اتصال‌های pool و get_db_connection از ProfilingConnection ساخته می‌شوند.
+# از هر QUERY_PROFILE_SAMPLE (پیش‌فرض 0.1) اجرا یکی اندازه گرفته می‌شود؛ اجرای نمونه‌برداری نشده فقط یک
+# فراخوانی random() هزینه دارد. آمار بر اساس متن یکسان‌سازی شده (لیترال‌ها -> ?) جمع می‌شود و دستورهای
+# کندتر از QUERY_SLOW_MS همراه با EXPLAIN QUERY PLAN در log ثبت می‌شوند (برای هر دستور حداکثر هر دقیقه یک بار).
+#   QUERY_PROFILE=1 QUERY_PROFILE_SAMPLE=0.05 QUERY_SLOW_MS=50
+import logging
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("QUERY_PROFILE", "0") == "1"
+SAMPLE_RATE = float(os.environ.get("QUERY_PROFILE_SAMPLE", 0.1))
+SLOW_MS = float(os.environ.get("QUERY_SLOW_MS", 100))
+MAX_STATEMENTS = int(os.environ.get("QUERY_PROFILE_MAX_STATEMENTS", 2000))
+SLOW_LOG_INTERVAL = 60.0
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+SORT_KEYS = ("total_ms", "mean_ms", "max_ms", "count", "rows")
+
+
+def normalize_sql(sql):
+    # لیترال‌ها و لیست‌های IN با طول متفاوت یک دستور حساب می‌شوند
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(?...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+class _Statement:
+    __slots__ = ("sql", "count", "total", "max", "rows", "slow", "plan", "logged_at")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.slow = 0
+        self.plan = None
+        self.logged_at = 0.0
+
+    def to_dict(self):
+        return {
+            "sql": self.sql,
+            "count": self.count,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "rows": self.rows,
+            "slow": self.slow,
+            "plan": self.plan,
+        }
+
+
+class QueryProfiler:
+    def __init__(self, sample_rate=SAMPLE_RATE, slow_ms=SLOW_MS, max_statements=MAX_STATEMENTS):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_ms / 1000
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._normalized = {}   # متن خام -> متن یکسان‌سازی شده (متن‌ها در کد ثابت‌اند)
+        self.sampled = 0
+        self.dropped = 0
+        self.started_at = time.time()
+
+    def sample(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def statement(self, sql):
+        key = self._normalized.get(sql)
+        if key is None:
+            key = normalize_sql(sql)
+            if len(self._normalized) < self.max_statements * 4:
+                self._normalized[sql] = key
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                if len(self._statements) >= self.max_statements:
+                    self.dropped += 1
+                    return None
+                entry = self._statements[key] = _Statement(key)
+            entry.count += 1
+            self.sampled += 1
+        return entry
+
+    def add(self, call, elapsed, rows, cursor):
+        # call: [entry، زمان تجمعی این اجرا، کند ثبت شده؟، sql، params]
+        entry = call[0]
+        call[1] += elapsed
+        with self._lock:
+            entry.total += elapsed
+            entry.rows += rows
+            if call[1] > entry.max:
+                entry.max = call[1]
+            log_slow = False
+            if not call[2] and call[1] >= self.slow_seconds:
+                call[2] = True
+                entry.slow += 1
+                now = time.monotonic()
+                if now - entry.logged_at >= SLOW_LOG_INTERVAL:
+                    entry.logged_at = now
+                    log_slow = True
+        if log_slow:
+            self._log_slow(entry, call, cursor)
+
+    def _log_slow(self, entry, call, cursor):
+        try:
+            # cursor پایه sqlite3 تا EXPLAIN خودش پروفایل نشود و cursor در حال خواندن دست نخورد
+            explain = sqlite3.Cursor(cursor.connection)
+            explain.execute("EXPLAIN QUERY PLAN " + call[3], call[4])
+            entry.plan = " | ".join(row[3] for row in explain.fetchall())
+        except Exception as e:
+            entry.plan = f"EXPLAIN failed: {e}"
+        logger.warning(f"Slow query {call[1] * 1000:.1f} ms: {entry.sql[:500]} -- plan: {entry.plan}")
+
+    def report(self, limit=20, sort="total_ms"):
+        with self._lock:
+            rows = [entry.to_dict() for entry in self._statements.values()]
+            sampled, dropped = self.sampled, self.dropped
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        return {
+            "enabled": ENABLED,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_seconds * 1000,
+            "since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "statements": len(rows),
+            "sampled_executions": sampled,
+            "dropped_executions": dropped,
+            "top": rows[:limit],
+        }
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self.sampled = 0
+            self.dropped = 0
+            self.started_at = time.time()
+
+
+profiler = QueryProfiler()
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    # زمان execute و fetchهای بعدی روی همان اجرا جمع می‌شود؛ ردیف‌ها از fetch (SELECT) یا rowcount (DML)
+    _call = None
+
+    def _measure(self, method, sql, params):
+        self._call = None
+        if not profiler.sample():
+            return method(sql, params)
+        entry = profiler.statement(sql)
+        if entry is None:
+            return method(sql, params)
+        call = [entry, 0.0, False, sql, params]
+        start = time.perf_counter()
+        result = method(sql, params)
+        elapsed = time.perf_counter() - start
+        rows = self.rowcount if self.description is None and self.rowcount > 0 else 0
+        self._call = call
+        profiler.add(call, elapsed, rows, self)
+        return result
+
+    def execute(self, sql, parameters=()):
+        return self._measure(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        # EXPLAIN با پارامترهای executemany ممکن نیست؛ فقط زمان و rowcount
+        self._call = None
+        if not profiler.sample():
+            return super().executemany(sql, seq_of_parameters)
+        entry = profiler.statement(sql)
+        if entry is None:
+            return super().executemany(sql, seq_of_parameters)
+        start = time.perf_counter()
+        result = super().executemany(sql, seq_of_parameters)
+        profiler.add([entry, 0.0, True, sql, ()], time.perf_counter() - start, max(self.rowcount, 0), self)
+        return result
+
+    def _fetch(self, method, *args):
+        call = self._call
+        if call is None:
+            return method(*args)
+        start = time.perf_counter()
+        result = method(*args)
+        if isinstance(result, list):
+            rows = len(result)
+        else:
+            rows = 0 if result is None else 1
+        profiler.add(call, time.perf_counter() - start, rows, self)
+        return result
+
+    def fetchone(self):
+        return self._fetch(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch(super().fetchmany, self.arraysize if size is None else size)
+
+    def fetchall(self):
+        return self._fetch(super().fetchall)
+
+
+class ProfilingConnection(sqlite3.Connection):
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    # execute روی اتصال در C یک cursor پایه می‌سازد؛ اینجا از cursor پروفایل شده استفاده می‌شود
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connection_factory():
+    return ProfilingConnection if ENABLED else sqlite3.Connection
@@ -0,0 +1,98 @@
+# response_cache.py - کش پاسخ‌های JSON عمومی با نسخه‌بندی namespace و ETag قوی
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def dumps(payload):
+    # همان تنظیمات JSONResponse در FastAPI
+    return json.dumps(payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class VersionedResponseCache:
+    # هر namespace یک شمارنده نسخه دارد؛ هر نوشتن مرتبط با bump نسخه را بالا می‌برد و
+    # همه ورودی‌های قبلی بدون پیمایش غیرقابل دسترس می‌شوند. ttl تأخیر دیدن
+    # تغییرات workerهای دیگر را محدود می‌کند.
+    def __init__(self, max_entries=256, ttl=30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._versions = {}
+        self._entries = OrderedDict()   # (namespace, version, key) -> (expires_at, etag, body)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def version(self, namespace):
+        return self._versions.get(namespace, 0)
+
+    def bump(self, namespace):
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+
+    def get(self, namespace, key):
+        with self._lock:
+            cache_key = (namespace, self._versions.get(namespace, 0), key)
+            entry = self._entries.get(cache_key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[cache_key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(cache_key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, namespace, version, key, payload):
+        # version باید قبل از خواندن داده‌ها گرفته شود تا نتیجه قدیمی ذخیره نشود
+        body = dumps(payload)
+        etag = make_etag(body)
+        with self._lock:
+            if version == self._versions.get(namespace, 0):
+                self._entries[(namespace, version, key)] = (time.monotonic() + self.ttl, etag, body)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return etag, body
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "versions": dict(self._versions),
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+            }
+
+
+response_cache = VersionedResponseCache(
+    max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", 256)),
+    ttl=float(os.environ.get("RESPONSE_CACHE_TTL", 30)),
+)
+
+CATALOG = "catalog"
+
+
+def invalidate_catalog():
+    response_cache.bump(CATALOG)
@@ -0,0 +1,100 @@
+# search.py - جستجوی متن کامل دوره‌ها و دروس با SQLite FTS5 و جستجوی پیشوندی روی ستون‌های یکسان‌سازی شده
+import re
+
+from text_normalize import normalize_text, prefix_range
+
+# جداول classes_fts و lessons_fts، ستون‌های *_norm و triggerهای همگام‌سازی در migrations/0003_text_search.py
+# ساخته می‌شوند؛ متن قبل از ایندکس با normalize_text یکسان‌سازی می‌شود
+
+# بازسازی کامل ایندکس (بعد از بارگذاری انبوه داده بدون trigger)
+SEARCH_REBUILD = {
+    "classes_fts": """
+        INSERT INTO classes_fts(rowid, title, description, category)
+        SELECT id, normalize_text(title), normalize_text(description), normalize_text(category) FROM classes
+    """,
+    "lessons_fts": """
+        INSERT INTO lessons_fts(rowid, title, description)
+        SELECT id, normalize_text(title), normalize_text(description) FROM lessons
+    """,
+}
+
+# وزن ستون‌ها در bm25: عنوان مهم‌تر از توضیحات
+CLASS_WEIGHTS = "10.0, 2.0, 4.0"
+LESSON_WEIGHTS = "10.0, 2.0"
+
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_match_query(text):
+    # ورودی کاربر یکسان‌سازی و به عبارت FTS امن تبدیل می‌شود: هر کلمه در کوتیشن و با پیشوند (*)
+    terms = _TERM_RE.findall(normalize_text(text) or "")
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def search_courses(cursor, match, limit):
+    cursor.execute(f"""
+        SELECT c.id, c.title, c.category, c.level,
+               snippet(classes_fts, -1, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 12) AS snippet,
+               bm25(classes_fts, {CLASS_WEIGHTS}) AS score
+        FROM classes_fts
+        JOIN classes c ON c.id = classes_fts.rowid
+        WHERE classes_fts MATCH ? AND c.status = 'active'
+        ORDER BY score
+        LIMIT ?
+    """, (match, limit))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def search_lessons(cursor, match, limit):
+    cursor.execute(f"""
+        SELECT l.id, l.class_id, l.title, l.content_type,
+               snippet(lessons_fts, -1, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 12) AS snippet,
+               bm25(lessons_fts, {LESSON_WEIGHTS}) AS score
+        FROM lessons_fts
+        JOIN lessons l ON l.id = lessons_fts.rowid
+        JOIN classes c ON c.id = l.class_id
+        WHERE lessons_fts MATCH ? AND l.is_published = TRUE AND c.status = 'active'
+        ORDER BY score
+        LIMIT ?
+    """, (match, limit))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def lookup_by_title(cursor, text, limit):
+    # جستجوی پیشوندی روی title_norm با ایندکس (بدون پیمایش جدول)
+    low, high = prefix_range(text)
+    cursor.execute("""
+        SELECT c.id, c.title, c.category, c.level
+        FROM classes c
+        WHERE c.title_norm >= ? AND c.title_norm < ? AND c.status = 'active'
+        ORDER BY c.title_norm
+        LIMIT ?
+    """, (low, high, limit))
+    courses = [dict(row) for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT l.id, l.class_id, l.title, l.content_type
+        FROM lessons l
+        JOIN classes c ON c.id = l.class_id
+        WHERE l.title_norm >= ? AND l.title_norm < ? AND l.is_published = TRUE AND c.status = 'active'
+        ORDER BY l.title_norm
+        LIMIT ?
+    """, (low, high, limit))
+    return {"courses": courses, "lessons": [dict(row) for row in cursor.fetchall()]}
+
+
+def lookup_by_teacher(cursor, text, limit):
+    low, high = prefix_range(text)
+    # CROSS JOIN ترتیب حلقه را ثابت می‌کند: محدوده نام معلم روی ایندکس users و بعد دوره‌های هر معلم؛
+    # با آمار دیتابیس‌های بزرگ planner بدون آن کل classes را پیمایش می‌کرد
+    cursor.execute("""
+        SELECT c.id, c.title, c.category, c.level, u.full_name AS teacher_name
+        FROM users u
+        CROSS JOIN classes c ON c.teacher_id = u.id
+        WHERE u.full_name_norm >= ? AND u.full_name_norm < ? AND u.role = 'teacher' AND c.status = 'active'
+        ORDER BY u.full_name_norm, c.id
+        LIMIT ?
+    """, (low, high, limit))
+    return [dict(row) for row in cursor.fetchall()]
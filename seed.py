@@ -0,0 +1,114 @@
+# seed.py - داده‌های نمونه (کاربران تست، دوره‌ها، دروس و ثبت‌نام‌ها) برای دیتابیس خالی
+# بعد از migrationها در راه‌اندازی سرور (init_db) یا دستی اجرا می‌شود:  python seed.py
+import logging
+import sys
+
+from ledger import record_opening_balances
+from migrate import connect, upgrade, current_version, MigrationError
+
+logger = logging.getLogger(__name__)
+
+# hash bcrypt رمزهای نمونه از قبل محاسبه شده تا seed روی سرور کند نباشد
+# admin123 / teacher123 / student123
+ADMIN_HASH = "$2b$12$K3Dvp97Sg5u.8nI4CYes7uHkIyfKGkaBFJ9aOfQ5q5Va5lpuBd4/6"
+TEACHER_HASH = "$2b$12$yCnRZHEUgkMjkvNI.2wwkOiXJmxqojizBzQcZlgyCH5m8TM6/okCO"
+STUDENT_HASH = "$2b$12$0p946VKXDN2ib5/4ekJ2IuLTv90n/7LhPe6sLbk/FpCEueFXXVujm"
+
+TEST_USERS = [
+    ('admin@quran.com', ADMIN_HASH, 'admin', 'Admin User', 'admin@quran.com', '', 100, True),
+    ('teacher1', TEACHER_HASH, 'teacher', 'استاد احمد', 'teacher1@quran.com', 'Quran Recitation', 500, True),
+    ('student1@quran.com', STUDENT_HASH, 'student', 'دانشجو محمد', 'student1@quran.com', '', 50, True),
+    ('student2@quran.com', STUDENT_HASH, 'student', 'دانشجو فاطمه', 'student2@quran.com', '', 75, True)
+]
+
+TEST_CLASSES = [
+    ('Basic Quran Reading', 'Learn to read Quran from basics', 'Beginner', 'Recitation', 60, 0, 20, 'Mon, Wed, Fri 10:00-11:00'),
+    ('Tajweed Fundamentals', 'Learn proper pronunciation rules', 'Intermediate', 'Tajweed', 60, 25, 15, 'Tue, Thu 14:00-15:00'),
+    ('Advanced Recitation', 'Master Quran recitation', 'Advanced', 'Recitation', 90, 50, 10, 'Sat, Sun 09:00-10:30')
+]
+
+# (اندیس دوره، ...)
+TEST_LESSONS = [
+    (0, 'Introduction to Arabic Letters', 'text', None, 15, 1, 'Learn the basics of Arabic alphabet', True),
+    (0, 'Basic Pronunciation', 'video', 'https://example.com/video1.mp4', 20, 2, 'Practice basic sounds', True),
+    (0, 'Reading Practice', 'text', None, 25, 3, 'Practice reading simple words', True),
+    (1, 'Tajweed Rules Overview', 'text', None, 30, 1, 'Introduction to Tajweed rules', True),
+    (1, 'Practice Session 1', 'audio', 'https://example.com/audio1.mp3', 25, 2, 'First practice session', True),
+    (2, 'Advanced Techniques', 'video', 'https://example.com/video2.mp4', 40, 1, 'Learn advanced recitation techniques', True)
+]
+
+# (username دانش‌آموز، اندیس دوره، پیشرفت)
+TEST_ENROLLMENTS = [
+    ('student1@quran.com', 0, 25),
+    ('student1@quran.com', 1, 50),
+    ('student2@quran.com', 0, 15)
+]
+
+
+def seed(conn):
+    # فقط روی دیتابیس بدون کاربر اجرا می‌شود؛ خروجی: آیا داده اضافه شد
+    cursor = conn.cursor()
+    cursor.execute("BEGIN IMMEDIATE")
+    try:
+        cursor.execute("SELECT COUNT(*) FROM users")
+        if cursor.fetchone()[0]:
+            cursor.execute("ROLLBACK")
+            return False
+
+        user_ids = {}
+        for user in TEST_USERS:
+            cursor.execute(
+                "INSERT INTO users (username, password, role, full_name, email, specialty, wallet_balance, approved) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                user
+            )
+            user_ids[user[0]] = cursor.lastrowid
+            if user[2] == 'student':
+                cursor.execute("INSERT INTO students (user_id, level) VALUES (?, ?)", (cursor.lastrowid, 'Beginner'))
+            elif user[2] == 'teacher':
+                cursor.execute("INSERT INTO teachers (user_id, experience) VALUES (?, ?)", (cursor.lastrowid, '5 years experience'))
+
+        class_ids = []
+        for class_data in TEST_CLASSES:
+            cursor.execute(
+                "INSERT INTO classes (teacher_id, title, description, level, category, duration, price, max_students, schedule) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (user_ids['teacher1'], *class_data)
+            )
+            class_ids.append(cursor.lastrowid)
+
+        cursor.executemany(
+            "INSERT INTO lessons (class_id, title, content_type, content_url, duration, order_index, description, is_published) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(class_ids[index], *lesson) for index, *lesson in TEST_LESSONS]
+        )
+        cursor.executemany(
+            "INSERT INTO enrollments (student_id, class_id, progress) VALUES (?, ?, ?)",
+            [(user_ids[username], class_ids[index], progress) for username, index, progress in TEST_ENROLLMENTS]
+        )
+
+        # موجودی اولیه کاربران تست در دفتر کل ثبت می‌شود
+        record_opening_balances(cursor)
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+    return True
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    conn = connect()
+    try:
+        applied = upgrade(conn)
+        if applied:
+            print(f"Applied {len(applied)} migrations; schema version {current_version(conn)}")
+        if seed(conn):
+            print("Sample data inserted")
+            print("Admin: admin@quran.com / admin123")
+            print("Teacher: teacher1 / teacher123")
+            print("Students: student1@quran.com, student2@quran.com / student123")
+        else:
+            print("Database already has users; skipping sample data")
+    except MigrationError as e:
+        print(f"Migration error: {e}")
+        sys.exit(1)
+    finally:
+        conn.close()
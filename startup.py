@@ -0,0 +1,123 @@
+# startup.py - زمان‌بندی مراحل راه‌اندازی و وضعیت آماده بودن برنامه
+# پورت فوراً باز می‌شود؛ راه‌اندازی DB در پس‌زمینه انجام می‌شود و تا آن زمان /health وضعیت warming
+# برمی‌گرداند و بقیه درخواست‌ها تا آماده شدن (حداکثر READY_TIMEOUT ثانیه) منتظر می‌مانند.
+#   STARTUP_PROFILE=1  گزارش زمان import و راه‌اندازی در log
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILE = os.environ.get("STARTUP_PROFILE", "0") == "1"
+READY_TIMEOUT = float(os.environ.get("STARTUP_READY_TIMEOUT", 30))
+
+# اولین import این ماژول (ابتدای backend.py) مبدأ زمان‌هاست
+_ORIGIN = time.perf_counter()
+
+
+class StartupState:
+    def __init__(self):
+        self.phases = []
+        self.state = "starting"
+        self.error = None
+        self.ready_ms = None
+        self._import_phases = None
+        self._last = _ORIGIN
+        self._event = None
+
+    def _elapsed_ms(self, since=_ORIGIN):
+        return round((time.perf_counter() - since) * 1000, 1)
+
+    def mark(self, name):
+        # مدت از mark قبلی؛ برای بخش‌های پشت سر هم مثل گروه‌های import
+        now = time.perf_counter()
+        self.phases.append({"phase": name, "ms": round((now - self._last) * 1000, 1), "at_ms": self._elapsed_ms()})
+        self._last = now
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({"phase": name, "ms": self._elapsed_ms(start), "at_ms": self._elapsed_ms()})
+
+    def begin(self):
+        # در lifespan صدا زده می‌شود تا Event به event loop همان اجرا تعلق داشته باشد؛
+        # مراحل اجرای قبلی lifespan (مثلاً در تست‌ها) پاک می‌شوند ولی زمان importها می‌ماند
+        if self._import_phases is None:
+            self._import_phases = len(self.phases)
+        del self.phases[self._import_phases:]
+        self.state = "warming"
+        self.error = None
+        self._event = asyncio.Event()
+
+    def set_ready(self):
+        self.state = "ready"
+        self.ready_ms = self._elapsed_ms()
+        self._event.set()
+
+    def set_failed(self, error):
+        self.state = "failed"
+        self.error = str(error)
+        self._event.set()
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    async def wait_ready(self, timeout=READY_TIMEOUT):
+        if self.ready:
+            return True
+        if self._event is None:
+            return False
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return self.ready
+
+    def stats(self):
+        result = {"state": self.state, "ready_ms": self.ready_ms, "phases": self.phases}
+        if self.error:
+            result["error"] = self.error
+        return result
+
+    def report(self):
+        if not PROFILE:
+            return
+        lines = [f"  {p['phase']:<32} {p['ms']:>8.1f} ms  (at {p['at_ms']:.1f} ms)" for p in self.phases]
+        logger.info("Startup profile:\n" + "\n".join(lines) + f"\n  ready after {self.ready_ms} ms")
+
+
+class ReadinessMiddleware:
+    # middleware ASGI خام (بدون BaseHTTPMiddleware)؛ بعد از آماده شدن فقط یک بررسی attribute هزینه دارد
+    def __init__(self, app, state, exempt_paths=("/health",)):
+        self.app = app
+        self.state = state
+        self.exempt_paths = set(exempt_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.state.ready or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        if await self.state.wait_ready():
+            await self.app(scope, receive, send)
+            return
+        body = json.dumps({"detail": "Service is starting, try again shortly", "startup": self.state.state}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", b"2"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+startup = StartupState()
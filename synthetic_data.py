@@ -0,0 +1,451 @@
+# synthetic_data.py - تولید داده مصنوعی بزرگ با همان schema برای سنجش کارایی
+# توزیع‌ها کج هستند (دوره‌های پرطرفدار، دانش‌آموزان پرکار، معلم‌های پرکار) و با seed ثابت تکرارپذیرند.
+# بارگذاری با executemany در تراکنش‌های بزرگ انجام می‌شود؛ triggerها و ایندکس‌های ثانویه در طول بارگذاری
+# برداشته و بعد دوباره ساخته می‌شوند و داده‌های مشتق (FTS، خلاصه پیشرفت، enrolled_count، موجودی کیف پول،
+# آمار آزمون‌ها) یک بار از روی جداول اصلی بازسازی می‌شوند.
+#
+#   python synthetic_data.py --db /tmp/large.sqlite3 --scale large --seed 42
+#   python synthetic_data.py --db /tmp/x.sqlite3 --scale small --users 50000 --progress 500000
+#
+# رمز همه کاربران: دانش‌آموزان student123 (student{n}@example.com) و معلم‌ها teacher123 (teacher{n})
+import argparse
+import array
+import itertools
+import json
+import logging
+import random
+import sys
+import time
+from contextlib import contextmanager
+
+import migrate
+from enrollment import recount_enrollments
+from exam_analytics import rebuild_exam_stats
+from exam_store import question_rows
+from grading import CompiledExam, answer_key_rows, grade_submission
+from progress_summary import rebuild_progress_summary
+from search import SEARCH_REBUILD
+from seed import STUDENT_HASH, TEACHER_HASH
+from text_normalize import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# transactions تعداد واریزهاست؛ پرداخت دوره‌های پولی (دو ردیف برای هر ثبت‌نام) جداگانه اضافه می‌شود
+# progress هدف تقریبی است (تعداد دروس هر دوره سقف آن است)
+SCALES = {
+    "tiny": dict(users=2_000, classes=100, progress=20_000, transactions=5_000, exams=200, exam_results=5_000),
+    "small": dict(users=20_000, classes=1_000, progress=200_000, transactions=50_000, exams=2_000, exam_results=50_000),
+    "medium": dict(users=200_000, classes=10_000, progress=2_000_000, transactions=500_000, exams=20_000, exam_results=500_000),
+    "large": dict(users=1_000_000, classes=50_000, progress=10_000_000, transactions=2_000_000, exams=100_000, exam_results=2_000_000),
+}
+
+BATCH_ROWS = 50_000
+TEACHER_RATIO = 0.02
+POPULARITY_EXPONENT = 1.1        # Zipf برای محبوبیت دوره‌ها و تعداد دوره‌های هر معلم
+ENROLLMENT_PARETO = 1.5          # تعداد ثبت‌نام هر دانش‌آموز: 1 + Pareto (میانگین حدود 3)
+MAX_ENROLLMENTS_PER_STUDENT = 60
+START_TS = 1704067200            # 2024-01-01
+SPAN_SECONDS = 365 * 24 * 3600
+PRICES = (0, 0, 0, 0, 10, 25, 25, 50, 100)
+
+TOPICS = [
+    "Tajweed", "Recitation", "Memorization", "Tafsir", "Makharij", "Arabic Grammar",
+    "تجوید", "قرائت", "حفظ قرآن", "تفسیر", "مخارج الحروف", "صرف و نحو", "ترتیل", "الوقف والابتداء",
+]
+LEVELS = ("Beginner", "Intermediate", "Advanced")
+CONTENT_TYPES = ("text", "video", "audio")
+FIRST_NAMES = ["Ahmad", "Fatima", "Mohammad", "Zahra", "Ali", "Maryam", "Hassan", "Sara", "محمد", "فاطمه", "علی", "زهرا"]
+LAST_NAMES = ["Karimi", "Rahimi", "Hosseini", "Ahmadi", "Rezaei", "کریمی", "رحیمی", "حسینی", "احمدی"]
+
+
+def zipf_cum_weights(n, exponent=POPULARITY_EXPONENT):
+    total = 0.0
+    weights = []
+    for rank in range(1, n + 1):
+        total += 1.0 / rank ** exponent
+        weights.append(total)
+    return weights
+
+
+def batched(rows, size=BATCH_ROWS):
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _next_id(cursor, table):
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+@contextmanager
+def bulk_load(conn):
+    # triggerها و ایندکس‌های ثانویه (نه UNIQUE ضمنی جداول) برداشته و بعد با همان SQL دوباره ساخته می‌شوند
+    cursor = conn.cursor()
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")
+    triggers = cursor.fetchall()
+    cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")
+    indexes = cursor.fetchall()
+    cursor.execute("PRAGMA journal_mode = MEMORY")
+    cursor.execute("PRAGMA synchronous = OFF")
+    cursor.execute("PRAGMA cache_size = -262144")
+    cursor.execute("PRAGMA temp_store = MEMORY")
+    for name, _ in triggers:
+        cursor.execute(f'DROP TRIGGER "{name}"')
+    for name, _ in indexes:
+        cursor.execute(f'DROP INDEX "{name}"')
+    try:
+        yield cursor
+    finally:
+        start = time.perf_counter()
+        for _, sql in indexes:
+            cursor.execute(sql)
+        logger.info(f"Recreated {len(indexes)} indexes in {time.perf_counter() - start:.1f}s")
+        for _, sql in triggers:
+            cursor.execute(sql)
+        cursor.execute("PRAGMA synchronous = FULL")
+        cursor.execute("PRAGMA journal_mode = WAL")
+
+
+class Generator:
+    def __init__(self, conn, seed=42, users=20_000, classes=1_000, progress=200_000,
+                 transactions=50_000, exams=2_000, exam_results=50_000):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.rng = random.Random(seed)
+        self.n_users = users
+        self.n_teachers = max(1, int(users * TEACHER_RATIO))
+        self.n_classes = classes
+        self.n_progress = progress
+        self.n_transactions = transactions
+        self.n_exams = exams
+        self.n_exam_results = exam_results
+        self.counts = {}
+
+    def _timestamp(self):
+        return START_TS + self.rng.randrange(SPAN_SECONDS)
+
+    def _insert(self, table, sql, rows):
+        start = time.perf_counter()
+        count = 0
+        self.cursor.execute("BEGIN")
+        for batch in batched(rows):
+            self.cursor.executemany(sql, batch)
+            count += len(batch)
+        self.cursor.execute("COMMIT")
+        self.counts[table] = self.counts.get(table, 0) + count
+        elapsed = time.perf_counter() - start
+        logger.info(f"{table}: {count} rows in {elapsed:.1f}s ({count / elapsed if elapsed else 0:,.0f} rows/s)")
+
+    def users(self):
+        rng = self.rng
+        self.first_user = _next_id(self.cursor, "users")
+        self.first_teacher = self.first_user
+        self.first_student = self.first_user + self.n_teachers
+        self.n_students = self.n_users - self.n_teachers
+
+        def rows():
+            for i in range(self.n_users):
+                user_id = self.first_user + i
+                name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+                if i < self.n_teachers:
+                    yield (user_id, f"teacher{i}", TEACHER_HASH, "teacher", name, normalize_text(name),
+                           f"teacher{i}@example.com", rng.choice(TOPICS), self._timestamp())
+                else:
+                    n = i - self.n_teachers
+                    yield (user_id, f"student{n}@example.com", STUDENT_HASH, "student", name, normalize_text(name),
+                           f"student{n}@example.com", "", self._timestamp())
+
+        self._insert("users", """
+            INSERT INTO users (id, username, password, role, full_name, full_name_norm, email, specialty,
+                               wallet_balance, approved, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, TRUE, datetime(?, 'unixepoch'))
+        """, rows())
+        self._insert("teachers", "INSERT INTO teachers (user_id, experience) VALUES (?, ?)", (
+            (self.first_teacher + i, f"{rng.randint(1, 30)} years experience") for i in range(self.n_teachers)
+        ))
+        self._insert("students", "INSERT INTO students (user_id, level) VALUES (?, ?)", (
+            (self.first_student + i, rng.choice(LEVELS)) for i in range(self.n_students)
+        ))
+
+    def classes(self):
+        rng = self.rng
+        self.first_class = _next_id(self.cursor, "classes")
+        self.first_lesson = _next_id(self.cursor, "lessons")
+        # معلم‌های پرکار دوره‌های بیشتری دارند
+        teacher_weights = zipf_cum_weights(self.n_teachers)
+        teachers = rng.choices(range(self.n_teachers), cum_weights=teacher_weights, k=self.n_classes)
+        self.class_teacher = array.array("q", (self.first_teacher + t for t in teachers))
+        self.class_price = array.array("d", (rng.choice(PRICES) for _ in range(self.n_classes)))
+        self.lesson_count = array.array("l", (rng.randint(5, 40) for _ in range(self.n_classes)))
+        self.lesson_start = array.array("q")
+        next_lesson = self.first_lesson
+        for count in self.lesson_count:
+            self.lesson_start.append(next_lesson)
+            next_lesson += count
+
+        def class_rows():
+            for i in range(self.n_classes):
+                topic = rng.choice(TOPICS)
+                level = rng.choice(LEVELS)
+                title = f"{topic} {level} {i}"
+                yield (self.first_class + i, self.class_teacher[i], title, normalize_text(title),
+                       f"{topic} course for {level.lower()} students", level, topic, rng.choice((30, 45, 60, 90)),
+                       self.class_price[i], rng.choice((10, 20, 50, 100)), self._timestamp())
+
+        self._insert("classes", """
+            INSERT INTO classes (id, teacher_id, title, title_norm, description, level, category, duration,
+                                 price, max_students, status, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'active', datetime(?, 'unixepoch'))
+        """, class_rows())
+
+        def lesson_rows():
+            for i in range(self.n_classes):
+                for order in range(self.lesson_count[i]):
+                    title = f"{rng.choice(TOPICS)} {order + 1}"
+                    kind = rng.choice(CONTENT_TYPES)
+                    yield (self.lesson_start[i] + order, self.first_class + i, title, normalize_text(title), kind,
+                           None if kind == "text" else f"https://example.com/{kind}/{i}/{order}",
+                           rng.randint(5, 45), order + 1, f"Lesson {order + 1}", rng.random() < 0.95)
+
+        self._insert("lessons", """
+            INSERT INTO lessons (id, class_id, title, title_norm, content_type, content_url, duration,
+                                 order_index, description, is_published)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, lesson_rows())
+
+    def enrollments(self):
+        rng = self.rng
+        self.first_enrollment = _next_id(self.cursor, "enrollments")
+        # رتبه محبوبیت -> دوره (جایگشت تصادفی تا دوره‌های پرطرفدار فقط idهای کوچک نباشند)
+        popular = list(range(self.n_classes))
+        rng.shuffle(popular)
+        class_weights = zipf_cum_weights(self.n_classes)
+        self.enroll_student = array.array("q")
+        self.enroll_class = array.array("l")
+        for s in range(self.n_students):
+            wanted = min(MAX_ENROLLMENTS_PER_STUDENT, self.n_classes, int(rng.paretovariate(ENROLLMENT_PARETO)))
+            chosen = {popular[r] for r in rng.choices(range(self.n_classes), cum_weights=class_weights, k=wanted)}
+            for class_index in chosen:
+                self.enroll_student.append(self.first_student + s)
+                self.enroll_class.append(class_index)
+
+        self._insert("enrollments", """
+            INSERT INTO enrollments (id, student_id, class_id, status, progress, enrolled_at)
+            VALUES (?, ?, ?, 'active', 0, datetime(?, 'unixepoch'))
+        """, (
+            (self.first_enrollment + i, student, self.first_class + class_index, self._timestamp())
+            for i, (student, class_index) in enumerate(zip(self.enroll_student, self.enroll_class))
+        ))
+
+    def lesson_progress(self):
+        rng = self.rng
+        # دانش‌آموز دروس را به ترتیب جلو می‌برد؛ میانگین تعداد دروس هر ثبت‌نام از هدف progress به دست می‌آید
+        mean = self.n_progress / max(1, len(self.enroll_student))
+
+        def rows():
+            for student, class_index in zip(self.enroll_student, self.enroll_class):
+                count = min(self.lesson_count[class_index], int(rng.expovariate(1.0 / mean)) if mean else 0)
+                start = self.lesson_start[class_index]
+                ts = self._timestamp()
+                for order in range(count):
+                    done = order < count - 1 or rng.random() < 0.5
+                    ts += rng.randint(600, 7 * 86400)
+                    yield (student, start + order, self.first_class + class_index, done,
+                           ts if done else None, 100 if done else rng.randint(0, 95), rng.randint(0, 3600), ts, ts)
+
+        self._insert("lesson_progress", """
+            INSERT INTO lesson_progress (student_id, lesson_id, class_id, is_completed, completed_at,
+                                         progress_percentage, last_position, created_at, updated_at)
+            VALUES (?, ?, ?, ?, datetime(?, 'unixepoch'), ?, ?, datetime(?, 'unixepoch'), datetime(?, 'unixepoch'))
+        """, rows())
+
+    def transactions(self):
+        rng = self.rng
+        # پرداخت ثبت‌نام دوره‌های پولی (برداشت دانش‌آموز، واریز معلم) + واریزهای کج (دانش‌آموزان پرکار)
+        balance = array.array("d", bytes(8 * self.n_users))
+        rows = []
+
+        def payments():
+            for i, (student, class_index) in enumerate(zip(self.enroll_student, self.enroll_class)):
+                price = self.class_price[class_index]
+                if not price:
+                    continue
+                key = f"enrollment:{self.first_enrollment + i}"
+                ts = self._timestamp()
+                teacher = self.class_teacher[class_index]
+                balance[student - self.first_user] -= price
+                balance[teacher - self.first_user] += price
+                yield (student, -price, "enrollment_payment", "Enrollment", key, ts)
+                yield (teacher, price, "enrollment_income", "Enrollment", key, ts)
+
+        deposit_weights = zipf_cum_weights(self.n_students, 0.8)
+
+        def deposits():
+            for s in rng.choices(range(self.n_students), cum_weights=deposit_weights, k=self.n_transactions):
+                amount = float(rng.choice((10, 20, 50, 100, 200)))
+                balance[self.n_teachers + s] += amount
+                yield (self.first_student + s, amount, "deposit", "Deposit", None, self._timestamp())
+
+        sql = """
+            INSERT INTO transactions (user_id, amount, type, description, idempotency_key, created_at)
+            VALUES (?, ?, ?, ?, ?, datetime(?, 'unixepoch'))
+        """
+        self._insert("transactions", sql, itertools.chain(payments(), deposits()))
+        # موجودی منفی نمی‌شود: کمبود با یک واریز اولیه در ابتدای بازه جبران می‌شود
+        self._insert("transactions", sql, (
+            (self.first_user + i, round(-value + rng.choice((0, 10, 50)), 2), "deposit", "Initial deposit", None, START_TS)
+            for i, value in enumerate(balance) if value < 0
+        ))
+        self.cursor.execute("BEGIN")
+        self.cursor.execute("""
+            UPDATE users SET wallet_balance = t.total
+            FROM (SELECT user_id, ROUND(SUM(amount), 2) AS total FROM transactions GROUP BY user_id) t
+            WHERE t.user_id = users.id AND users.id >= ?
+        """, (self.first_user,))
+        self.cursor.execute("COMMIT")
+
+    def exams(self):
+        rng = self.rng
+        self.first_exam = _next_id(self.cursor, "exams")
+        # فهرست دانش‌آموزان هر دوره (مرتب‌سازی شمارشی روی آرایه ثبت‌نام‌ها)
+        offsets = array.array("q", bytes(8 * (self.n_classes + 1)))
+        for class_index in self.enroll_class:
+            offsets[class_index + 1] += 1
+        for i in range(self.n_classes):
+            offsets[i + 1] += offsets[i]
+        by_class = array.array("q", bytes(8 * len(self.enroll_class)))
+        fill = array.array("q", offsets[:-1])
+        for student, class_index in zip(self.enroll_student, self.enroll_class):
+            by_class[fill[class_index]] = student
+            fill[class_index] += 1
+
+        # آزمون بیشتر برای دوره‌های پرجمعیت
+        weights = list(itertools.accumulate(offsets[i + 1] - offsets[i] + 1 for i in range(self.n_classes)))
+        exam_classes = rng.choices(range(self.n_classes), cum_weights=weights, k=self.n_exams)
+        per_exam = self.n_exam_results / max(1, self.n_exams)
+        exam_rows, question_rows_all, key_rows_all, result_rows = [], [], [], []
+        for e, class_index in enumerate(exam_classes):
+            exam_id = self.first_exam + e
+            questions = []
+            for q in range(rng.randint(5, 15)):
+                multiple = rng.random() < 0.2
+                questions.append({
+                    "question": f"{rng.choice(TOPICS)} question {q + 1}",
+                    "options": [f"Option {k + 1}" for k in range(4)],
+                    "correct": sorted(rng.sample(range(4), 2)) if multiple else rng.randrange(4),
+                    "points": rng.choice((1, 1, 2)),
+                    "partial_credit": multiple,
+                })
+            keys = answer_key_rows(exam_id, questions)
+            compiled = CompiledExam(exam_id, 1, [row[1:] for row in keys])
+            exam_rows.append((exam_id, self.first_class + class_index, self.class_teacher[class_index],
+                              f"Exam {e + 1}", rng.choice((20, 30, 45, 60)), self._timestamp()))
+            question_rows_all.extend(question_rows(exam_id, questions))
+            key_rows_all.extend(keys)
+            enrolled = by_class[offsets[class_index]:offsets[class_index + 1]]
+            take = min(len(enrolled), int(rng.expovariate(1.0 / per_exam)) if per_exam else 0)
+            skill = rng.random()
+            for student in rng.sample(list(enrolled), take):
+                answers = [
+                    {"question": position, "selected": question["correct"] if rng.random() < skill else rng.randrange(4)}
+                    for position, question in enumerate(questions)
+                ]
+                score, max_score, masks = grade_submission(compiled, answers)
+                result_rows.append((exam_id, student, score, json.dumps(answers), masks, max_score, self._timestamp()))
+        self._insert("exams", """
+            INSERT INTO exams (id, class_id, teacher_id, title, duration, version, created_at)
+            VALUES (?, ?, ?, ?, ?, 1, datetime(?, 'unixepoch'))
+        """, exam_rows)
+        self._insert("exam_questions", """
+            INSERT INTO exam_questions (exam_id, position, prompt, question_type, options, points)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, question_rows_all)
+        self._insert("exam_answer_keys", """
+            INSERT INTO exam_answer_keys (exam_id, position, correct_mask, points, partial_credit)
+            VALUES (?, ?, ?, ?, ?)
+        """, key_rows_all)
+        self._insert("exam_results", """
+            INSERT INTO exam_results (exam_id, student_id, score, answers, answer_masks, max_score, graded_version, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, 1, datetime(?, 'unixepoch'))
+        """, result_rows)
+
+    def rebuild_derived(self):
+        # بعد از برگرداندن triggerها و ایندکس‌ها: داده‌های مشتق یک بار از روی جداول اصلی ساخته می‌شوند
+        cursor = self.cursor
+        steps = [
+            ("search index", self._rebuild_search),
+            ("progress summary", lambda: rebuild_progress_summary(cursor)),
+            ("enrolled_count", lambda: recount_enrollments(cursor)),
+            ("class capacity", lambda: cursor.execute(
+                "UPDATE classes SET max_students = enrolled_count WHERE max_students < enrolled_count"
+            )),
+            ("exam analytics", self._rebuild_exam_stats),
+            ("ANALYZE", lambda: cursor.execute("ANALYZE")),
+        ]
+        for name, step in steps:
+            start = time.perf_counter()
+            cursor.execute("BEGIN")
+            step()
+            cursor.execute("COMMIT")
+            logger.info(f"Rebuilt {name} in {time.perf_counter() - start:.1f}s")
+
+    def _rebuild_search(self):
+        for table, statement in SEARCH_REBUILD.items():
+            self.cursor.execute(f"DELETE FROM {table}")
+            self.cursor.execute(statement)
+            self.cursor.execute(f"INSERT INTO {table}({table}) VALUES ('optimize')")
+
+    def _rebuild_exam_stats(self):
+        self.cursor.execute("SELECT id, version FROM exams WHERE id >= ?", (self.first_exam,))
+        for exam_id, version in self.cursor.fetchall():
+            keys = self.conn.execute("""
+                SELECT position, correct_mask, points, partial_credit FROM exam_answer_keys
+                WHERE exam_id = ? ORDER BY position
+            """, (exam_id,)).fetchall()
+            rebuild_exam_stats(self.cursor, CompiledExam(exam_id, version, [tuple(row) for row in keys]))
+
+    def run(self):
+        start = time.perf_counter()
+        with bulk_load(self.conn):
+            self.users()
+            self.classes()
+            self.enrollments()
+            self.lesson_progress()
+            self.transactions()
+            self.exams()
+        self.rebuild_derived()
+        logger.info(f"Generated {sum(self.counts.values()):,} rows in {time.perf_counter() - start:.1f}s")
+        return self.counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a large synthetic quran_db dataset")
+    parser.add_argument("--db", required=True, help="target SQLite file (created and migrated if missing)")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, dest=name, help=f"override {name} of the scale")
+    args = parser.parse_args(argv)
+    sizes = dict(SCALES[args.scale])
+    sizes.update({name: getattr(args, name) for name in sizes if getattr(args, name) is not None})
+
+    conn = migrate.connect(args.db)
+    try:
+        migrate.upgrade(conn)
+        if conn.execute("SELECT 1 FROM users LIMIT 1").fetchone():
+            # نام‌های کاربری تولیدی ثابت‌اند؛ فقط روی دیتابیس خالی اجرا می‌شود
+            print(f"{args.db} already has users; use a new file")
+            sys.exit(1)
+        counts = Generator(conn, seed=args.seed, **sizes).run()
+    finally:
+        conn.close()
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    main()
@@ -0,0 +1,285 @@
+# test_endpoint_bench.py - بنچمارک درون‌پروسه‌ای endpointها (ASGI بدون شبکه) روی دیتابیس مصنوعی
+# برای هر route تأخیر p50/p95/p99 و throughput اندازه گرفته و با baseline ذخیره شده مقایسه می‌شود؛
+# اگر p95 یک route بیش از BENCH_THRESHOLD (پیش‌فرض 25%) از baseline بدتر شود تست شکست می‌خورد.
+# در pytest فقط با BENCH=1 و وقتی baseline وجود دارد اجرا می‌شود (در غیر این صورت skip).
+#
+#   BENCH=1 python -m pytest test_endpoint_bench.py
+#   python test_endpoint_bench.py                    اجرا و مقایسه با bench_baseline.json (اگر وجود دارد)
+#   python test_endpoint_bench.py --save-baseline    اجرا و ذخیره نتیجه به عنوان baseline
+#   python test_endpoint_bench.py --db path          اجرا روی دیتابیس موجود (خروجی synthetic_data.py؛ داده می‌نویسد!)
+#   python test_endpoint_bench.py --routes /courses,/my-courses --requests 500 --concurrency 16
+#
+# baseline به سخت‌افزار وابسته است و باید روی همان ماشین (یا runner ثابت CI) ساخته شود.
+# کلاینت ASGI از httpx است (در requirements.txt).
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+ENABLED = os.environ.get("BENCH", "0") == "1"
+BASELINE_PATH = os.environ.get("BENCH_BASELINE", os.path.join(ROOT, "bench_baseline.json"))
+THRESHOLD = float(os.environ.get("BENCH_THRESHOLD", 0.25))
+REQUESTS = int(os.environ.get("BENCH_REQUESTS", 300))
+CONCURRENCY = int(os.environ.get("BENCH_CONCURRENCY", 8))
+WARMUP = 20
+USER_POOL = 50
+
+# دیتابیس پیش‌فرض: کوچک‌تر از scale=small تا تست در چند ثانیه ساخته شود
+DATASET = dict(users=20_000, classes=1_000, progress=100_000, transactions=20_000, exams=500, exam_results=5_000)
+
+# (نام، متد، نقش، تعداد درخواست نسبت به REQUESTS)؛ login به خاطر bcrypt کمتر تکرار می‌شود
+ROUTES = [
+    ("/api/login", "POST", None, 0.1),
+    ("/courses", "GET", None, 1),
+    ("/my-courses", "GET", "student", 1),
+    ("/progress/lesson", "POST", "student", 1),
+    ("/teacher/courses/{id}/progress", "GET", "teacher", 1),
+    ("/wallet/deposit", "POST", "student", 1),
+]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors, elapsed):
+    values = sorted(latencies)
+    ms = lambda value: round(value * 1000, 2) if value is not None else None
+    return {
+        "requests": len(values) + errors,
+        "errors": errors,
+        "p50_ms": ms(percentile(values, 0.50)),
+        "p95_ms": ms(percentile(values, 0.95)),
+        "p99_ms": ms(percentile(values, 0.99)),
+        "max_ms": ms(values[-1] if values else None),
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else None,
+    }
+
+
+class Fixture:
+    # کاربران و شناسه‌های نمونه از دیتابیس: دانش‌آموزان با ثبت‌نام و معلم‌های دارای دوره
+    def __init__(self, conn, rng):
+        import backend
+
+        self.rng = rng
+        students = conn.execute("""
+            SELECT u.id, u.username, u.role, u.approved, u.token_version
+            FROM users u
+            WHERE u.role = 'student' AND EXISTS (SELECT 1 FROM enrollments e WHERE e.student_id = u.id)
+            ORDER BY u.id LIMIT ?
+        """, (USER_POOL,)).fetchall()
+        teachers = conn.execute("""
+            SELECT u.id, u.username, u.role, u.approved, u.token_version
+            FROM users u
+            WHERE u.role = 'teacher' AND EXISTS (SELECT 1 FROM classes c WHERE c.teacher_id = u.id)
+            ORDER BY u.id LIMIT ?
+        """, (USER_POOL,)).fetchall()
+        if not students or not teachers:
+            raise RuntimeError("Benchmark database needs students with enrollments and teachers with courses")
+        # توکن مستقیماً ساخته می‌شود تا هزینه bcrypt فقط در route لاگین اندازه گرفته شود
+        self.tokens = {
+            "student": [(row["id"], backend.create_user_token(dict(row))) for row in students],
+            "teacher": [(row["id"], backend.create_user_token(dict(row))) for row in teachers],
+        }
+        self.logins = [(row["username"], "student123" if row["role"] == "student" else "teacher123")
+                       for row in list(students[:10]) + list(teachers[:10])]
+        self.lessons = {}
+        for student_id, _ in self.tokens["student"]:
+            self.lessons[student_id] = [row[0] for row in conn.execute("""
+                SELECT l.id FROM enrollments e JOIN lessons l ON l.class_id = e.class_id
+                WHERE e.student_id = ? AND e.status = 'active' AND l.is_published = TRUE
+            """, (student_id,))]
+        self.courses = {}
+        for teacher_id, _ in self.tokens["teacher"]:
+            self.courses[teacher_id] = [row[0] for row in conn.execute(
+                "SELECT id FROM classes WHERE teacher_id = ?", (teacher_id,)
+            )]
+
+    def request(self, route, role):
+        # خروجی: (path، kwargs برای httpx)
+        headers = {}
+        user_id = None
+        if role:
+            user_id, token = self.rng.choice(self.tokens[role])
+            headers["Authorization"] = f"Bearer {token}"
+        if route == "/api/login":
+            username, password = self.rng.choice(self.logins)
+            return route, {"json": {"username": username, "password": password}}
+        if route == "/progress/lesson":
+            lessons = self.lessons[user_id] or [0]
+            percentage = self.rng.randint(0, 100)
+            return route, {"headers": headers, "json": {
+                "lesson_id": self.rng.choice(lessons), "is_completed": percentage == 100,
+                "progress_percentage": percentage, "last_position": self.rng.randint(0, 3600),
+            }}
+        if route == "/teacher/courses/{id}/progress":
+            return f"/teacher/courses/{self.rng.choice(self.courses[user_id])}/progress", {"headers": headers}
+        if route == "/wallet/deposit":
+            return route, {"headers": headers, "json": {"amount": 10}}
+        return route, {"headers": headers}
+
+
+async def bench_route(client, fixture, route, method, role, count, concurrency):
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(record):
+        nonlocal errors
+        path, kwargs = fixture.request(route, role)
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.request(method, path, **kwargs)
+            elapsed = time.perf_counter() - start
+        if not record:
+            return
+        if response.status_code >= 400:
+            errors += 1
+            logging.getLogger(__name__).warning(f"{method} {path}: {response.status_code} {response.text[:200]}")
+        else:
+            latencies.append(elapsed)
+
+    await asyncio.gather(*(one(False) for _ in range(min(WARMUP, count))))
+    start = time.perf_counter()
+    await asyncio.gather(*(one(True) for _ in range(count)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def run_benchmark(routes, requests, concurrency, seed):
+    import httpx
+    import backend
+
+    fixture_conn = backend.get_db_connection()
+    try:
+        fixture = Fixture(fixture_conn, random.Random(seed))
+    finally:
+        fixture_conn.close()
+    results = {}
+    async with backend.app.router.lifespan_context(backend.app):
+        transport = httpx.ASGITransport(app=backend.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for route, method, role, weight in ROUTES:
+                if routes and route not in routes:
+                    continue
+                count = max(WARMUP, int(requests * weight))
+                results[route] = await bench_route(client, fixture, route, method, role, count, concurrency)
+    return results
+
+
+def prepare_database(db_path=None, seed=7):
+    if db_path is None:
+        import migrate
+        from synthetic_data import Generator
+
+        db_path = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+        conn = migrate.connect(db_path)
+        try:
+            migrate.upgrade(conn)
+            Generator(conn, seed=seed, **DATASET).run()
+        finally:
+            conn.close()
+    os.environ["QURAN_DB_PATH"] = db_path
+    # pool مسیر را هنگام import شدن db_pool می‌گیرد (مثلاً وقتی pytest تست‌های دیگر را collect کرده)
+    from db_pool import pool
+    if pool.db_path != db_path:
+        if pool.snapshot()["size"]:
+            raise RuntimeError(f"Connection pool is already open on {pool.db_path}")
+        pool.db_path = db_path
+    return db_path
+
+
+def compare(results, baseline, threshold=THRESHOLD, metric="p95_ms"):
+    # خروجی: لیست routeهایی که از baseline بدتر شده‌اند (یا خطا داده‌اند)
+    regressions = []
+    for route, result in results.items():
+        if result["errors"]:
+            regressions.append(f"{route}: {result['errors']} failed requests")
+        expected = baseline.get("routes", {}).get(route, {}).get(metric)
+        if expected is None or result[metric] is None:
+            continue
+        limit = expected * (1 + threshold)
+        if result[metric] > limit:
+            regressions.append(
+                f"{route}: {metric} {result[metric]} ms > {limit:.2f} ms (baseline {expected} ms + {threshold:.0%})"
+            )
+    return regressions
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_PATH, **meta):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **meta, "routes": results}, f, indent=2)
+        f.write("\n")
+
+
+def print_results(results):
+    print(f"{'route':<34} {'reqs':>6} {'err':>4} {'p50':>8} {'p95':>8} {'p99':>8} {'rps':>8}")
+    for route, r in results.items():
+        print(f"{route:<34} {r['requests']:>6} {r['errors']:>4} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8} {r['throughput_rps']:>8}")
+
+
+def test_endpoint_latency():
+    # چند ثانیه طول می‌کشد و بدون baseline چیزی برای مقایسه ندارد؛ فقط با BENCH=1 و baseline موجود اجرا می‌شود
+    import pytest
+
+    if not ENABLED:
+        pytest.skip("endpoint benchmark is opt-in: set BENCH=1")
+    baseline = load_baseline()
+    if baseline is None:
+        pytest.skip(f"no baseline at {BASELINE_PATH}; create one with python test_endpoint_bench.py --save-baseline")
+    prepare_database()
+    logging.getLogger("backend").setLevel(logging.WARNING)
+    results = asyncio.run(run_benchmark(None, REQUESTS, CONCURRENCY, seed=1))
+    regressions = compare(results, baseline)
+    assert not regressions, "\n".join(regressions)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-process endpoint benchmark")
+    parser.add_argument("--db", help="existing database (default: generate a temporary synthetic one)")
+    parser.add_argument("--routes", help="comma separated route names to run")
+    parser.add_argument("--requests", type=int, default=REQUESTS)
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--output", help="write this run's results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    prepare_database(args.db)
+    routes = set(args.routes.split(",")) if args.routes else None
+    results = asyncio.run(run_benchmark(routes, args.requests, args.concurrency, args.seed))
+    print_results(results)
+    meta = {"requests": args.requests, "concurrency": args.concurrency, "dataset": args.db or DATASET}
+    if args.output:
+        save_baseline(results, args.output, **meta)
+    if args.save_baseline:
+        save_baseline(results, args.baseline, **meta)
+        print(f"Baseline written to {args.baseline}")
+        sys.exit(0)
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        sys.exit(0)
+    regressions = compare(results, baseline, args.threshold)
+    for regression in regressions:
+        print(f"❌ {regression}")
+    print(f"{len(results)} routes compared with {args.baseline}, {len(regressions)} regressions")
+    sys.exit(1 if regressions else 0)
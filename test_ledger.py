@@ -0,0 +1,73 @@
+# test_ledger.py - موجودی در یک زمان (balance_at) با snapshot باید با جمع کامل دفتر کل برابر باشد،
+# از جمله وقتی ردیفی با تاریخ عقب‌تر بعد از snapshot ثبت شده است
+import os
+import tempfile
+
+import migrate
+from ledger import balance_at, take_snapshots
+
+# (مبلغ، created_at)؛ ردیف‌ها به همین ترتیب (id صعودی) ثبت می‌شوند
+ENTRIES = [
+    (100, "2026-01-01 10:00:00"),
+    (-20, "2026-01-02 10:00:00"),
+    (50, "2026-01-03 10:00:00"),
+]
+LATE_ENTRIES = [
+    (7, "2026-01-02 12:00:00"),     # تاریخ عقب‌تر از as_of snapshot
+    (30, "2026-01-05 10:00:00"),
+    (-5, "2026-01-01 09:00:00"),    # قبل از همه ردیف‌ها
+]
+CHECK_TIMES = [
+    "2026-01-01 09:30:00", "2026-01-01 10:00:00", "2026-01-02 11:00:00", "2026-01-02 12:00:00",
+    "2026-01-03 10:00:00", "2026-01-04 00:00:00", "2026-01-05 10:00:00", "2026-02-01 00:00:00",
+]
+
+
+def _insert(cursor, user_id, entries):
+    cursor.executemany(
+        "INSERT INTO transactions (user_id, amount, type, description, created_at) VALUES (?, ?, 'deposit', NULL, ?)",
+        [(user_id, amount, created_at) for amount, created_at in entries]
+    )
+
+
+def _ledger_total(cursor, user_id, at):
+    cursor.execute(
+        "SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE user_id = ? AND created_at <= ?",
+        (user_id, at)
+    )
+    return round(cursor.fetchone()[0], 2)
+
+
+def _check(cursor, user_id):
+    for at in CHECK_TIMES:
+        assert balance_at(cursor, user_id, at) == _ledger_total(cursor, user_id, at), at
+
+
+def test_balance_at_matches_full_ledger_with_snapshots():
+    conn = migrate.connect(os.path.join(tempfile.mkdtemp(), "ledger.sqlite3"))
+    try:
+        migrate.upgrade(conn)
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO users (username, password, role) VALUES ('s', 'x', 'student')")
+        user_id = cursor.lastrowid
+
+        _insert(cursor, user_id, ENTRIES)
+        assert take_snapshots(cursor, min_entries=1) == 1
+        _check(cursor, user_id)
+
+        # ردیف‌های بعد از snapshot، از جمله با تاریخ عقب‌تر، و snapshotهای بعدی روی آنها
+        for entry in LATE_ENTRIES:
+            _insert(cursor, user_id, [entry])
+            _check(cursor, user_id)
+            assert take_snapshots(cursor, min_entries=1) == 1
+            _check(cursor, user_id)
+
+        cursor.execute("SELECT COUNT(*) FROM wallet_snapshots WHERE user_id = ?", (user_id,))
+        assert cursor.fetchone()[0] == 1 + len(LATE_ENTRIES)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    test_balance_at_matches_full_ledger_with_snapshots()
+    print("ok")
@@ -0,0 +1,262 @@
+# test_query_plans.py - بررسی EXPLAIN QUERY PLAN همه دستورهای SQL مسیر درخواست‌ها روی یک دیتابیس بزرگ مصنوعی
+# دستورها با ast از سورس استخراج می‌شوند (f-stringها با مقادیر نمونه و KeysetPage همان تابع ساخته می‌شوند).
+# اگر برنامه اجرای دستوری جدول بزرگی را کامل پیمایش کند (SCAN بدون ایندکس مناسب) تست شکست می‌خورد.
+#
+#   python test_query_plans.py              ساخت دیتابیس موقت و بررسی
+#   python test_query_plans.py --db path    بررسی روی یک دیتابیس موجود (مثلاً خروجی synthetic_data.py)
+import ast
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+import migrate
+from pagination import KeysetPage, encode_cursor
+from synthetic_data import Generator
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# ماژول‌هایی که در مسیر درخواست‌ها SQL اجرا می‌کنند
+SOURCES = [
+    "backend", "search", "grading", "exam_store", "exam_analytics", "ledger",
+    "enrollment", "waitlist", "progress_summary", "progress_buffer",
+]
+
+LARGE_TABLE_ROWS = 1000
+
+# مقادیر نمونه برای متغیرهای محلی f-stringها
+SAMPLE_LOCALS = {
+    "lesson_ids": [1, 2, 3],
+    "update_fields": ["title = ?"],
+    "table": "exam_stats",
+}
+
+# توابعی که کارشان پیمایش کامل است (بازسازی، گزارش‌های دوره‌ای): تابع -> دلیل
+ALLOWED_SCANS = {
+    "_count_users": "user_count in /health is a full count by definition",
+    "get_users": "admin user list: first page walks the rowid b-tree in ORDER BY id order with no filter",
+    "debug_users": "debug user list: first page walks the rowid b-tree in ORDER BY id order with no filter",
+    "_load_token_versions": "scans the partial index idx_users_token_version (token_version > 0) only",
+    "recount_enrollments": "full recount after a bulk load",
+    "record_opening_balances": "seed only",
+    "rebuild_progress_summary": "full rebuild by design",
+    "rebuild_exam_stats": "rebuild after regrade reads every result of the exam",
+    "check_consistency": "ledger audit visits every wallet",
+    "take_snapshots": "periodic snapshot job groups the ledger tail of every user",
+    "promote_waiting": "background promotion looks for classes with free seats",
+}
+
+SQL_RE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+TABLE_RE = re.compile(
+    r"\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!(?:ON|WHERE|JOIN|LEFT|INNER|CROSS|GROUP|ORDER|LIMIT|USING|SET)\b)(\w+))?",
+    re.IGNORECASE
+)
+SCAN_RE = re.compile(r"^SCAN (\w+)")
+
+
+def build_database(path, seed=7):
+    # دیتابیس کوچک ولی بزرگ‌تر از LARGE_TABLE_ROWS با همان schema (migrationها) و ANALYZE
+    conn = migrate.connect(path)
+    migrate.upgrade(conn)
+    Generator(conn, seed=seed, users=10_000, classes=1_000, progress=30_000,
+              transactions=20_000, exams=2_000, exam_results=20_000).run()
+    return conn
+
+
+class _Extractor(ast.NodeVisitor):
+    def __init__(self, module_name):
+        self.module_name = module_name
+        self.functions = []
+        self.calls = []
+
+    def visit_FunctionDef(self, node):
+        self.functions.append(node)
+        self.generic_visit(node)
+        self.functions.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Call(self, node):
+        if isinstance(node.func, ast.Attribute) and node.func.attr in ("execute", "executemany") and node.args:
+            self.calls.append((self.functions[-1] if self.functions else None, node))
+        self.generic_visit(node)
+
+
+def _page_variants(module, function):
+    # مقادیر select_list/where_sql/order_by از KeysetPage استفاده شده در همان تابع (صفحه اول و صفحه با cursor)
+    if function is None:
+        return [{}]
+    for node in ast.walk(function):
+        if isinstance(node, ast.Name) and isinstance(getattr(module, node.id, None), KeysetPage):
+            page = getattr(module, node.id)
+            variants = []
+            for cursor_token in (None, encode_cursor([1] * len(page.key))):
+                select_list, where_sql, where_params, order_by, limit, requested = page.query(None, cursor_token, None)
+                variants.append({"select_list": select_list, "where_sql": where_sql, "order_by": order_by})
+            return variants
+    return [{}]
+
+
+def _render(module, function, node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node.value]
+    if isinstance(node, ast.Name) and isinstance(getattr(module, node.id, None), str):
+        return [getattr(module, node.id)]
+    if isinstance(node, ast.JoinedStr):
+        rendered = []
+        for page_values in _page_variants(module, function):
+            namespace = dict(vars(module), **SAMPLE_LOCALS, **page_values)
+            try:
+                rendered.append(eval(compile(ast.Expression(node), "<sql>", "eval"), namespace))
+            except Exception:
+                return []
+        return rendered
+    return []
+
+
+def extract_statements():
+    statements = []
+    for module_name in SOURCES:
+        module = __import__(module_name)
+        path = os.path.join(ROOT, f"{module_name}.py")
+        extractor = _Extractor(module_name)
+        with open(path, encoding="utf-8") as f:
+            extractor.visit(ast.parse(f.read()))
+        for function, call in extractor.calls:
+            for sql in _render(module, function, call.args[0]):
+                if SQL_RE.match(sql):
+                    statements.append({
+                        "where": f"{module_name}.py:{call.lineno}",
+                        "function": function.name if function else None,
+                        "sql": sql,
+                    })
+    return statements
+
+
+def explain(conn, sql):
+    try:
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, ())]
+    except sqlite3.ProgrammingError as e:
+        # تعداد پارامترها از پیام خطا خوانده می‌شود و همه با 1 مقدار می‌گیرند
+        count = int(re.search(r"uses (\d+)", str(e)).group(1))
+        return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, [1] * count)]
+
+
+def table_sizes(conn):
+    names = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND sql NOT LIKE 'CREATE VIRTUAL%'"
+    )]
+    return {name: conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0] for name in names}
+
+
+def index_columns(conn):
+    # نام ایندکس -> ستون‌های آن به ترتیب (rowid ضمنی انتهای هر ایندکس با نام id اضافه می‌شود)
+    columns = {}
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall():
+        columns[name] = [row[2] for row in conn.execute(f'PRAGMA index_info("{name}")')] + ["id"]
+    return columns
+
+
+def _clause(sql, keyword, ends):
+    # متن بعد از آخرین keyword تا اولین کلمه پایانی
+    upper = sql.upper()
+    start = upper.rfind(keyword)
+    if start < 0:
+        return ""
+    start += len(keyword)
+    stop = min([i for i in (upper.find(end, start) for end in ends) if i >= 0] or [len(sql)])
+    return sql[start:stop]
+
+
+def ordered_limit_scan(sql, detail, alias, single_table, indexes):
+    # پیمایش کامل فقط وقتی زود متوقف می‌شود که با ایندکسی به ترتیب همان ORDER BY باشد، LIMIT داشته باشد
+    # و شرط WHERE دیگری روی همین جدول نداشته باشد (وگرنه ممکن است تا انتهای جدول دنبال ردیف برود)
+    index = re.search(r"USING (?:COVERING )?INDEX (\w+)", detail)
+    if " LIMIT " not in sql.upper() or not index or index.group(1) not in indexes:
+        return False
+    order = []
+    for term in _clause(sql, " ORDER BY ", (" LIMIT ",)).split(","):
+        name = re.sub(r"\s+(ASC|DESC)$", "", term.strip(), flags=re.IGNORECASE)
+        prefix, _, column = name.rpartition(".")
+        if prefix and prefix != alias or not prefix and not single_table:
+            return False
+        order.append(column)
+    if not order or indexes[index.group(1)][:len(order)] != order:
+        return False
+    # شرط ثابت صفحه اول KeysetPage (1 = 1) فیلتر نیست
+    where = [
+        term for term in re.split(r"\s+AND\s+", _clause(sql, " WHERE ", (" GROUP BY ", " ORDER BY ", " LIMIT ")))
+        if term.strip() and term.strip() != "1 = 1"
+    ]
+    return not any(single_table or f"{alias}." in term for term in where)
+
+
+def check_plan(statement, plan, sizes, indexes):
+    # خروجی: لیست جدول‌های بزرگی که کامل پیمایش می‌شوند
+    sql = " ".join(statement["sql"].split())
+    aliases = {}
+    for table, alias in TABLE_RE.findall(sql):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    single_table = len(set(aliases.values())) == 1
+    sorted_in_memory = any("TEMP B-TREE" in d for d in plan)
+    problems = []
+    if statement["function"] in ALLOWED_SCANS:
+        return problems
+    for detail in plan:
+        if "AUTOMATIC" in detail:
+            # ایندکس موقتی که در هر اجرا دوباره ساخته می‌شود
+            problems.append(f"automatic index: {detail}")
+            continue
+        match = SCAN_RE.match(detail)
+        if not match or "VIRTUAL TABLE" in detail or detail.startswith("SCAN CONSTANT"):
+            continue
+        table = aliases.get(match.group(1), match.group(1))
+        if sizes.get(table, 0) < LARGE_TABLE_ROWS:
+            continue
+        if not sorted_in_memory and ordered_limit_scan(sql, detail, match.group(1), single_table, indexes):
+            continue
+        problems.append(f"{table}: {detail}")
+    return problems
+
+
+def run(db_path=None):
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(), "query_plans.sqlite3")
+        conn = build_database(db_path)
+    else:
+        conn = migrate.connect(db_path)
+    sizes = table_sizes(conn)
+    indexes = index_columns(conn)
+    failures = []
+    statements = extract_statements()
+    for statement in statements:
+        try:
+            plan = explain(conn, statement["sql"])
+        except sqlite3.Error as e:
+            failures.append((statement, [f"EXPLAIN failed: {e}"]))
+            continue
+        problems = check_plan(statement, plan, sizes, indexes)
+        if problems:
+            failures.append((statement, problems + ["plan: " + " | ".join(plan)]))
+    conn.close()
+    return statements, failures
+
+
+def test_query_plans():
+    statements, failures = run()
+    assert not failures, "\n".join(f"{s['where']} ({s['function']}): {p}" for s, p in failures)
+
+
+if __name__ == "__main__":
+    db_path = sys.argv[sys.argv.index("--db") + 1] if "--db" in sys.argv else None
+    statements, failures = run(db_path)
+    for statement, problems in failures:
+        print(f"❌ {statement['where']} ({statement['function']})")
+        print("   " + " ".join(statement["sql"].split())[:200])
+        for problem in problems:
+            print(f"   {problem}")
+    print(f"{len(statements)} statements checked, {len(failures)} with full scans of large tables")
+    sys.exit(1 if failures else 0)
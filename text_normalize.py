@@ -0,0 +1,61 @@
+# text_normalize.py - یکسان‌سازی متن عربی/فارسی برای جستجو و تطبیق
+# (حذف اعراب و تطویل، یکسان‌سازی ی/ک/الف، حذف نیم‌فاصله، ارقام فارسی به لاتین)
+import re
+import unicodedata
+
+# حرکات و علائم قرآنی: فتحه تا سکون، الف خنجری، علائم وقف و ...
+_DIACRITICS = (
+    [chr(c) for c in range(0x0610, 0x061B)] +
+    [chr(c) for c in range(0x064B, 0x0660)] +
+    ["ٰ"] +
+    [chr(c) for c in range(0x06D6, 0x06DD)] +
+    [chr(c) for c in range(0x06DF, 0x06E9)] +
+    [chr(c) for c in range(0x06EA, 0x06EE)]
+)
+
+# نویسه‌های کنترلی بی‌اثر در معنا: تطویل، نیم‌فاصله، اتصال‌دهنده، علائم جهت
+_REMOVE = ["ـ", "‌", "‍", "‎", "‏", "﻿"]
+
+_REPLACE = {
+    "ي": "ی",   # ي عربی -> ی فارسی
+    "ى": "ی",   # ى الف مقصوره -> ی
+    "ئ": "ی",   # ئ -> ی
+    "ك": "ک",   # ك عربی -> ک فارسی
+    "أ": "ا",   # أ -> ا
+    "إ": "ا",   # إ -> ا
+    "آ": "ا",   # آ -> ا
+    "ٱ": "ا",   # ٱ الف وصل -> ا
+    "ؤ": "و",   # ؤ -> و
+    "ة": "ه",   # ة -> ه
+    "ۀ": "ه",   # ۀ -> ه
+}
+
+_TABLE = {ord(ch): None for ch in _DIACRITICS + _REMOVE}
+_TABLE.update({ord(src): dst for src, dst in _REPLACE.items()})
+# ارقام عربی-هندی و فارسی -> 0-9
+_TABLE.update({0x0660 + i: str(i) for i in range(10)})
+_TABLE.update({0x06F0 + i: str(i) for i in range(10)})
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# بالاترین code point برای ساخت بازه پیشوندی: prefix <= x < prefix + PREFIX_UPPER
+PREFIX_UPPER = "\U0010ffff"
+
+
+def normalize_text(text):
+    if text is None:
+        return None
+    if not text.isascii():
+        text = unicodedata.normalize("NFC", text).translate(_TABLE)
+    return _WHITESPACE_RE.sub(" ", text).strip().casefold()
+
+
+def prefix_range(text):
+    # برای جستجوی پیشوندی با ایندکس: WHERE col >= ? AND col < ?
+    prefix = normalize_text(text) or ""
+    return prefix, prefix + PREFIX_UPPER
+
+
+def register_functions(conn):
+    # triggerهای ستون‌های *_norm و ایندکس FTS به این تابع SQL نیاز دارند
+    conn.create_function("normalize_text", 1, normalize_text, deterministic=True)
@@ -0,0 +1,190 @@
+# waitlist.py - صف انتظار FIFO برای دوره‌های پر و انتقال خودکار به ثبت‌نام در پس‌زمینه
+import asyncio
+import logging
+import os
+
+from db_pool import immediate_transaction
+from enrollment import enroll, EnrollmentError, ClassFull
+from ledger import LedgerError
+
+logger = logging.getLogger(__name__)
+
+PROMOTION_BATCH = int(os.environ.get("WAITLIST_PROMOTION_BATCH", 50))
+PROMOTION_INTERVAL = float(os.environ.get("WAITLIST_PROMOTION_INTERVAL", 30))
+
+PROMOTED = "promoted"
+SKIPPED = "skipped"   # نوبت رسید ولی ثبت‌نام ممکن نبود (مثلاً موجودی کافی نبود)
+
+
+class WaitlistError(Exception):
+    status_code = 400
+
+
+class NotWaiting(WaitlistError):
+    status_code = 404
+
+
+def _entry(cursor, student_id, class_id):
+    cursor.execute("""
+        SELECT id, created_at FROM class_waitlist
+        WHERE class_id = ? AND student_id = ? AND status = 'waiting'
+    """, (class_id, student_id))
+    return cursor.fetchone()
+
+
+def _position(cursor, class_id, entry_id):
+    cursor.execute("""
+        SELECT COUNT(*) FROM class_waitlist
+        WHERE class_id = ? AND status = 'waiting' AND id < ?
+    """, (class_id, entry_id))
+    return cursor.fetchone()[0] + 1
+
+
+def join(cursor, student_id, class_id):
+    # داخل immediate_transaction؛ فقط برای دوره پر، و عضویت تکراری جایگاه فعلی را برمی‌گرداند
+    cursor.execute("""
+        SELECT c.max_students, c.enrolled_count,
+               EXISTS (SELECT 1 FROM enrollments e WHERE e.class_id = c.id AND e.student_id = ?) AS enrolled,
+               EXISTS (SELECT 1 FROM class_waitlist w WHERE w.class_id = c.id AND w.status = 'waiting') AS queued
+        FROM classes c
+        WHERE c.id = ? AND c.status = 'active'
+    """, (student_id, class_id))
+    course = cursor.fetchone()
+    if not course:
+        raise NotWaiting("Class not found")
+    if course['enrolled']:
+        raise WaitlistError("Already enrolled in this class")
+    entry = _entry(cursor, student_id, class_id)
+    if entry is None:
+        has_seat = course['max_students'] is None or course['enrolled_count'] < course['max_students']
+        if has_seat and not course['queued']:
+            raise WaitlistError("Class has free seats; enroll directly")
+        cursor.execute(
+            "INSERT INTO class_waitlist (class_id, student_id) VALUES (?, ?)",
+            (class_id, student_id)
+        )
+        entry_id = cursor.lastrowid
+    else:
+        entry_id = entry['id']
+    return {"waitlist_id": entry_id, "position": _position(cursor, class_id, entry_id)}
+
+
+def position(cursor, student_id, class_id):
+    entry = _entry(cursor, student_id, class_id)
+    if entry is None:
+        raise NotWaiting("Not on the waitlist for this class")
+    return {
+        "waitlist_id": entry['id'],
+        "position": _position(cursor, class_id, entry['id']),
+        "waiting_since": entry['created_at'],
+    }
+
+
+def leave(cursor, student_id, class_id):
+    cursor.execute("""
+        UPDATE class_waitlist SET status = 'left', updated_at = CURRENT_TIMESTAMP
+        WHERE class_id = ? AND student_id = ? AND status = 'waiting'
+    """, (class_id, student_id))
+    if cursor.rowcount == 0:
+        raise NotWaiting("Not on the waitlist for this class")
+
+
+def cancel_enrollment(cursor, student_id, class_id):
+    # حذف ثبت‌نام؛ triggerها enrolled_count و خلاصه پیشرفت را به‌روز می‌کنند. پرداخت قبلی در دفتر کل می‌ماند.
+    cursor.execute(
+        "DELETE FROM enrollments WHERE student_id = ? AND class_id = ?",
+        (student_id, class_id)
+    )
+    if cursor.rowcount == 0:
+        raise NotWaiting("Not enrolled in this class")
+
+
+def _promote_class(cursor, class_id, limit):
+    cursor.execute("""
+        SELECT id, student_id FROM class_waitlist
+        WHERE class_id = ? AND status = 'waiting'
+        ORDER BY id
+        LIMIT ?
+    """, (class_id, limit))
+    promoted = 0
+    for entry_id, student_id in cursor.fetchall():
+        # هر نفر در یک savepoint: شکست یک نفر (مثلاً موجودی ناکافی) بقیه دسته را خراب نمی‌کند
+        cursor.execute("SAVEPOINT promote_entry")
+        try:
+            enroll(cursor, student_id, class_id, from_waitlist=True)
+        except ClassFull:
+            cursor.execute("ROLLBACK TO promote_entry")
+            cursor.execute("RELEASE promote_entry")
+            break
+        except (EnrollmentError, LedgerError) as e:
+            cursor.execute("ROLLBACK TO promote_entry")
+            cursor.execute("RELEASE promote_entry")
+            status, reason = SKIPPED, str(e)
+        else:
+            cursor.execute("RELEASE promote_entry")
+            status, reason = PROMOTED, None
+            promoted += 1
+        cursor.execute(
+            "UPDATE class_waitlist SET status = ?, reason = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+            (status, reason, entry_id)
+        )
+    return promoted
+
+
+def promote_waiting(conn, batch_size=PROMOTION_BATCH):
+    # دوره‌هایی که جای خالی و صف انتظار دارند؛ هر دوره در یک تراکنش و حداکثر batch_size نفر در هر دور
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT c.id, c.max_students - c.enrolled_count AS free
+        FROM classes c
+        WHERE c.status = 'active' AND c.max_students IS NOT NULL AND c.enrolled_count < c.max_students
+          AND EXISTS (SELECT 1 FROM class_waitlist w WHERE w.class_id = c.id AND w.status = 'waiting')
+    """)
+    candidates = cursor.fetchall()
+    total = 0
+    for class_id, free in candidates:
+        limit = min(free, batch_size)
+        total += immediate_transaction(conn, lambda cur: _promote_class(cur, class_id, limit))
+    return total
+
+
+class WaitlistPromoter:
+    # با notify (بعد از لغو ثبت‌نام) یا هر interval ثانیه بیدار می‌شود و دسته‌ای منتقل می‌کند
+    def __init__(self, interval=PROMOTION_INTERVAL):
+        self.interval = interval
+        self._event = None
+        self._loop = None
+        self.runs = 0
+        self.promoted = 0
+
+    def notify(self):
+        # از threadهای executor هم قابل فراخوانی است
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._event.set)
+
+    async def run(self, promote):
+        # promote: coroutine function که promote_waiting را روی یک اتصال pool اجرا می‌کند
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._event.clear()
+            try:
+                while True:
+                    promoted = await promote()
+                    self.runs += 1
+                    self.promoted += promoted
+                    if not promoted:
+                        break
+                    logger.info(f"Promoted {promoted} students from waitlists")
+            except Exception as e:
+                logger.error(f"Waitlist promotion error: {e}")
+
+    def stats(self):
+        return {"interval_seconds": self.interval, "runs": self.runs, "promoted": self.promoted}
+
+
+waitlist_promoter = WaitlistPromoter()